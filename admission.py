@@ -0,0 +1,200 @@
+"""Control de admisión y prioridades entre presupuestos y descargas.
+
+Todo el trabajo pesado pasa por acá antes de empezar:
+- Límite por usuario (token bucket por carril): evita que una sola persona
+  acapare el bot mandando pedidos en ráfaga.
+- Un cupo global de trabajos simultáneos repartido en carriles. Cuando se
+  libera un lugar lo toma primero un presupuesto (el trabajo principal del
+  bot) y las descargas, que levantan un Chrome cada una, nunca pueden ocupar
+  más de DOWNLOAD_LANE_SLOTS lugares.
+- Descarte de carga: si la cola de un carril supera su umbral el pedido se
+  rechaza enseguida con un "probá más tarde" en vez de esperar indefinidamente.
+"""
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+import metrics
+from yt_jobs import YT_MAX_WORKERS, YT_MAX_QUEUE
+
+logger = logging.getLogger(__name__)
+
+# Trabajos pesados simultáneos entre todos los carriles
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT") or 16)
+# Presupuestos esperando lugar antes de rechazar nuevos
+BUDGET_MAX_QUEUE = int(os.getenv("BUDGET_MAX_QUEUE") or 50)
+# Lugares del cupo global que pueden usar las descargas y su cola máxima
+DOWNLOAD_LANE_SLOTS = int(os.getenv("DOWNLOAD_LANE_SLOTS") or YT_MAX_WORKERS)
+DOWNLOAD_MAX_QUEUE = int(os.getenv("DOWNLOAD_MAX_QUEUE") or YT_MAX_QUEUE)
+# Pedidos por minuto permitidos a cada usuario (0 = sin límite)
+RATE_LIMIT_BUDGETS = float(os.getenv("RATE_LIMIT_BUDGETS") or 10)
+RATE_LIMIT_DOWNLOADS = float(os.getenv("RATE_LIMIT_DOWNLOADS") or 4)
+
+BUDGET = "budget"
+DOWNLOAD = "download"
+
+class AdmissionRejected(Exception):
+    """El pedido no se admite; el mensaje se le puede mostrar al usuario"""
+
+class RateLimited(AdmissionRejected):
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(
+            f"Estás enviando muchos pedidos seguidos. Probá de nuevo en {math.ceil(retry_after)} segundos."
+        )
+
+class Overloaded(AdmissionRejected):
+    def __init__(self):
+        super().__init__("El bot está con mucha carga en este momento. Probá de nuevo en unos minutos.")
+
+class _Lane:
+    def __init__(self, name, max_active, max_queue, per_minute):
+        self.name = name
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.per_minute = per_minute
+        self.active = 0
+        self.waiters = deque()
+        # user_id -> [tokens, último refill]
+        self.buckets = {}
+
+class AdmissionController:
+    def __init__(self, max_concurrent=ADMISSION_MAX_CONCURRENT, lanes=None):
+        self.max_concurrent = max_concurrent
+        # El orden define la prioridad: el primer carril se atiende antes
+        self.lanes = {}
+        for name, max_active, max_queue, per_minute in lanes or ():
+            self.lanes[name] = _Lane(name, max_active, max_queue, per_minute)
+        self.active = 0
+
+    def queued(self, lane):
+        return len(self.lanes[lane].waiters)
+
+    def _check_rate(self, lane, user_id):
+        """Token bucket por usuario: per_minute pedidos de ráfaga que se reponen de a poco"""
+        if not lane.per_minute or user_id is None:
+            return
+        ahora = time.monotonic()
+        tokens, ultimo = lane.buckets.get(user_id, (lane.per_minute, ahora))
+        tokens = min(lane.per_minute, tokens + (ahora - ultimo) * lane.per_minute / 60)
+        if tokens < 1:
+            lane.buckets[user_id] = (tokens, ahora)
+            raise RateLimited((1 - tokens) * 60 / lane.per_minute)
+        lane.buckets[user_id] = (tokens - 1, ahora)
+        if len(lane.buckets) > 10000:
+            self._sweep(lane, ahora)
+
+    def _sweep(self, lane, ahora):
+        # Los buckets que ya se llenaron de nuevo equivalen a no tener entrada
+        lleno = 60  # segundos para reponer el bucket completo
+        for user_id, (_, ultimo) in list(lane.buckets.items()):
+            if ahora - ultimo > lleno:
+                del lane.buckets[user_id]
+
+    def _has_room(self, lane):
+        return self.active < self.max_concurrent and lane.active < lane.max_active
+
+    def _higher_waiting(self, lane):
+        for other in self.lanes.values():
+            if other is lane:
+                return False
+            if other.waiters:
+                return True
+        return False
+
+    def _grant(self, lane):
+        lane.active += 1
+        self.active += 1
+
+    def _dispatch(self):
+        """Reparte los lugares libres en orden de prioridad"""
+        for lane in self.lanes.values():
+            while lane.waiters and self._has_room(lane):
+                future = lane.waiters.popleft()
+                if future.done():
+                    continue  # El que esperaba se fue (cancelado)
+                self._grant(lane)
+                future.set_result(None)
+
+    def check_rate(self, lane_name, user_id):
+        """Cuenta un pedido contra el límite del usuario sin ocupar lugar (lanza RateLimited).
+
+        Sirve para que un lote (varios links en un mensaje) cuente como un solo
+        pedido: después cada elemento pide su lugar con acquire sin user_id.
+        """
+        try:
+            self._check_rate(self.lanes[lane_name], user_id)
+        except RateLimited:
+            rejections.inc(lane=lane_name, reason="rate_limit")
+            raise
+
+    async def acquire(self, lane_name, user_id=None, on_queued=None):
+        """Espera un lugar en el carril.
+
+        Si hay que esperar y se pasa on_queued, se llama on_queued(posición)
+        (corrutina) al entrar a la cola, para avisarle al usuario.
+        """
+        lane = self.lanes[lane_name]
+        self.check_rate(lane_name, user_id)
+
+        if not lane.waiters and not self._higher_waiting(lane) and self._has_room(lane):
+            self._grant(lane)
+            return
+        if len(lane.waiters) >= lane.max_queue:
+            rejections.inc(lane=lane_name, reason="overloaded")
+            logger.warning(
+                f"Carril {lane_name} saturado, se rechaza el pedido",
+                extra={"lane": lane_name, "queued": len(lane.waiters), "active": self.active},
+            )
+            raise Overloaded()
+
+        future = asyncio.get_running_loop().create_future()
+        lane.waiters.append(future)
+        try:
+            if on_queued is not None:
+                await on_queued(len(lane.waiters))
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Se le asignó el lugar justo antes de cancelarse: devolverlo
+                self.release(lane_name)
+            elif future in lane.waiters:
+                lane.waiters.remove(future)
+            raise
+
+    def release(self, lane_name):
+        lane = self.lanes[lane_name]
+        lane.active -= 1
+        self.active -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, lane_name, user_id=None):
+        """Ocupa un lugar del carril mientras dura el bloque (lanza AdmissionRejected si no se admite)"""
+        inicio = time.perf_counter()
+        await self.acquire(lane_name, user_id)
+        metrics.stage_seconds.observe(time.perf_counter() - inicio, pipeline="admission", stage=lane_name)
+        try:
+            yield
+        finally:
+            self.release(lane_name)
+
+rejections = metrics.counter(
+    "presugen_admission_rejections_total", "Pedidos rechazados por carril y motivo", ("lane", "reason")
+)
+
+admission = AdmissionController(
+    ADMISSION_MAX_CONCURRENT,
+    lanes=[
+        (BUDGET, ADMISSION_MAX_CONCURRENT, BUDGET_MAX_QUEUE, RATE_LIMIT_BUDGETS),
+        (DOWNLOAD, DOWNLOAD_LANE_SLOTS, DOWNLOAD_MAX_QUEUE, RATE_LIMIT_DOWNLOADS),
+    ],
+)
+
+metrics.gauge("presugen_admission_active", "Trabajos admitidos en curso", lambda: admission.active)
+metrics.gauge("presugen_admission_budget_queued", "Presupuestos esperando lugar", lambda: admission.queued(BUDGET))
+metrics.gauge("presugen_admission_download_queued", "Descargas esperando lugar", lambda: admission.queued(DOWNLOAD))
@@ -0,0 +1,236 @@
+"""Re-render masivo de presupuestos desde un JSONL.
+
+Lee registros {pdf_title, content} (el esquema Budget) de un archivo o de
+stdin, los renderiza en paralelo en un pool de procesos con pdf_generator y
+escribe los PDFs en una carpeta o en un .zip a medida que van saliendo. Un
+manifiesto guarda el hash de cada registro (contenido + estilo del PDF) para
+saltear los que no cambiaron en la próxima corrida.
+
+Uso:
+    python batch_render.py presupuestos.jsonl --output pdfs/
+    cat presupuestos.jsonl | python batch_render.py - --output archivo.zip --workers 8
+"""
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from pydantic import ValidationError
+
+from budget_model import Budget
+from config import CSS_ESTILO, check_fonts
+from log_config import setup_logging
+# Los mismos helpers de worker que usa el bot: el CLI y el bot renderizan igual
+from pdf_service import PDF_WORKERS, _init_worker, _render, pdf_filename
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = ".batch-manifest.json"
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+def template_hash():
+    """Hash de todo lo que define cómo se ve el PDF: el estilo, el código que arma
+    el HTML (pdf_generator.py, leído sin importarlo) y los assets (fuentes, imágenes)"""
+    digest = hashlib.sha256(CSS_ESTILO.encode())
+    archivos = [os.path.join(ROOT, "pdf_generator.py")]
+    for carpeta, _, nombres in os.walk(os.path.join(ROOT, "assets")):
+        archivos.extend(os.path.join(carpeta, nombre) for nombre in nombres)
+    for archivo in sorted(archivos):
+        digest.update(os.path.relpath(archivo, ROOT).encode())
+        with open(archivo, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+# Cambiar el estilo o la plantilla del PDF invalida todos los hashes del manifiesto
+TEMPLATE_HASH = template_hash()
+
+def record_hash(budget):
+    data = json.dumps({"pdf_title": budget["pdf_title"], "content": budget["content"]}, sort_keys=True)
+    return hashlib.sha256((TEMPLATE_HASH + data).encode()).hexdigest()
+
+def read_records(stream):
+    """Genera (número de línea, presupuesto) salteando líneas vacías o inválidas"""
+    for numero, linea in enumerate(stream, 1):
+        linea = linea.strip()
+        if not linea:
+            continue
+        try:
+            yield numero, Budget.model_validate_json(linea).model_dump()
+        except ValidationError as e:
+            logger.warning(f"Línea {numero} inválida, se saltea: {e.errors()[0]['msg']}", extra={"line": numero})
+            yield numero, None
+
+class DirectoryOutput:
+    """PDFs sueltos en una carpeta; el manifiesto vive dentro de la carpeta"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.manifest_path = os.path.join(path, MANIFEST_NAME)
+
+    def has(self, filename):
+        return os.path.exists(os.path.join(self.path, filename))
+
+    def keep(self, filename):
+        pass  # El archivo ya está en su lugar
+
+    def write(self, filename, data):
+        destino = os.path.join(self.path, filename)
+        temporal = destino + ".tmp"
+        with open(temporal, "wb") as f:
+            f.write(data)
+        os.replace(temporal, destino)
+
+    def close(self):
+        pass
+
+class ZipOutput:
+    """PDFs dentro de un .zip. Los que no cambiaron se copian del zip anterior sin re-renderizar"""
+
+    def __init__(self, path):
+        self.path = path
+        self.manifest_path = path + ".manifest.json"
+        self._anterior = zipfile.ZipFile(path) if os.path.exists(path) else None
+        self._nombres_anteriores = set(self._anterior.namelist()) if self._anterior else set()
+        fd, self._temporal = tempfile.mkstemp(suffix=".zip", dir=os.path.dirname(os.path.abspath(path)))
+        os.close(fd)
+        # Los PDFs ya vienen comprimidos: ZIP_STORED evita recomprimirlos
+        self._zip = zipfile.ZipFile(self._temporal, "w", zipfile.ZIP_STORED)
+
+    def has(self, filename):
+        return filename in self._nombres_anteriores
+
+    def keep(self, filename):
+        with self._anterior.open(filename) as origen, self._zip.open(filename, "w") as destino:
+            shutil.copyfileobj(origen, destino)
+
+    def write(self, filename, data):
+        self._zip.writestr(filename, data)
+
+    def close(self):
+        self._zip.close()
+        if self._anterior:
+            self._anterior.close()
+        os.replace(self._temporal, self.path)
+
+def unique_filename(budget, usados):
+    """pdf_filename sin pisar otro registro con el mismo título"""
+    filename = pdf_filename(budget)
+    base, n = filename[:-4], 2
+    while filename in usados:
+        filename = f"{base} ({n}).pdf"
+        n += 1
+    usados.add(filename)
+    return filename
+
+def load_manifest(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(path, manifest):
+    temporal = path + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(temporal, path)
+
+def run(stream, output, workers=PDF_WORKERS, force=False):
+    """Renderiza todos los registros de stream y devuelve las estadísticas de la corrida"""
+    destino = ZipOutput(output) if output.lower().endswith(".zip") else DirectoryOutput(output)
+    anterior = {} if force else load_manifest(destino.manifest_path)
+    manifest = {}
+    usados = set()
+    stats = {"records": 0, "rendered": 0, "skipped": 0, "failed": 0, "invalid": 0, "bytes": 0}
+    inicio = time.perf_counter()
+
+    # Como mucho dos renders por worker en vuelo: la entrada se lee a medida que se libera lugar
+    ventana = workers * 2
+    pendientes = {}
+
+    def recolectar(bloquear):
+        listos, _ = wait(pendientes, timeout=None if bloquear else 0, return_when=FIRST_COMPLETED)
+        for future in listos:
+            filename, digest, numero = pendientes.pop(future)
+            try:
+                data, _ = future.result()
+            except Exception as e:
+                stats["failed"] += 1
+                logger.error(f"Línea {numero}: {e}", extra={"line": numero, "file": filename})
+                continue
+            destino.write(filename, data)
+            manifest[filename] = digest
+            stats["rendered"] += 1
+            stats["bytes"] += len(data)
+
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+    )
+    try:
+        for numero, budget in read_records(stream):
+            stats["records"] += 1
+            if budget is None:
+                stats["invalid"] += 1
+                continue
+            filename = unique_filename(budget, usados)
+            digest = record_hash(budget)
+            if anterior.get(filename) == digest and destino.has(filename):
+                destino.keep(filename)
+                manifest[filename] = digest
+                stats["skipped"] += 1
+                continue
+            while len(pendientes) >= ventana:
+                recolectar(bloquear=True)
+            pendientes[executor.submit(_render, budget)] = (filename, digest, numero)
+            if pendientes:
+                recolectar(bloquear=False)
+        while pendientes:
+            recolectar(bloquear=True)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        destino.close()
+        save_manifest(destino.manifest_path, manifest)
+
+    stats["seconds"] = round(time.perf_counter() - inicio, 2)
+    stats["pdfs_per_second"] = round(stats["rendered"] / stats["seconds"], 2) if stats["seconds"] else 0.0
+    stats["mb_written"] = round(stats.pop("bytes") / (1024 * 1024), 2)
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Renderiza en paralelo presupuestos {pdf_title, content} desde un JSONL")
+    parser.add_argument("input", nargs="?", default="-", help="archivo JSONL (default: stdin)")
+    parser.add_argument("--output", "-o", required=True, help="carpeta de salida o archivo .zip")
+    parser.add_argument("--workers", "-w", type=int, default=PDF_WORKERS, help="procesos de render (default: PDF_WORKERS)")
+    parser.add_argument("--force", action="store_true", help="re-renderizar todo aunque no haya cambiado")
+    args = parser.parse_args()
+
+    setup_logging()
+    check_fonts()
+    if args.input == "-":
+        stats = run(sys.stdin, args.output, args.workers, args.force)
+    else:
+        with open(args.input, encoding="utf-8") as stream:
+            stats = run(stream, args.output, args.workers, args.force)
+
+    print(
+        f"{stats['records']} registros: {stats['rendered']} renderizados, {stats['skipped']} sin cambios, "
+        f"{stats['failed']} con error, {stats['invalid']} inválidos en {stats['seconds']} s "
+        f"({stats['pdfs_per_second']} PDFs/s, {stats['mb_written']} MB)"
+    )
+    print(json.dumps(stats))
+    return 1 if stats["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
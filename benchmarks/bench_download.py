@@ -0,0 +1,150 @@
+"""Benchmark de download_with_selenium contra una copia local de y2mate.
+
+Levanta un servidor HTTP con fixtures/y2mate.html (input, toggle, Convert y
+Download) y un endpoint que sirve un archivo de N MB, y corre el flujo real
+de Selenium con Chrome headless, sin salir a internet. Además de la latencia
+total reporta la mediana de cada paso (acquire_driver, convert, download_file...).
+
+Uso: python benchmarks/bench_download.py [--users 1,2] [--requests 3] [--mb 5] [--convert-ms 500]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from common import ROOT, run_load, save_results, summarize
+
+FIXTURE = os.path.join(ROOT, "benchmarks", "fixtures", "y2mate.html")
+CHUNK = 64 * 1024
+
+class FakeY2mate(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, convert_ms=500, media_mb=5):
+        super().__init__(address, _Handler)
+        with open(FIXTURE, encoding="utf-8") as f:
+            self.page = (
+                f.read()
+                .replace("__CONVERT_MS__", str(convert_ms))
+                .replace("__MEDIA_MB__", str(media_mb))
+                .encode()
+            )
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith("/media/"):
+            self._media(url)
+        elif url.path == "/":
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(self.server.page)))
+            self.end_headers()
+            self.wfile.write(self.server.page)
+        else:
+            self.send_error(404)
+
+    def _media(self, url):
+        formato = url.path.rsplit("/", 1)[-1]
+        total = int(float(parse_qs(url.query).get("mb", ["5"])[0]) * 1024 * 1024)
+        inicio = 0
+        rango = self.headers.get("Range", "")
+        if rango.startswith("bytes="):
+            inicio = int(rango[6:].split("-")[0] or 0)
+        self.send_response(206 if inicio else 200)
+        self.send_header("Content-Type", "audio/mpeg" if formato == "mp3" else "video/mp4")
+        self.send_header("Content-Disposition", f'attachment; filename="bench.{formato}"')
+        self.send_header("Content-Length", str(total - inicio))
+        if inicio:
+            self.send_header("Content-Range", f"bytes {inicio}-{total - 1}/{total}")
+        self.end_headers()
+        bloque = b"\0" * CHUNK
+        restante = total - inicio
+        try:
+            while restante > 0:
+                self.wfile.write(bloque[:min(CHUNK, restante)])
+                restante -= CHUNK
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Chrome corta la conexión cuando se deniega la descarga
+
+def pasos(timings):
+    """Mediana (ms) de cada paso sobre todas las corridas"""
+    por_paso = {}
+    for report in timings:
+        for step in report["steps"]:
+            por_paso.setdefault(step["step"], []).append(step["seconds"] * 1000)
+    return {nombre: round(statistics.median(valores), 1) for nombre, valores in por_paso.items()}
+
+async def correr(args):
+    import youtube_handler
+
+    carpeta = tempfile.mkdtemp(prefix="bench-yt-")
+    await asyncio.to_thread(youtube_handler.start_driver_pool)
+    resultados = {}
+    try:
+        for formato in args.formats:
+            for users in args.users:
+                timings = []
+
+                async def descarga(u, n):
+                    destino = os.path.join(carpeta, f"{formato}-{users}-{u}-{n}")
+                    result = await asyncio.to_thread(
+                        youtube_handler.download_with_selenium,
+                        "https://www.youtube.com/watch?v=dQw4w9WgXcQ", formato, destino,
+                    )
+                    timings.append(result["timings"])
+                    shutil.rmtree(destino, ignore_errors=True)
+                    if not result["success"]:
+                        raise RuntimeError(result["error"])
+
+                latencias, errores, wall = await run_load(descarga, users, args.requests)
+                resumen = summarize(latencias, wall, users)
+                resumen["errors"] = len(errores)
+                resumen["steps_p50_ms"] = pasos(timings)
+                if errores:
+                    print(f"[WARN] {len(errores)} errores, el primero: {errores[0]}")
+                resultados[f"{formato}_users_{users}"] = resumen
+    finally:
+        youtube_handler.shutdown_driver_pool()
+        shutil.rmtree(carpeta, ignore_errors=True)
+    return resultados
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", default="1,2", type=lambda s: [int(x) for x in s.split(",")])
+    parser.add_argument("--requests", type=int, default=3, help="descargas por usuario")
+    parser.add_argument("--formats", default="mp3,mp4", type=lambda s: s.split(","))
+    parser.add_argument("--mb", type=float, default=5, help="tamaño del archivo servido")
+    parser.add_argument("--convert-ms", type=int, default=500, help="demora simulada de la conversión")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    server = FakeY2mate(("127.0.0.1", 0), args.convert_ms, args.mb).start()
+    # Tiene que estar definido antes de importar youtube_handler
+    os.environ["Y2MATE_URL"] = server.url
+    try:
+        resultados = asyncio.run(correr(args))
+    finally:
+        server.shutdown()
+    params = dict(vars(args), direct_download=os.getenv("YT_DIRECT_DOWNLOAD") or "1")
+    save_results("download", params, resultados, args.output)
+
+if __name__ == "__main__":
+    main()
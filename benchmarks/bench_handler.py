@@ -0,0 +1,157 @@
+"""Benchmark de handle_message completo con un bot de Telegram falso.
+
+Recorre todo el pipeline (historial, cache, OpenAI contra el stub local, pool
+de PDFs y envío) con N usuarios concurrentes. El bot falso solo cuenta los
+mensajes y documentos que se hubieran enviado.
+
+Uso: python benchmarks/bench_handler.py [--users 1,10,50] [--requests 3] [--latency 0.5]
+"""
+import argparse
+import asyncio
+import os
+from types import SimpleNamespace
+
+from common import run_load, save_results, summarize
+from stub_openai import StubOpenAI
+
+class FakeMessage:
+    def __init__(self, bot, text="", reply_to_message=None, document=None):
+        self.bot = bot
+        self.text = text
+        self.reply_to_message = reply_to_message
+        self.document = document
+        self.message_id = 1
+
+    async def reply_text(self, text, **kwargs):
+        self.bot.sent_messages += 1
+        # handle_message atrapa los errores y le avisa al usuario: se cuentan acá
+        if text.startswith(("No pude", "Hay muchos")):
+            self.bot.failures += 1
+        return FakeMessage(self.bot, text)
+
+    async def edit_text(self, text, **kwargs):
+        self.bot.edits += 1
+        return self
+
+    async def delete(self):
+        return True
+
+class FakeBot:
+    def __init__(self):
+        self.sent_messages = 0
+        self.edits = 0
+        self.documents = 0
+        self.document_bytes = 0
+        self.failures = 0
+        # Envíos que van a fallar (simula un timeout de Telegram)
+        self.fail_uploads = 0
+
+    async def send_document(self, chat_id, document, filename=None, **kwargs):
+        if self.fail_uploads:
+            self.fail_uploads -= 1
+            raise TimeoutError("envío fallido (simulado)")
+        self.documents += 1
+        if isinstance(document, bytes):
+            self.document_bytes += len(document)
+        else:
+            self.document_bytes += len(document.read())
+        doc = SimpleNamespace(file_name=filename, mime_type="application/pdf", file_id=f"doc{self.documents}")
+        return FakeMessage(self, document=doc)
+
+def make_update(bot, user_id, text, reply_to=None):
+    message = FakeMessage(bot, text, reply_to_message=reply_to)
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(id=user_id),
+        effective_chat=SimpleNamespace(id=user_id),
+        message=message,
+    )
+
+async def correr(args, server):
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    # Sin cache de respuestas ni SQLite: se mide el pipeline completo en cada pedido
+    os.environ["RESPONSE_CACHE_MAX_MB"] = "0" if not args.cache else os.getenv("RESPONSE_CACHE_MAX_MB", "")
+    os.environ["HISTORY_DB"] = ""
+    os.environ["JOBS_DB"] = ":memory:"
+    os.environ["STREAM_EDIT_INTERVAL"] = "0.2"
+    import handlers
+    import openai_client
+    import pdf_service
+
+    await pdf_service.warm_up()
+    bot = FakeBot()
+    context = SimpleNamespace(bot=bot, user_data={})
+    resultados = {}
+    offset = 0
+
+    for modo, stream in (("new_budget", False), ("new_budget_stream", True)):
+        handlers.STREAM_BUDGETS = stream
+        for users in args.users:
+            async def pedido(u, n):
+                update = make_update(bot, offset + u, f"Presupuesto {n} para Juan {u}: pintar 3 ambientes, $500.000")
+                await handlers.handle_message(update, context)
+            latencias, errores, wall = await run_load(pedido, users, args.requests)
+            resultados[f"{modo}_users_{users}"] = dict(summarize(latencias, wall, users), errors=len(errores))
+            offset += users
+
+    # Modificación local: responder al PDF con una edición simple (sin OpenAI)
+    pdf = FakeMessage(bot, document=SimpleNamespace(file_name="Av. Siempreviva 742.pdf", mime_type="application/pdf"))
+    for users in args.users:
+        # Cada usuario arranca con un presupuesto generado (fuera de la medición)
+        await asyncio.gather(*(
+            handlers.handle_message(make_update(bot, offset + u, "Presupuesto para Juan: pintar 3 ambientes"), context)
+            for u in range(users)
+        ))
+
+        async def edicion(u, n):
+            await handlers.handle_message(make_update(bot, offset + u, f"cambiá el total a ${n + 1}.000.000", reply_to=pdf), context)
+        latencias, errores, wall = await run_load(edicion, users, args.requests)
+        resultados[f"local_edit_users_{users}"] = dict(summarize(latencias, wall, users), errors=len(errores))
+        offset += users
+
+    if args.cache:
+        resultados["resend_after_error"] = await reenvio_tras_error(handlers, bot, context, server, offset)
+
+    resultados["bot"] = vars(bot)
+    resultados["openai_requests"] = server.requests_served
+    pdf_service.shutdown()
+    handlers.historias.close()
+    await openai_client.client.close()
+    return resultados
+
+async def reenvio_tras_error(handlers, bot, context, server, user_id):
+    """El envío del PDF falla y el usuario reenvía el mismo mensaje: tiene que salir de la cache"""
+    texto = "Presupuesto para Ana: cambiar 2 canillas y el flotante del tanque, $80.000"
+    bot.fail_uploads = 1
+    await handlers.handle_message(make_update(bot, user_id, texto), context)
+    antes = server.requests_served
+    documentos = bot.documents
+    await handlers.handle_message(make_update(bot, user_id, texto), context)
+    resultado = {
+        "openai_requests_on_resend": server.requests_served - antes,
+        "pdf_sent": bot.documents == documentos + 1,
+    }
+    resultado["cache_hit"] = resultado["openai_requests_on_resend"] == 0 and resultado["pdf_sent"]
+    if not resultado["cache_hit"]:
+        print(f"ERROR: el reenvío tras un error no salió de la cache: {resultado}")
+    return resultado
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", default="1,10,50", type=lambda s: [int(x) for x in s.split(",")])
+    parser.add_argument("--requests", type=int, default=3, help="mensajes por usuario")
+    parser.add_argument("--latency", type=float, default=0.5, help="segundos que tarda el stub en responder")
+    parser.add_argument("--size", choices=["small", "medium", "huge"], default="medium")
+    parser.add_argument("--cache", action="store_true", help="dejar activa la cache de respuestas")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    server = StubOpenAI(("127.0.0.1", 0), args.latency, args.size).start()
+    try:
+        resultados = asyncio.run(correr(args, server))
+    finally:
+        server.shutdown()
+    save_results("handler", vars(args), resultados, args.output)
+
+if __name__ == "__main__":
+    main()
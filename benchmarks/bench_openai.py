@@ -0,0 +1,60 @@
+"""Benchmark de generate_markdown / generate_markdown_stream contra el stub local de OpenAI.
+
+Mide el overhead del cliente (compactación, semáforo, parseo) y cómo escala con
+N usuarios concurrentes, sin red ni API key real.
+
+Uso: python benchmarks/bench_openai.py [--users 1,10,50] [--requests 5] [--latency 0.5]
+"""
+import argparse
+import asyncio
+import os
+
+from common import save_results, summarize, run_load
+from stub_openai import StubOpenAI
+
+def historial(user, n):
+    return [{"role": "user", "content": f"Presupuesto {n} para el cliente {user}: pintar 3 ambientes, $500.000"}]
+
+async def medir(fn, users, requests_per_user):
+    import openai_client
+
+    async def pedido(u, n):
+        prompt, _, _ = openai_client.build_prompt(historial(u, n))
+        await fn(prompt)
+    latencias, errores, wall = await run_load(pedido, users, requests_per_user)
+    resumen = summarize(latencias, wall, users)
+    resumen["errors"] = len(errores)
+    if errores:
+        print(f"[WARN] {len(errores)} errores, el primero: {errores[0]}")
+    return resumen
+
+async def correr(args, server):
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    import openai_client
+
+    resultados = {}
+    for users in args.users:
+        resultados[f"parse_users_{users}"] = await medir(openai_client.generate_markdown, users, args.requests)
+        resultados[f"stream_users_{users}"] = await medir(openai_client.generate_markdown_stream, users, args.requests)
+    await openai_client.client.close()
+    return resultados
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", default="1,10,50", type=lambda s: [int(x) for x in s.split(",")])
+    parser.add_argument("--requests", type=int, default=5, help="requests por usuario")
+    parser.add_argument("--latency", type=float, default=0.5, help="segundos que tarda el stub en responder")
+    parser.add_argument("--size", choices=["small", "medium", "huge"], default="medium")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    server = StubOpenAI(("127.0.0.1", 0), args.latency, args.size).start()
+    try:
+        resultados = asyncio.run(correr(args, server))
+    finally:
+        server.shutdown()
+    save_results("openai", vars(args), resultados, args.output)
+
+if __name__ == "__main__":
+    main()
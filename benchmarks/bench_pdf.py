@@ -0,0 +1,65 @@
+"""Benchmark de render de PDF: CSS remoto re-parseado en cada render vs stylesheet pre-parseado.
+
+Uso: python benchmarks/bench_pdf.py [--renders 20]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import weasyprint
+from markdown import markdown
+from config import CSS_ESTILO
+import pdf_generator
+
+# Así se renderizaba antes: <style> inline con @import a Google Fonts en cada HTML
+CSS_LEGACY = (
+    "<style>\n"
+    "@import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;700&display=swap');\n"
+    + CSS_ESTILO[CSS_ESTILO.index("@page"):]
+    + "</style>"
+)
+
+BUDGET = {
+    "pdf_title": "Av. Siempreviva 742",
+    "content": (
+        "**Fecha:** 01/03/2025\n\n**Propietaria:** Marge Simpson\n\n"
+        "**Dirección:** Av. Siempreviva 742\n\n---\n\n"
+        "### **Trabajos a Realizar:**\n\n"
+        + "".join(f"{i}. Pintura de ambiente {i}\n" for i in range(1, 16))
+        + "\n---\n\n### **Costo Total del Proyecto:** $1500000\n\n---\n\n"
+        "### **Materiales Aproximados:**\n\n"
+        + "".join(f"- Material {i}\n" for i in range(1, 16))
+    ),
+}
+
+def render_legacy(json_data):
+    html = CSS_LEGACY + "<h1>Presupuesto</h1>" + markdown(json_data["content"])
+    return weasyprint.HTML(string=html).write_pdf()
+
+def medir(fn, renders):
+    fn(BUDGET)  # primer render fuera de la medición
+    tiempos = []
+    for _ in range(renders):
+        inicio = time.perf_counter()
+        fn(BUDGET)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos), max(tiempos)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--renders", type=int, default=20)
+    args = parser.parse_args()
+
+    legacy_p50, legacy_max = medir(render_legacy, args.renders)
+    local_p50, local_max = medir(pdf_generator.render_pdf, args.renders)
+
+    print(f"CSS remoto (por render):   p50={legacy_p50:.1f} ms  max={legacy_max:.1f} ms")
+    print(f"CSS pre-parseado + local: p50={local_p50:.1f} ms  max={local_max:.1f} ms")
+    print(f"Ahorro por render:        {legacy_p50 - local_p50:.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Benchmark de generación de PDFs con presupuestos chicos, medianos y enormes.
+
+Mide el render en el proceso (render_pdf y generate_pdf a disco) y el pool de
+pdf_service con N usuarios concurrentes.
+
+Uso: python benchmarks/bench_pdf_sizes.py [--renders 20] [--users 1,4,16]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+
+from common import BUDGET_SIZES, measure_sync, run_load, save_results, sized_budget, summarize
+
+import pdf_generator
+import pdf_service
+
+def medir_en_proceso(args):
+    resultados = {}
+    with tempfile.TemporaryDirectory() as carpeta:
+        for size in BUDGET_SIZES:
+            budget = sized_budget(size)
+            resultados[f"render_pdf_{size}"] = summarize(
+                measure_sync(lambda: pdf_generator.render_pdf(budget), args.renders)
+            )
+            resultados[f"render_pdf_{size}"]["pdf_kb"] = round(len(pdf_generator.render_pdf(budget)) / 1024, 1)
+            resultados[f"generate_pdf_{size}"] = summarize(
+                measure_sync(lambda: os.remove(pdf_generator.generate_pdf(budget, carpeta)), args.renders)
+            )
+    return resultados
+
+async def medir_pool(args):
+    resultados = {}
+    await pdf_service.warm_up()
+    for size in BUDGET_SIZES:
+        budget = sized_budget(size)
+        for users in args.users:
+            latencias, errores, wall = await run_load(
+                lambda u, n: pdf_service.render(budget), users, args.requests
+            )
+            resumen = summarize(latencias, wall, users)
+            resumen["errors"] = len(errores)
+            resultados[f"pool_{size}_users_{users}"] = resumen
+    pdf_service.shutdown()
+    return resultados
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--renders", type=int, default=20, help="renders por tamaño en el proceso")
+    parser.add_argument("--users", default="1,4,16", type=lambda s: [int(x) for x in s.split(",")])
+    parser.add_argument("--requests", type=int, default=3, help="renders por usuario en el pool")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    resultados = medir_en_proceso(args)
+    resultados.update(asyncio.run(medir_pool(args)))
+    params = dict(vars(args), workers=pdf_service.PDF_WORKERS, queue_size=pdf_service.PDF_QUEUE_SIZE)
+    save_results("pdf_sizes", params, resultados, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Benchmark de arranque: tiempo de import y RSS hasta "listo para hacer polling".
+
+Cada corrida es un proceso nuevo que importa main, arma la aplicación con
+build_app() y reporta cuánto tardó, cuánta memoria usa y qué módulos pesados
+quedaron cargados. Con --eager además importa handlers y youtube_handler,
+como hacía main.py antes de la carga diferida, para comparar.
+
+Uso: python benchmarks/bench_startup.py [--runs 5] [--eager]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from common import ROOT, save_results
+
+HEAVY_MODULES = ("weasyprint", "openai", "pydantic", "selenium", "seleniumwire", "webdriver_manager", "markdown")
+
+# Se ejecuta en el proceso hijo
+CHILD = r"""
+import json, resource, sys, time
+inicio = time.perf_counter()
+import main
+importado = time.perf_counter()
+if EAGER:
+    import handlers, youtube_handler
+app = main.build_app()
+listo = time.perf_counter()
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for linea in f:
+            if linea.startswith("VmRSS:"):
+                return int(linea.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+print(json.dumps({
+    "import_main_ms": (importado - inicio) * 1000,
+    "ready_ms": (listo - inicio) * 1000,
+    "rss_mb": rss_mb(),
+    "heavy_loaded": sorted(m for m in HEAVY if m in sys.modules),
+}))
+"""
+
+def correr(eager):
+    env = dict(os.environ, TELEGRAM_TOKEN=os.getenv("TELEGRAM_TOKEN") or "123456:bench")
+    codigo = f"EAGER = {eager!r}\nHEAVY = {HEAVY_MODULES!r}\n" + CHILD
+    salida = subprocess.run(
+        [sys.executable, "-c", codigo], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+def resumir(corridas):
+    return {
+        "runs": len(corridas),
+        "import_main_ms_p50": round(statistics.median(c["import_main_ms"] for c in corridas), 1),
+        "ready_ms_p50": round(statistics.median(c["ready_ms"] for c in corridas), 1),
+        "ready_ms_max": round(max(c["ready_ms"] for c in corridas), 1),
+        "rss_mb_p50": round(statistics.median(c["rss_mb"] for c in corridas), 1),
+        "heavy_loaded": corridas[-1]["heavy_loaded"],
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--eager", action="store_true", help="comparar con la importación anticipada")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    correr(False)  # Primera corrida fuera de la medición: compila .pyc y calienta la cache del disco
+    resultados = {"lazy": resumir([correr(False) for _ in range(args.runs)])}
+    if args.eager:
+        resultados["eager"] = resumir([correr(True) for _ in range(args.runs)])
+    save_results("startup", vars(args), resultados, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Casos de regresión del editor local de presupuestos (sin OpenAI).
+
+Cada caso aplica una respuesta al PDF con apply_edits y compara el resultado:
+o el presupuesto editado localmente, o None cuando la instrucción tiene que
+seguir por el LLM. No necesita red ni el stub de OpenAI.
+
+Uso: python benchmarks/check_edits.py
+"""
+import sys
+
+import common  # noqa: F401 (agrega la raíz del repo al path)
+from budget_editor import apply_edits
+from budget_model import StructuredBudget
+
+PRESUPUESTO = {
+    "pdf_title": "Av. Siempreviva 742",
+    "content": (
+        "**Fecha:** 01/03/2025\n\n**Propietaria:** Marge Simpson\n\n"
+        "**Dirección:** Av. Siempreviva 742\n\n**Contacto:** 555-1234\n\n---\n\n"
+        "### **Trabajos a Realizar:**\n\n"
+        "1. Pintura del living - $200.000\n"
+        "2. Cambio de membrana - $300.000\n\n"
+        "---\n\n### **Costo Total del Proyecto:** $500.000\n\n---\n\n"
+        "### **Materiales Aproximados:**\n\n"
+        "- Látex: 20 litros\n"
+        "- Membrana: 2 rollos\n"
+    ),
+}
+
+def _trabajo(n, texto, monto):
+    return lambda b: (b.items[n - 1].text, b.items[n - 1].amount) == (texto, monto)
+
+# (mensaje, chequeo sobre el StructuredBudget editado; None = tiene que ir al LLM)
+CASOS = [
+    ("cambiá el trabajo 2 a Arreglo de canaletas",
+     lambda b: _trabajo(2, "Arreglo de canaletas", 300000)(b) and b.total == 500000),
+    ("cambiá el trabajo 2 a Arreglo de canaletas $350.000",
+     lambda b: _trabajo(2, "Arreglo de canaletas", 350000)(b) and b.total == 550000),
+    ("cambiá el costo del trabajo 1 a $250.000",
+     lambda b: _trabajo(1, "Pintura del living", 250000)(b) and b.total == 550000),
+    ("agregá el material cemento en la lista",
+     lambda b: [m.text for m in b.materials] == ["Látex: 20 litros", "Membrana: 2 rollos", "Cemento"]),
+    ("agregá arena a los materiales",
+     lambda b: b.materials[-1].text == "Arena" and len(b.items) == 2),
+    ("agregá el trabajo limpieza final",
+     lambda b: b.items[-1].text == "Limpieza final" and b.total == 500000),
+    ("sacá el trabajo 1",
+     lambda b: [i.text for i in b.items] == ["Cambio de membrana"] and b.total == 300000),
+    ("el contacto es 555-9876",
+     lambda b: b.field("contacto").value == "555-9876"),
+    ("el contacto es el mismo", None),
+    ("cambiá la dirección a la misma", None),
+    ("la dirección es incorrecta, es Calle 5", None),
+    ("sacá el 3", None),
+    ("cambiá la fecha a mañana y el total a 5000", None),
+]
+
+def main():
+    fallidos = 0
+    for mensaje, chequeo in CASOS:
+        editado = apply_edits(PRESUPUESTO, mensaje)
+        if chequeo is None:
+            ok = editado is None
+        else:
+            ok = editado is not None and chequeo(StructuredBudget.from_budget(editado))
+        if not ok:
+            fallidos += 1
+            print(f"ERROR: {mensaje!r} -> {editado['content'] if editado else None}")
+    print(f"{len(CASOS) - fallidos}/{len(CASOS)} casos OK")
+    return 1 if fallidos else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""Utilidades compartidas por los benchmarks: presupuestos de ejemplo, carga
+concurrente, percentiles, RSS pico y guardado de resultados en JSON."""
+import asyncio
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Cantidad de trabajos y materiales de cada tamaño de presupuesto
+BUDGET_SIZES = {
+    "small": (3, 3),
+    "medium": (15, 15),
+    "huge": (150, 120),
+}
+
+def make_budget(trabajos, materiales, title="Av. Siempreviva 742"):
+    """Presupuesto con el mismo formato que genera el modelo"""
+    content = (
+        "**Fecha:** 01/03/2025\n\n**Propietaria:** Marge Simpson\n\n"
+        f"**Dirección:** {title}\n\n**Contacto:** 555-1234\n\n---\n\n"
+        "### **Presupuesto por Mano de Obra**\n\n"
+        "### **Trabajos a Realizar:**\n\n"
+        + "".join(f"{i}. Pintura de ambiente {i} con dos manos de látex\n" for i in range(1, trabajos + 1))
+        + "\n---\n\n### **Costo Total del Proyecto:** $1.500.000\n\n---\n\n"
+        "### **Materiales Aproximados:**\n\n"
+        + "".join(f"- Material {i}: 4 litros\n" for i in range(1, materiales + 1))
+    )
+    return {"pdf_title": title, "content": content}
+
+def sized_budget(size):
+    return make_budget(*BUDGET_SIZES[size])
+
+def summarize(latencias_ms, wall_s=None, concurrency=1):
+    """p50/p95/media en ms y, si se pasa el tiempo total, throughput en requests/s"""
+    ordenadas = sorted(latencias_ms)
+    resumen = {
+        "count": len(ordenadas),
+        "concurrency": concurrency,
+        "p50_ms": round(statistics.median(ordenadas), 2) if ordenadas else None,
+        "p95_ms": round(ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.95))], 2) if ordenadas else None,
+        "mean_ms": round(statistics.fmean(ordenadas), 2) if ordenadas else None,
+        "max_ms": round(ordenadas[-1], 2) if ordenadas else None,
+    }
+    if wall_s:
+        resumen["wall_s"] = round(wall_s, 3)
+        resumen["throughput_rps"] = round(len(ordenadas) / wall_s, 2)
+    return resumen
+
+def measure_sync(fn, repeticiones, warmup=1):
+    """Latencias (ms) de llamar fn() repetidas veces, después del calentamiento"""
+    for _ in range(warmup):
+        fn()
+    latencias = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        fn()
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    return latencias
+
+async def run_load(call, users, requests_per_user):
+    """N usuarios concurrentes, cada uno con sus requests en secuencia.
+
+    call(user, n) es una corrutina. Devuelve (latencias_ms, errores, wall_s).
+    """
+    latencias = []
+    errores = []
+
+    async def usuario(user):
+        for n in range(requests_per_user):
+            inicio = time.perf_counter()
+            try:
+                await call(user, n)
+            except Exception as e:
+                errores.append(repr(e))
+                continue
+            latencias.append((time.perf_counter() - inicio) * 1000)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(usuario(u) for u in range(users)))
+    return latencias, errores, time.perf_counter() - inicio
+
+def peak_rss_mb():
+    """RSS pico del proceso y de sus hijos (workers de PDF, Chrome) en MB"""
+    # En Linux ru_maxrss está en KB, en macOS en bytes
+    escala = 1024 * 1024 if sys.platform == "darwin" else 1024
+    propio = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / escala
+    hijos = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / escala
+    return {"self": round(propio, 1), "children": round(hijos, 1)}
+
+def save_results(name, params, results, output=None):
+    """Guarda los resultados en benchmarks/results/<name>-<fecha>.json (o en output)"""
+    data = {
+        "benchmark": name,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "params": params,
+        "results": results,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{name}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    print(f"RSS pico: {data['peak_rss_mb']}  ->  {output}")
+    return output
@@ -0,0 +1,112 @@
+"""Servidor local compatible con /v1/chat/completions para benchmarks sin red.
+
+Responde siempre un presupuesto de ejemplo (con o sin streaming) después de
+una latencia configurable que simula el tiempo del modelo.
+
+Uso suelto: python benchmarks/stub_openai.py [--port 8765] [--latency 0.5]
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from common import sized_budget
+
+class StubOpenAI(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.5, size="medium", chunks=40):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.chunks = chunks
+        self.body = json.dumps(sized_budget(size), ensure_ascii=False)
+        self.requests_served = 0
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        largo = int(self.headers.get("Content-Length") or 0)
+        pedido = json.loads(self.rfile.read(largo) or b"{}")
+        self.server.requests_served += 1
+        if pedido.get("stream"):
+            self._stream(pedido)
+        else:
+            self._completa(pedido)
+
+    def _base(self, pedido, objeto):
+        return {
+            "id": f"chatcmpl-bench{self.server.requests_served}",
+            "object": objeto,
+            "created": int(time.time()),
+            "model": pedido.get("model", "gpt-4o-mini"),
+        }
+
+    def _completa(self, pedido):
+        time.sleep(self.server.latency)
+        respuesta = self._base(pedido, "chat.completion")
+        respuesta["choices"] = [{
+            "index": 0,
+            "message": {"role": "assistant", "content": self.server.body, "refusal": None},
+            "finish_reason": "stop",
+            "logprobs": None,
+        }]
+        respuesta["usage"] = {"prompt_tokens": 500, "completion_tokens": 400, "total_tokens": 900}
+        data = json.dumps(respuesta).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, pedido):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        def evento(delta, finish_reason=None):
+            chunk = self._base(pedido, "chat.completion.chunk")
+            chunk["choices"] = [{"index": 0, "delta": delta, "finish_reason": finish_reason, "logprobs": None}]
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+
+        # La latencia total se reparte entre los chunks, como un modelo que genera de a poco
+        body = self.server.body
+        paso = max(1, len(body) // self.server.chunks)
+        pausa = self.server.latency / max(1, len(body) // paso)
+        evento({"role": "assistant", "content": ""})
+        for i in range(0, len(body), paso):
+            time.sleep(pausa)
+            evento({"content": body[i:i + paso]})
+        evento({}, "stop")
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--size", choices=["small", "medium", "huge"], default="medium")
+    args = parser.parse_args()
+    server = StubOpenAI(("127.0.0.1", args.port), args.latency, args.size)
+    print(f"Stub de OpenAI en {server.base_url}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
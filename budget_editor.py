@@ -0,0 +1,242 @@
+"""Motor de edición local de presupuestos.
+
+Las respuestas a un PDF suelen ser ediciones chicas ("cambiá el costo total a
+$500000", "sacá el material 3"). Estas se aplican directamente sobre el
+StructuredBudget y se re-renderizan al instante; si alguna instrucción no se
+entiende, apply_edits devuelve None y el pedido sigue por OpenAI.
+"""
+import re
+from budget_model import StructuredBudget, BudgetField, BudgetItem, normalize, parse_amount
+
+# Verbos (voseo, imperativo o infinitivo; \w* cubre "cambiá", "poné", "sacar", ...)
+_SET = r'(?:cambi|pon|modific|actualiz|correg|dej|set)\w*'
+_REMOVE = r'(?:sac|elimin|quit|borr)\w*'
+_ADD = r'(?:agreg|añad|anad|inclu)\w*'
+_MOVE = r'(?:mov|pas|llev)\w*'
+_SWAP = r'(?:intercambi|invert)\w*'
+_ART = r'(?:(?:el|la|los|las|un|una|otro|otra)\s+)?'
+_KINDS = r'(?:materiales|material|trabajos|trabajo|[ií]tems|[ií]tem|tareas|tarea)'
+_KIND = r'(?P<tipo>' + _KINDS + r')'
+_NUM = r'(?:n(?:[°º]|ro\.?|[uú]mero)\s*)?#?(?P<n>\d+)'
+_MONTO = r'\$?\s*(?P<monto>\d[\d.,]*)'
+# Palabras que nombran otro campo, el total o una lista
+_CAMPOS = (r'(?:total|costo|monto|precio|valor|fecha|propietari[oa]|cliente|direcci[oó]n|domicilio|contacto|'
+           r'tel[eé]fono|t[ií]tulo|materiales|material|trabajos|trabajo|[ií]tems|[ií]tem|tareas|tarea)')
+# Juicios o referencias al valor actual ("es incorrecta", "es el mismo"): no son el valor nuevo
+_JUICIO = r'(?:incorrect|equivocad|err[oó]ne|mal\b|otr[oa]\b|distint|viej|nuev|cualquier|mism|igual\b|anterior\b|de\s+antes\b)'
+
+def _re(patron):
+    return re.compile(r'^' + patron + r'$', re.IGNORECASE)
+
+REMOVE_INDEX_RE = _re(_REMOVE + r'\s+' + _ART + _KIND + r'\s*' + _NUM)
+REMOVE_TEXT_RE = _re(_REMOVE + r'\s+' + _ART + r'(?:' + _KIND + r'\s*:?\s+)?(?P<texto>.+)')
+ADD_RE = _re(_ADD + r'\s+' + _ART + _KIND + r'\s*:?\s+(?P<texto>.+)')
+# "agregá arena a los materiales", "agregá el material arena en la lista"
+ADD_TO_RE = _re(_ADD + r'\s+' + _ART + r'(?:(?P<tipo>' + _KINDS + r')\s*:?\s+)?(?P<texto>.+?)\s+(?:a|en)\s+' + _ART +
+                r'(?:lista(?:\s+de\s+' + _ART + r'(?P<lista>' + _KINDS + r'))?|(?P<destino>' + _KINDS + r'))')
+SET_TOTAL_RE = _re(_SET + r'\s+' + _ART + r'(?:(?:costo|monto|precio|valor|presupuesto)\s+)?total(?:\s+del\s+\w+)?\s*(?:a|en|por|:)\s*' + _MONTO)
+TOTAL_IS_RE = _re(_ART + r'(?:(?:costo|monto|precio|valor)\s+)?total\s+(?:es|son|queda\s+en|:)\s*' + _MONTO)
+SET_ITEM_AMOUNT_RE = _re(_SET + r'\s+' + _ART + r'(?:costo|monto|precio|valor)\s+(?:del|de\s+la|de)\s+' + _KIND + r'\s*' + _NUM + r'\s+(?:a|en|por|:)\s*' + _MONTO)
+SET_ITEM_TEXT_RE = _re(_SET + r'\s+' + _ART + _KIND + r'\s*' + _NUM + r'\s*(?:a|por|:)\s*(?P<texto>.+)')
+SET_FIELD_RE = _re(_SET + r'\s+' + _ART + r'(?P<campo>[^\d$:]+?)\s*(?:\s+a|\s+por|:)\s*(?P<valor>.+)')
+# Solo valores cortos y sin comas: "la dirección es incorrecta, es Calle 5" queda para el LLM
+FIELD_IS_RE = _re(_ART + r'(?P<campo>[^\d$:,]{1,30}?)\s+es\s+(?!' + _ART + _JUICIO + r')(?P<valor>[^,;]{1,60})')
+# Valor que se refiere al actual ("el mismo", "la de antes") en lugar de darlo
+REFERENCE_VALUE_RE = re.compile(r'^' + _ART + _JUICIO, re.IGNORECASE)
+MOVE_RE = _re(_MOVE + r'\s+' + _ART + _KIND + r'\s*' + _NUM + r'\s+(?:al?|hasta)\s+(?:la\s+)?(?:(?:posici[oó]n|lugar|puesto)\s+)?(?P<m>\d+|principio|inicio|final|fin|primero|primer\s+lugar|[uú]ltimo)')
+SWAP_RE = _re(_SWAP + r'\s+' + _ART + _KIND + r'\s*#?(?P<n>\d+)\s+(?:y|con)\s+' + _ART + r'(?:\w+\s+)?#?(?P<m>\d+)')
+# Instrucciones encadenadas con "y" ("agregá X y sacá Y"): mejor que las resuelva el LLM
+COMPOUND_RE = re.compile(r'\s(?:y|e)\s+(?:' + '|'.join((_SET, _REMOVE, _ADD, _MOVE, _SWAP)) + r')\b', re.IGNORECASE)
+# Un valor que sigue con otro campo ("mañana y el total a 5000") son dos instrucciones
+COMPOUND_VALUE_RE = re.compile(r'(?:\s(?:y|e)|,)\s+' + _ART + _CAMPOS + r'\b', re.IGNORECASE)
+RECALC_RE = _re(r'(?:recalcul|calcul|sum|actualiz)\w*\s+' + _ART + r'(?:(?:costo|monto)\s+)?total(?:es)?')
+
+# Largo mínimo del texto para buscar un ítem a sacar ("sacá el 3" es ambiguo)
+MIN_SEARCH_CHARS = 3
+
+# Etiquetas que se pueden agregar aunque el presupuesto no las tenga
+KNOWN_FIELDS = {
+    "fecha": "Fecha",
+    "propietario": "Propietario",
+    "propietaria": "Propietaria",
+    "cliente": "Cliente",
+    "direccion": "Dirección",
+    "domicilio": "Dirección",
+    "contacto": "Contacto",
+    "telefono": "Contacto",
+}
+
+class EditNotUnderstood(Exception):
+    """La instrucción no coincide con ninguna edición conocida"""
+
+def _lista(budget, tipo):
+    return budget.materials if normalize(tipo).startswith("material") else budget.items
+
+def _indice(lista, n):
+    indice = int(n) - 1
+    if not 0 <= indice < len(lista):
+        raise EditNotUnderstood(f"No existe el ítem {n}")
+    return indice
+
+def _valor(texto):
+    """El valor de una edición, salvo que arrastre otra instrucción"""
+    if COMPOUND_VALUE_RE.search(texto):
+        raise EditNotUnderstood(texto)
+    return texto.strip()
+
+def _texto_buscado(texto):
+    """Texto para buscar un ítem: con letras y de un largo mínimo (un número suelto es ambiguo)"""
+    buscado = normalize(texto)
+    if len(buscado) < MIN_SEARCH_CHARS or not re.search(r'[a-z]', buscado):
+        raise EditNotUnderstood(texto)
+    return buscado
+
+def _buscar(lista, buscado):
+    """Índice del único ítem que contiene el texto como palabras completas (o None)"""
+    patron = re.compile(r'(?<!\w)' + re.escape(buscado) + r'(?!\w)')
+    encontrados = [i for i, item in enumerate(lista) if patron.search(normalize(item.text))]
+    return encontrados[0] if len(encontrados) == 1 else None
+
+def _item(texto):
+    texto = texto.strip()
+    texto = texto[:1].upper() + texto[1:]
+    match = re.search(r'\s*(?:[-–:]\s*)?\$\s*(\d[\d.,]*)\s*$', texto)
+    if match:
+        return BudgetItem(text=texto[:match.start()].strip(), amount=parse_amount(match.group(1)))
+    return BudgetItem(text=texto)
+
+def _set_field(budget, campo, valor):
+    if REFERENCE_VALUE_RE.match(valor):
+        raise EditNotUnderstood(valor)
+    clave = normalize(campo)
+    if clave in ("titulo", "titulo del pdf", "nombre del pdf"):
+        budget.pdf_title = valor
+        return
+    if clave.endswith("total") or clave.startswith(("costo", "monto", "precio")):
+        raise EditNotUnderstood(campo)
+    existente = budget.field(campo)
+    if existente:
+        # El título del PDF es la dirección (o el propietario): se mantiene sincronizado
+        if budget.pdf_title and normalize(budget.pdf_title) == normalize(existente.value):
+            budget.pdf_title = valor
+        existente.value = valor
+    elif clave in KNOWN_FIELDS:
+        budget.fields.append(BudgetField(label=KNOWN_FIELDS[clave], value=valor))
+    else:
+        raise EditNotUnderstood(campo)
+
+def apply_instruction(budget, instruccion):
+    """Aplica una instrucción al StructuredBudget o lanza EditNotUnderstood"""
+    if COMPOUND_RE.search(instruccion):
+        raise EditNotUnderstood(instruccion)
+
+    total_previo = budget.total
+    suma_previa = budget.items_total()
+    cambia_montos = False
+
+    if m := RECALC_RE.match(instruccion):
+        if budget.items_total() is None:
+            raise EditNotUnderstood("No hay montos para sumar")
+        budget.total = budget.items_total()
+        return
+
+    if (m := SET_TOTAL_RE.match(instruccion)) or (m := TOTAL_IS_RE.match(instruccion)):
+        monto = parse_amount(m.group("monto"))
+        if monto is None or budget.total is None and "total" not in budget.layout.lower():
+            raise EditNotUnderstood(instruccion)
+        budget.total = monto
+        return
+
+    if m := SET_ITEM_AMOUNT_RE.match(instruccion):
+        lista = _lista(budget, m.group("tipo"))
+        lista[_indice(lista, m.group("n"))].amount = parse_amount(m.group("monto"))
+        cambia_montos = True
+    elif m := SET_ITEM_TEXT_RE.match(instruccion):
+        lista = _lista(budget, m.group("tipo"))
+        indice = _indice(lista, m.group("n"))
+        item = _item(_valor(m.group("texto")))
+        # Solo cambia el nombre: se conserva el monto que tenía
+        if item.amount is None:
+            item.amount = lista[indice].amount
+        lista[indice] = item
+        cambia_montos = True
+    elif m := REMOVE_INDEX_RE.match(instruccion):
+        lista = _lista(budget, m.group("tipo"))
+        lista.pop(_indice(lista, m.group("n")))
+        cambia_montos = True
+    elif m := ADD_TO_RE.match(instruccion):
+        # "en la lista" sola no dice cuál: vale el tipo nombrado antes ("el material X en la lista")
+        tipo = m.group("destino") or m.group("lista") or m.group("tipo")
+        if tipo is None:
+            raise EditNotUnderstood(instruccion)
+        _lista(budget, tipo).append(_item(_valor(m.group("texto"))))
+        cambia_montos = True
+    elif m := ADD_RE.match(instruccion):
+        _lista(budget, m.group("tipo")).append(_item(_valor(m.group("texto"))))
+        cambia_montos = True
+    elif m := MOVE_RE.match(instruccion):
+        lista = _lista(budget, m.group("tipo"))
+        item = lista.pop(_indice(lista, m.group("n")))
+        destino = normalize(m.group("m"))
+        if destino.isdigit():
+            posicion = min(max(int(destino) - 1, 0), len(lista))
+        elif destino in ("principio", "inicio", "primero", "primer lugar"):
+            posicion = 0
+        else:
+            posicion = len(lista)
+        lista.insert(posicion, item)
+    elif m := SWAP_RE.match(instruccion):
+        lista = _lista(budget, m.group("tipo"))
+        a, b = _indice(lista, m.group("n")), _indice(lista, m.group("m"))
+        lista[a], lista[b] = lista[b], lista[a]
+    elif m := REMOVE_TEXT_RE.match(instruccion):
+        texto = _texto_buscado(_valor(m.group("texto")))
+        campo = budget.field(texto)
+        if m.group("tipo") is None and campo:
+            budget.fields.remove(campo)
+            return
+        listas = [_lista(budget, m.group("tipo"))] if m.group("tipo") else [budget.items, budget.materials]
+        candidatos = [(lista, _buscar(lista, texto)) for lista in listas]
+        candidatos = [(lista, i) for lista, i in candidatos if i is not None]
+        if len(candidatos) != 1:
+            raise EditNotUnderstood(instruccion)
+        lista, indice = candidatos[0]
+        lista.pop(indice)
+        cambia_montos = True
+    elif (m := SET_FIELD_RE.match(instruccion)) or (m := FIELD_IS_RE.match(instruccion)):
+        _set_field(budget, m.group("campo"), _valor(m.group("valor")))
+    else:
+        raise EditNotUnderstood(instruccion)
+
+    # Si el total era la suma de los ítems, se recalcula al cambiar montos
+    if cambia_montos and total_previo is not None and suma_previa is not None and abs(total_previo - suma_previa) < 0.01:
+        budget.total = budget.items_total()
+
+def _instrucciones(mensaje):
+    """Separa el mensaje en instrucciones (por líneas o ';') y limpia cortesías"""
+    partes = []
+    for parte in re.split(r'[\n;]+', mensaje):
+        parte = parte.strip().rstrip(".!").strip()
+        parte = re.sub(r'(?i)^\s*(?:por\s+favor|porfa|dale)[,\s]+', '', parte)
+        parte = re.sub(r'(?i)[,\s]+(?:por\s+favor|porfa|gracias)\s*$', '', parte)
+        parte = parte.strip().rstrip(".!").strip()
+        if parte:
+            partes.append(parte)
+    return partes
+
+def apply_edits(budget, mensaje):
+    """Aplica todas las instrucciones del mensaje al presupuesto (dict pdf_title/content).
+
+    Devuelve el Budget editado como dict, o None si alguna instrucción no se
+    entendió (en ese caso hay que usar el LLM).
+    """
+    instrucciones = _instrucciones(mensaje)
+    if not instrucciones:
+        return None
+    estructurado = StructuredBudget.from_budget(budget)
+    try:
+        for instruccion in instrucciones:
+            apply_instruction(estructurado, instruccion)
+    except EditNotUnderstood:
+        return None
+    return estructurado.to_budget()
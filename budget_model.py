@@ -0,0 +1,214 @@
+"""Modelo estructurado del presupuesto.
+
+`Budget` es lo que devuelve OpenAI (título + Markdown). `StructuredBudget` lo
+extiende con los campos del encabezado, los trabajos, los materiales y el
+total parseados del Markdown, de forma que se pueden editar localmente y
+volver a renderizar sin perder el resto del contenido ni su orden.
+"""
+import re
+import unicodedata
+from typing import List, Optional
+from pydantic import BaseModel
+
+class Budget(BaseModel):
+    pdf_title: str
+    content: str
+
+class BudgetField(BaseModel):
+    label: str
+    value: str
+
+class BudgetItem(BaseModel):
+    text: str
+    amount: Optional[float] = None
+    # Línea original; se conserva tal cual mientras el ítem no se edite
+    raw: Optional[str] = None
+
+# Marcadores del layout: cada uno ocupa una línea y se reemplaza al renderizar
+_FIELD = "\x00field:{}\x00"
+_ITEMS = "\x00items\x00"
+_MATERIALS = "\x00materials\x00"
+_TOTAL = "\x00total\x00"
+
+FIELD_RE = re.compile(r'^\*\*(?P<label>[^*:\n]+?)(?::\*\*|\*\*:)\s*(?P<value>.+?)\s*$')
+TOTAL_RE = re.compile(r'^(?P<prefix>.*?total.*?)\$\s*(?P<amount>\d[\d.,]*)(?P<suffix>.*)$', re.IGNORECASE)
+NUMBERED_RE = re.compile(r'^\s*\d+[.)]\s+(?P<text>.+?)\s*$')
+BULLET_RE = re.compile(r'^\s*[-*+]\s+(?P<text>.+?)\s*$')
+ITEM_AMOUNT_RE = re.compile(r'\s*(?:[-–:]\s*)?\$\s*(?P<amount>\d[\d.,]*)\s*$')
+
+def normalize(texto):
+    """Minúsculas y sin acentos, para comparar etiquetas e instrucciones"""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(c for c in texto if not unicodedata.combining(c)).strip()
+
+def parse_amount(texto):
+    """Convierte '$1.500.000', '1500000' o '1.500,50' a float (None si no es un monto)"""
+    texto = texto.strip().rstrip(".,")
+    if not texto:
+        return None
+    if "," in texto and "." in texto:
+        if texto.rfind(",") > texto.rfind("."):
+            texto = texto.replace(".", "").replace(",", ".")
+        else:
+            texto = texto.replace(",", "")
+    elif "," in texto:
+        texto = texto.replace(",", "") if re.fullmatch(r'\d{1,3}(,\d{3})+', texto) else texto.replace(",", ".")
+    elif "." in texto and re.fullmatch(r'\d{1,3}(\.\d{3})+', texto):
+        texto = texto.replace(".", "")
+    try:
+        return float(texto)
+    except ValueError:
+        return None
+
+def format_amount(valor, separar_miles=True):
+    """Formatea un monto al estilo argentino: 1500000 -> '1.500.000'"""
+    if float(valor).is_integer():
+        texto = f"{int(valor):,}" if separar_miles else str(int(valor))
+    else:
+        texto = f"{valor:,.2f}" if separar_miles else f"{valor:.2f}"
+        texto = texto.replace(".", "\x00")
+    return texto.replace(",", "." if separar_miles else "").replace("\x00", ",")
+
+def _split_item(texto):
+    match = ITEM_AMOUNT_RE.search(texto)
+    if match:
+        return BudgetItem(text=texto[:match.start()].strip(), amount=parse_amount(match.group("amount")), raw=texto)
+    return BudgetItem(text=texto, raw=texto)
+
+def _item_line(item, separar_miles):
+    if item.raw is not None:
+        original = _split_item(item.raw)
+        if (original.text, original.amount) == (item.text, item.amount):
+            return item.raw
+    if item.amount is None:
+        return item.text
+    return f"{item.text} - ${format_amount(item.amount, separar_miles)}"
+
+class StructuredBudget(Budget):
+    fields: List[BudgetField] = []
+    items: List[BudgetItem] = []
+    materials: List[BudgetItem] = []
+    total: Optional[float] = None
+    # Markdown original con marcadores donde van las partes estructuradas
+    layout: str = ""
+    total_prefix: str = ""
+    total_suffix: str = ""
+    thousands_dots: bool = True
+
+    @classmethod
+    def from_budget(cls, budget):
+        """Parsea el Markdown de un Budget (o dict con pdf_title/content)"""
+        data = budget if isinstance(budget, dict) else budget.model_dump()
+        parsed = cls(pdf_title=data.get("pdf_title") or "", content=data["content"])
+        layout = []
+        seccion = None
+        lista_abierta = False
+
+        for linea in data["content"].split("\n"):
+            texto = linea.strip()
+            total_match = TOTAL_RE.match(texto) if parsed.total is None else None
+            if total_match and ("costo" in texto.lower() or texto.startswith("#") or texto.startswith("**")):
+                parsed.total = parse_amount(total_match.group("amount"))
+                parsed.total_prefix = total_match.group("prefix")
+                parsed.total_suffix = total_match.group("suffix")
+                parsed.thousands_dots = "." in total_match.group("amount") or len(total_match.group("amount")) < 4
+                layout.append(_TOTAL)
+                seccion, lista_abierta = None, False
+                continue
+
+            if texto.startswith("#"):
+                encabezado = normalize(texto)
+                if "trabajo" in encabezado:
+                    seccion = "items"
+                elif "material" in encabezado:
+                    seccion = "materials"
+                else:
+                    seccion = None
+                lista_abierta = False
+                layout.append(linea)
+                continue
+
+            if seccion:
+                match = NUMBERED_RE.match(linea) if seccion == "items" else BULLET_RE.match(linea) or NUMBERED_RE.match(linea)
+                if match:
+                    getattr(parsed, seccion).append(_split_item(match.group("text")))
+                    if not lista_abierta:
+                        layout.append(_ITEMS if seccion == "items" else _MATERIALS)
+                        lista_abierta = True
+                    continue
+                if lista_abierta and not texto:
+                    continue  # Línea en blanco dentro de la lista
+                if lista_abierta:
+                    layout.append("")
+                    lista_abierta = False
+                    seccion = None if texto == "---" else seccion
+
+            field_match = FIELD_RE.match(texto)
+            if field_match and not texto.startswith("#"):
+                layout.append(_FIELD.format(len(parsed.fields)))
+                parsed.fields.append(BudgetField(
+                    label=field_match.group("label").strip(), value=field_match.group("value")
+                ))
+                continue
+
+            layout.append(linea)
+
+        parsed.layout = "\n".join(layout)
+        return parsed
+
+    def field(self, etiqueta):
+        """Busca un campo por etiqueta (sin acentos ni mayúsculas; admite prefijos como 'propietari')"""
+        buscada = normalize(etiqueta)
+        for campo in self.fields:
+            actual = normalize(campo.label)
+            if actual == buscada or actual.startswith(buscada) or buscada.startswith(actual):
+                return campo
+        return None
+
+    def items_total(self):
+        """Suma de los montos de trabajos y materiales (None si ninguno tiene monto)"""
+        montos = [i.amount for i in self.items + self.materials if i.amount is not None]
+        return sum(montos) if montos else None
+
+    def render(self):
+        """Vuelve a armar el Markdown con los datos actuales"""
+        lineas = []
+        campos_emitidos = 0
+        for linea in self.layout.split("\n"):
+            if linea.startswith("\x00field:"):
+                indice = int(linea.strip("\x00").split(":")[1])
+                if indice < len(self.fields):
+                    campo = self.fields[indice]
+                    lineas.append(f"**{campo.label}:** {campo.value}")
+                    campos_emitidos = max(campos_emitidos, indice + 1)
+                    # Campos agregados después del parseo van a continuación del último
+                    if indice == self._ultimo_field_layout():
+                        for extra in self.fields[indice + 1:]:
+                            lineas.extend(["", f"**{extra.label}:** {extra.value}"])
+                        campos_emitidos = len(self.fields)
+            elif linea == _ITEMS:
+                lineas.extend(f"{n}. {_item_line(i, self.thousands_dots)}" for n, i in enumerate(self.items, 1))
+                lineas.append("")
+            elif linea == _MATERIALS:
+                lineas.extend(f"- {_item_line(i, self.thousands_dots)}" for i in self.materials)
+                lineas.append("")
+            elif linea == _TOTAL:
+                if self.total is not None:
+                    lineas.append(f"{self.total_prefix}${format_amount(self.total, self.thousands_dots)}{self.total_suffix}")
+            else:
+                lineas.append(linea)
+
+        # Sin campos en el layout original: los nuevos van al principio
+        if campos_emitidos < len(self.fields):
+            nuevos = [f"**{c.label}:** {c.value}" for c in self.fields[campos_emitidos:]]
+            lineas = "\n\n".join(nuevos).split("\n") + [""] + lineas
+
+        return re.sub(r'\n{3,}', '\n\n', "\n".join(lineas)).strip() + "\n"
+
+    def _ultimo_field_layout(self):
+        indices = [int(l.strip("\x00").split(":")[1]) for l in self.layout.split("\n") if l.startswith("\x00field:")]
+        return max(indices) if indices else -1
+
+    def to_budget(self):
+        """Budget con el Markdown re-renderizado (lo que consume pdf_generator)"""
+        return {"pdf_title": self.pdf_title, "content": self.render()}
@@ -1,7 +1,33 @@
-# Estilo CSS para el PDF
+from pathlib import Path
+
+# Fuentes Inter locales (assets/fonts). Son obligatorias: sin ellas WeasyPrint usaría
+# otra fuente sin avisar y el PDF saldría distinto según el host
+FONTS_DIR = Path(__file__).resolve().parent / "assets" / "fonts"
+FONT_FILES = ("Inter-Regular.ttf", "Inter-Bold.ttf")
+
+def _font_src(archivo):
+    return f"url('{(FONTS_DIR / archivo).as_uri()}')"
+
+def check_fonts():
+    """Falla al arrancar si faltan las fuentes del PDF (ver assets/fonts/README.md)"""
+    faltantes = [archivo for archivo in FONT_FILES if not (FONTS_DIR / archivo).is_file()]
+    if faltantes:
+        raise FileNotFoundError(
+            f"Faltan las fuentes del PDF en {FONTS_DIR}: {', '.join(faltantes)} (ver assets/fonts/README.md)"
+        )
+
+# Estilo CSS para el PDF (sin @import remoto: se parsea una sola vez y no toca la red)
 CSS_ESTILO = """
-<style>
-    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;700&display=swap');
+    @font-face {
+        font-family: 'Inter';
+        font-weight: 400;
+        src: %s;
+    }
+    @font-face {
+        font-family: 'Inter';
+        font-weight: 700;
+        src: %s;
+    }
     @page {
         margin: 1cm;  /* Reducimos los márgenes de la página */
     }
@@ -37,5 +63,4 @@ CSS_ESTILO = """
         opacity: 0.5;
         margin: 10px 0;  /* Reducimos el espacio alrededor del separador */
     }
-</style>
-"""
\ No newline at end of file
+""" % (_font_src("Inter-Regular.ttf"), _font_src("Inter-Bold.ttf"))
\ No newline at end of file
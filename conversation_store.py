@@ -0,0 +1,143 @@
+"""Historial de conversación por usuario, acotado y opcionalmente persistente.
+
+Reemplaza al dict `historias` que crecía sin límite: cada usuario guarda a lo
+sumo HISTORY_MAX_MESSAGES mensajes y HISTORY_MAX_CHARS caracteres, los usuarios
+inactivos se desalojan tras HISTORY_TTL segundos y, si HISTORY_DB está
+configurado, el historial se guarda en SQLite y se carga bajo demanda.
+"""
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Mensajes máximos por usuario (se descartan los más viejos)
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES") or 20)
+# Caracteres máximos por usuario sumando todos sus mensajes
+HISTORY_MAX_CHARS = int(os.getenv("HISTORY_MAX_CHARS") or 60000)
+# Segundos de inactividad antes de desalojar a un usuario (default: 1 día)
+HISTORY_TTL = int(os.getenv("HISTORY_TTL") or 24 * 3600)
+# Ruta del SQLite para persistir el historial (vacío = solo memoria)
+HISTORY_DB = os.getenv("HISTORY_DB") or None
+# Cada cuánto se barren los usuarios inactivos
+SWEEP_INTERVAL = 60
+
+class ConversationStore:
+    def __init__(self, max_messages=HISTORY_MAX_MESSAGES, max_chars=HISTORY_MAX_CHARS,
+                 ttl=HISTORY_TTL, db_path=HISTORY_DB):
+        self.max_messages = max_messages
+        self.max_chars = max_chars
+        self.ttl = ttl
+        self._historias = {}
+        self._ultimo_uso = {}
+        self._lock = threading.Lock()
+        self._ultimo_barrido = time.monotonic()
+        self.evicted = 0
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS historias ("
+                "user_id INTEGER PRIMARY KEY, messages TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def _load(self, user_id):
+        """Trae el historial a memoria (desde SQLite si hace falta)"""
+        historia = self._historias.get(user_id)
+        if historia is None:
+            historia = []
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT messages, updated_at FROM historias WHERE user_id = ?", (user_id,)
+                ).fetchone()
+                if row and time.time() - row[1] < self.ttl:
+                    historia = json.loads(row[0])
+            self._historias[user_id] = historia
+        self._ultimo_uso[user_id] = time.monotonic()
+        return historia
+
+    def _trim(self, historia):
+        """Descarta los mensajes más viejos hasta respetar los límites (siempre queda el último)"""
+        total = sum(len(m["content"]) for m in historia)
+        while len(historia) > 1 and (len(historia) > self.max_messages or total > self.max_chars):
+            total -= len(historia.pop(0)["content"])
+
+    def _persist(self, user_id, historia):
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO historias (user_id, messages, updated_at) VALUES (?, ?, ?)",
+                (user_id, json.dumps(historia, ensure_ascii=False), time.time())
+            )
+            self._db.commit()
+
+    def get(self, user_id):
+        """Devuelve una copia del historial del usuario"""
+        with self._lock:
+            self._maybe_sweep()
+            return list(self._load(user_id))
+
+    def append(self, user_id, role, content):
+        with self._lock:
+            self._maybe_sweep()
+            historia = self._load(user_id)
+            historia.append({"role": role, "content": content})
+            self._trim(historia)
+            self._persist(user_id, historia)
+
+    def clear(self, user_id):
+        with self._lock:
+            self._historias.pop(user_id, None)
+            self._ultimo_uso.pop(user_id, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM historias WHERE user_id = ?", (user_id,))
+                self._db.commit()
+
+    def _maybe_sweep(self):
+        ahora = time.monotonic()
+        if ahora - self._ultimo_barrido >= SWEEP_INTERVAL:
+            self._ultimo_barrido = ahora
+            self._sweep(ahora)
+
+    def _sweep(self, ahora):
+        """Desaloja de memoria a los usuarios inactivos y purga sus filas vencidas"""
+        inactivos = [uid for uid, uso in self._ultimo_uso.items() if ahora - uso >= self.ttl]
+        for user_id in inactivos:
+            self._historias.pop(user_id, None)
+            del self._ultimo_uso[user_id]
+        self.evicted += len(inactivos)
+        if self._db is not None:
+            self._db.execute("DELETE FROM historias WHERE updated_at < ?", (time.time() - self.ttl,))
+            self._db.commit()
+        if inactivos:
+            logger.debug(f"Historial: {len(inactivos)} usuarios inactivos desalojados; {self._stats()}")
+
+    def _stats(self):
+        mensajes = sum(len(h) for h in self._historias.values())
+        caracteres = sum(len(m["content"]) for h in self._historias.values() for m in h)
+        bytes_aprox = sum(
+            sys.getsizeof(h) + sum(sys.getsizeof(m) + sys.getsizeof(m["content"]) for m in h)
+            for h in self._historias.values()
+        )
+        return {
+            "users": len(self._historias),
+            "messages": mensajes,
+            "chars": caracteres,
+            "approx_bytes": bytes_aprox,
+            "evicted": self.evicted,
+            "persistent": self._db is not None,
+        }
+
+    def stats(self):
+        """Uso de memoria del historial en este momento"""
+        with self._lock:
+            return self._stats()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
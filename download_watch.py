@@ -0,0 +1,134 @@
+"""Detección de fin de descarga en una carpeta.
+
+En Linux usa inotify (vía ctypes, sin dependencias): el rename de
+.crdownload/.tmp al nombre final se detecta apenas ocurre, sin escanear la
+carpeta cada segundo. En otros sistemas, o si inotify no está disponible,
+cae a polling.
+"""
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+TEMP_SUFFIXES = ('.crdownload', '.tmp')
+# Intervalo del polling de respaldo
+POLL_INTERVAL = 0.5
+# Cada cuánto se revisan cancelación y progreso mientras no hay eventos
+TICK = 1.0
+
+class FileTooLarge(Exception):
+    """La descarga supera el tamaño máximo permitido"""
+
+    def __init__(self, size):
+        super().__init__(f"El archivo supera el límite ({size} bytes)")
+        self.size = size
+
+# Máscara de eventos inotify (ver inotify(7))
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_MASK = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+
+class _Inotify:
+    """Watch inotify sobre una carpeta; fileno() sirve para select()"""
+
+    def __init__(self, path):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), _IN_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, "inotify_add_watch")
+
+    def fileno(self):
+        return self.fd
+
+    def wait(self, timeout):
+        """Espera eventos hasta timeout segundos. Devuelve True si hubo alguno"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+def _open_watch(path):
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        return _Inotify(path)
+    except (OSError, AttributeError) as e:
+        logger.warning(f"inotify no disponible, usando polling: {e}")
+        return None
+
+def scan(download_dir):
+    """Devuelve (archivo_completo_mas_reciente | None, bytes_en_descarga, hay_temporales)"""
+    completos = []
+    bytes_descargados = 0
+    temporales = False
+    with os.scandir(download_dir) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            if entry.name.endswith(TEMP_SUFFIXES):
+                temporales = True
+                bytes_descargados += stat.st_size
+            else:
+                completos.append((stat.st_mtime, entry.path, stat.st_size))
+    if temporales or not completos:
+        return None, bytes_descargados, temporales
+    completos.sort(reverse=True)
+    return completos[0][1], completos[0][2], False
+
+def wait_for_download(download_dir, timeout=360, cancel_event=None, on_progress=None, cancelled_exc=None, max_bytes=None):
+    """Espera a que termine la descarga en download_dir y devuelve la ruta del archivo.
+
+    on_progress(bytes) se llama cuando cambia la cantidad de bytes descargados.
+    Si cancel_event se activa, lanza cancelled_exc (o InterruptedError).
+    Si se descargan más de max_bytes, lanza FileTooLarge sin esperar al final.
+    Devuelve None si se agota el timeout.
+    """
+    os.makedirs(download_dir, exist_ok=True)
+    watch = _open_watch(download_dir)
+    deadline = time.monotonic() + timeout
+    ultimo_progreso = None
+    try:
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                raise (cancelled_exc or InterruptedError)()
+
+            archivo, bytes_descargados, _ = scan(download_dir)
+            if max_bytes is not None and bytes_descargados > max_bytes:
+                raise FileTooLarge(bytes_descargados)
+            if bytes_descargados != ultimo_progreso:
+                ultimo_progreso = bytes_descargados
+                if on_progress:
+                    on_progress(bytes_descargados)
+            if archivo:
+                return archivo
+
+            restante = deadline - time.monotonic()
+            if restante <= 0:
+                return None
+            if watch:
+                watch.wait(min(TICK, restante))
+            else:
+                time.sleep(min(POLL_INTERVAL, restante))
+    finally:
+        if watch:
+            watch.close()
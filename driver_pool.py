@@ -0,0 +1,193 @@
+"""Pool de drivers de Chrome pre-lanzados para el downloader de YouTube.
+
+Levantar Chrome es buena parte de la espera de cada descarga. El pool mantiene
+drivers listos, los reutiliza entre trabajos, los revisa antes de prestarlos y
+los recicla tras N usos o si se rompen.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Drivers pre-lanzados (0 desactiva el pool: un driver nuevo por trabajo)
+YT_DRIVER_POOL_SIZE = int(os.getenv("YT_DRIVER_POOL_SIZE") or 2)
+# Usos antes de reciclar un driver (Chrome acumula memoria con el tiempo)
+YT_DRIVER_MAX_USES = int(os.getenv("YT_DRIVER_MAX_USES") or 20)
+
+class PooledDriver:
+    """Driver prestado por el pool junto con su contador de usos"""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+        self.created_at = time.monotonic()
+        self.broken = False
+
+def _quit(driver):
+    try:
+        driver.quit()
+    except Exception:
+        pass
+
+class DriverPool:
+    def __init__(self, factory, size=YT_DRIVER_POOL_SIZE, max_uses=YT_DRIVER_MAX_USES):
+        self.factory = factory
+        self.size = size
+        self.max_uses = max_uses
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._total = 0
+        self._closed = False
+
+    @property
+    def active(self):
+        """Drivers prestados en este momento"""
+        return self._total - self._idle.qsize()
+
+    def _create(self):
+        driver = self.factory()
+        if driver is None:
+            return None
+        return PooledDriver(driver)
+
+    def start(self):
+        """Pre-lanza los drivers del pool (bloqueante: llamar desde un thread)"""
+        while not self._closed:
+            with self._lock:
+                if self._total >= self.size:
+                    return
+                self._total += 1
+            pooled = self._create()
+            if pooled is None:
+                with self._lock:
+                    self._total -= 1
+                logger.warning("No se pudo pre-lanzar un driver para el pool")
+                return
+            self._idle.put(pooled)
+            logger.debug(f"Driver pre-lanzado ({self._total}/{self.size})")
+
+    def _healthy(self, pooled):
+        try:
+            pooled.driver.window_handles  # Falla si Chrome o chromedriver murieron
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, pooled):
+        _quit(pooled.driver)
+        with self._lock:
+            self._total -= 1
+
+    def acquire(self, download_dir, timeout=None):
+        """Presta un driver sano con las descargas apuntando a download_dir.
+
+        Si no hay drivers libres y el pool está lleno, espera hasta timeout segundos.
+        Devuelve None si no se pudo conseguir un driver.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._closed:
+            pooled = None
+            try:
+                pooled = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    crear = self._total < self.size or self.size <= 0
+                    if crear:
+                        self._total += 1
+                if crear:
+                    pooled = self._create()
+                    if pooled is None:
+                        with self._lock:
+                            self._total -= 1
+                        return None
+                else:
+                    restante = None if deadline is None else deadline - time.monotonic()
+                    if restante is not None and restante <= 0:
+                        return None
+                    try:
+                        pooled = self._idle.get(timeout=restante)
+                    except queue.Empty:
+                        return None
+
+            if not self._healthy(pooled):
+                logger.warning("Driver del pool no responde, se reemplaza")
+                self._discard(pooled)
+                continue
+
+            try:
+                set_download_dir(pooled.driver, download_dir)
+            except Exception as e:
+                logger.warning(f"No se pudo configurar la carpeta de descargas, se reemplaza el driver: {e}")
+                self._discard(pooled)
+                continue
+
+            pooled.uses += 1
+            return pooled
+        return None
+
+    def release(self, pooled):
+        """Devuelve el driver al pool, o lo recicla si está roto o gastado"""
+        if pooled is None:
+            return
+        reciclar = (
+            self._closed
+            or self.size <= 0
+            or pooled.broken
+            or pooled.uses >= self.max_uses
+            or not self._healthy(pooled)
+        )
+        if not reciclar:
+            try:
+                _reset(pooled.driver)
+            except Exception:
+                reciclar = True
+
+        if reciclar:
+            self._discard(pooled)
+            logger.debug(f"Driver reciclado tras {pooled.uses} usos")
+            if not self._closed and self.size > 0:
+                # Reponer en segundo plano para que el próximo trabajo lo encuentre listo
+                threading.Thread(target=self.start, daemon=True).start()
+        else:
+            self._idle.put(pooled)
+
+    def shutdown(self):
+        """Cierra todos los drivers libres; los prestados se cierran al devolverse"""
+        self._closed = True
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(pooled)
+
+def set_download_dir(driver, download_dir):
+    """Redirige las descargas de un driver ya lanzado a download_dir"""
+    download_dir = os.path.abspath(download_dir)
+    os.makedirs(download_dir, exist_ok=True)
+    driver.execute_cdp_cmd("Browser.setDownloadBehavior", {
+        "behavior": "allow",
+        "downloadPath": download_dir,
+        "eventsEnabled": True,
+    })
+
+def _reset(driver):
+    """Deja el driver limpio para el próximo trabajo"""
+    handles = driver.window_handles
+    for handle in handles[1:]:
+        driver.switch_to.window(handle)
+        driver.close()
+    driver.switch_to.window(handles[0])
+    driver.get("about:blank")
+    driver.delete_all_cookies()
+    # Vaciar el log de red (modo descarga directa) para no arrastrar eventos viejos
+    try:
+        driver.get_log("performance")
+    except Exception:
+        pass
+    # selenium-wire guarda cada request capturado en memoria
+    if hasattr(driver, "requests"):
+        del driver.requests
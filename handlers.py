@@ -1,11 +1,76 @@
+import asyncio
+import logging
+import os
+import uuid
 from telegram import Update
 from telegram.ext import ContextTypes
-from openai_client import generate_markdown
-from pdf_generator import generate_pdf
-from youtube_handler import is_youtube_url, handle_youtube_link
+from openai_client import build_prompt, generate_markdown, generate_markdown_stream, prompt_key
+from response_cache import response_cache
+import time
+import pdf_service
+from conversation_store import ConversationStore
+from budget_editor import apply_edits
+from youtube_links import is_youtube_url, handle_youtube_link
+import metrics
+from metrics import track
+from admission import admission, AdmissionRejected, BUDGET
+from job_store import job_store, DONE, FAILED
 
-# Historial de mensajes por usuario
-historias = {}
+logger = logging.getLogger(__name__)
+
+budgets_total = metrics.counter(
+    "presugen_budgets_total", "Presupuestos por origen (local, cache, openai) y resultado", ("source", "result")
+)
+
+# Historial de mensajes por usuario (acotado, con TTL y persistencia opcional)
+historias = ConversationStore()
+
+# Aplicar ediciones simples ("sacá el material 3") sin pasar por OpenAI
+LOCAL_EDITS = (os.getenv("LOCAL_EDITS") or "1") != "0"
+
+# Mostrar el presupuesto mientras se genera (streaming)
+STREAM_BUDGETS = (os.getenv("STREAM_BUDGETS") or "1") != "0"
+# Segundos mínimos entre ediciones del mensaje de vista previa
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL") or 1.5)
+# Límite de caracteres de un mensaje de Telegram
+TELEGRAM_MAX_CHARS = 4096
+
+class StreamingPreview:
+    """Mensaje que se va editando con el presupuesto a medida que llega"""
+
+    def __init__(self, message):
+        self.message = message
+        self._ultimo_texto = ""
+        self._ultima_edicion = 0
+
+    async def update(self, texto):
+        ahora = time.monotonic()
+        if ahora - self._ultima_edicion < STREAM_EDIT_INTERVAL or texto == self._ultimo_texto:
+            return
+        self._ultima_edicion = ahora
+        self._ultimo_texto = texto
+        if len(texto) > TELEGRAM_MAX_CHARS - 10:
+            texto = "…" + texto[-(TELEGRAM_MAX_CHARS - 10):]
+        try:
+            await self.message.edit_text(texto + " ▌")
+        except Exception:
+            pass  # Ediciones fallidas (rate limit, texto igual) no frenan la generación
+
+    async def delete(self):
+        try:
+            await self.message.delete()
+        except Exception:
+            pass
+
+def edit_locally(historial, reply_to_message, mensaje):
+    """Intenta aplicar la modificación sobre el último presupuesto sin llamar al LLM"""
+    previo = next((m["content"] for m in reversed(historial) if m["role"] == "assistant"), None)
+    if not previo:
+        return None
+    # El nombre del PDF al que se responde es su pdf_title
+    nombre = reply_to_message.document.file_name or ""
+    pdf_title = nombre[:-4] if nombre.lower().endswith(".pdf") else nombre
+    return apply_edits({"pdf_title": pdf_title, "content": previo}, mensaje)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     mensaje_bienvenida = (
@@ -15,13 +80,32 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "2. Te voy a enviar un PDF con el presupuesto formateado.\n"
         "3. Si querés modificar un presupuesto, respondé al mensaje con el PDF y decime qué cambiar.\n\n"
         "🎬 YOUTUBE:\n"
-        "1. Enviame un link de YouTube.\n"
+        "1. Enviame uno o varios links de YouTube en un mensaje.\n"
         "2. Elegí si querés descargar solo audio 🎵 o video completo 🎬.\n"
-        "3. Te enviaré el archivo correspondiente.\n\n"
+        "3. Te enviaré los archivos correspondientes.\n\n"
         "Usá /start para ver estas instrucciones de nuevo."
     )
     await update.message.reply_text(mensaje_bienvenida)
 
+async def send_pdf(bot, chat_id, json_response, pdf_bytes=None):
+    """Renderiza el presupuesto (salvo que ya venga pdf_bytes) y lo envía como documento al chat.
+
+    Devuelve (mensaje_enviado, pdf_bytes); pdf_bytes es None en modo disco.
+    """
+    filename = pdf_service.pdf_filename(json_response)
+    if pdf_bytes is None and pdf_service.PDF_OUTPUT_MODE == "disk":
+        async with pdf_service.render_to_disk(json_response) as pdf_path:
+            with open(pdf_path, "rb") as file, track("budget", "telegram_upload"):
+                sent_message = await bot.send_document(chat_id=chat_id, document=file, filename=filename)
+        return sent_message, None
+
+    # Modo memoria: el PDF va directo de bytes a Telegram, sin pasar por disco
+    if pdf_bytes is None:
+        pdf_bytes = await pdf_service.render(json_response)
+    with track("budget", "telegram_upload"):
+        sent_message = await bot.send_document(chat_id=chat_id, document=pdf_bytes, filename=filename)
+    return sent_message, pdf_bytes
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     mensaje = update.message.text
@@ -30,10 +114,18 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if is_youtube_url(mensaje):
         await handle_youtube_link(update, context)
         return
-    
-    # Inicializar historial para el usuario si no existe
-    if user_id not in historias:
-        historias[user_id] = []
+
+    # Pasa por el control de admisión: límite por usuario y prioridad sobre las descargas
+    try:
+        async with admission.slot(BUDGET, user_id):
+            await handle_budget(update, context)
+    except AdmissionRejected as e:
+        await update.message.reply_text(f"⏳ {e}")
+
+async def handle_budget(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Genera (o modifica) el presupuesto del mensaje y envía el PDF"""
+    user_id = update.effective_user.id
+    mensaje = update.message.text
 
     # Verificar si es una respuesta a un PDF
     es_respuesta = update.message.reply_to_message is not None and \
@@ -41,24 +133,119 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                    update.message.reply_to_message.document is not None and \
                    update.message.reply_to_message.document.mime_type == "application/pdf"
 
-    # Agregar el mensaje al historial
+    # Agregar el mensaje al historial (con HISTORY_DB toca SQLite: fuera del event loop)
     if es_respuesta:
-        historias[user_id].append({"role": "user", "content": f"Modificar el presupuesto anterior: {mensaje}"})
+        await asyncio.to_thread(historias.append, user_id, "user", f"Modificar el presupuesto anterior: {mensaje}")
     else:
-        historias[user_id].append({"role": "user", "content": mensaje})
+        await asyncio.to_thread(historias.append, user_id, "user", mensaje)
+    historial = await asyncio.to_thread(historias.get, user_id)
 
+    # Queda registrado hasta enviar el PDF: si el proceso se reinicia, se retoma al arrancar
+    job_id = uuid.uuid4().hex[:12]
+    await asyncio.to_thread(
+        job_store.start, job_id, "budget", chat_id=update.effective_chat.id,
+        message_id=update.message.message_id, user_id=user_id, params={"historial": historial}
+    )
+    estado, error = FAILED, None
+    interrumpido = False
+
+    preview = None
+    origen = "openai"
+    inicio = time.perf_counter()
     try:
+        json_response = None
+        pdf_bytes = None
+        cache_key = None
+        if es_respuesta and LOCAL_EDITS:
+            with track("budget", "local_edit"):
+                json_response = edit_locally(historial, update.message.reply_to_message, mensaje)
+            if json_response:
+                origen = "local"
+                logger.debug("Modificación aplicada localmente, sin OpenAI")
+
+        # El prompt compactado se arma una sola vez: sirve para la key de cache y para OpenAI
+        prompt = None
+        if json_response is None:
+            prompt, _, _ = build_prompt(historial)
+
+        # Pedido idéntico a uno reciente (p. ej. reenvío tras un error): se responde desde la cache
+        if json_response is None and response_cache.enabled:
+            with track("budget", "cache_lookup"):
+                cache_key = prompt_key(prompt)
+                cached = response_cache.get(cache_key)
+            if cached:
+                json_response, pdf_bytes = cached
+                origen = "cache"
+                logger.debug("Presupuesto servido desde la cache de respuestas")
+                cache_key = None
+
         # Generar JSON con OpenAI
-        json_response = generate_markdown(historias[user_id])
+        if json_response is None and STREAM_BUDGETS:
+            # Vista previa en vivo; el PDF se renderiza apenas termina el contenido estructurado
+            preview = StreamingPreview(await update.message.reply_text("✍️ Generando presupuesto..."))
+            with track("budget", "openai"):
+                json_response = await generate_markdown_stream(prompt, on_update=preview.update)
+        elif json_response is None:
+            with track("budget", "openai"):
+                json_response = await generate_markdown(prompt)
+
+        # La completion se guarda apenas llega: si el render o el envío fallan, el reenvío no paga otra
+        await asyncio.to_thread(job_store.update, job_id, stage="render", json_response=json_response)
+        if cache_key:
+            response_cache.put(cache_key, json_response)
+            if pdf_service.PDF_OUTPUT_MODE != "disk":
+                pdf_bytes = await pdf_service.render(json_response)
+                response_cache.put(cache_key, json_response, pdf_bytes)
+
+        # Generar el PDF en el pool de procesos (salvo que ya esté) y enviarlo
+        sent_message, pdf_bytes = await send_pdf(context.bot, update.effective_chat.id, json_response, pdf_bytes)
 
-        # Generar y enviar el PDF
-        pdf_file = generate_pdf(json_response)
-        with open(pdf_file, "rb") as file:
-            sent_message = await context.bot.send_document(chat_id=update.effective_chat.id, document=file)
-        
         # Guardar el contenido Markdown en el historial
-        historias[user_id].append({"role": "assistant", "content": json_response["content"]})
+        await asyncio.to_thread(historias.append, user_id, "assistant", json_response["content"])
+        budgets_total.inc(source=origen, result="ok")
+        estado = DONE
 
+    except asyncio.CancelledError:
+        # Apagado a mitad del presupuesto: queda pendiente para retomarlo al arrancar
+        interrumpido = True
+        raise
+    except pdf_service.PdfQueueFull as e:
+        error = str(e)
+        logger.warning(str(e), extra={"user_id": user_id})
+        budgets_total.inc(source=origen, result="queue_full")
+        await update.message.reply_text("Hay muchos presupuestos en proceso. Probá de nuevo en unos segundos.")
+    except Exception as e:
+        error = str(e)
+        logger.error(f"Error al procesar el presupuesto: {e}", extra={"user_id": user_id, "source": origen})
+        budgets_total.inc(source=origen, result="error")
+        await update.message.reply_text(f"No pude procesar tu solicitud. Por favor, intentá de nuevo.")
+    finally:
+        if not interrumpido:
+            await asyncio.to_thread(job_store.finish, job_id, estado, error)
+        metrics.stage_seconds.observe(time.perf_counter() - inicio, pipeline="budget", stage="total")
+        # La vista previa se borra cuando ya está el PDF (o si falló)
+        if preview:
+            await preview.delete()
+
+async def resume_budget(bot, record):
+    """Termina un presupuesto que quedó a medias por un reinicio y lo envía al chat original"""
+    params = record["params"]
+    user_id = record["user_id"]
+    try:
+        # Sin límite por usuario: el pedido ya se había admitido antes del reinicio
+        async with admission.slot(BUDGET):
+            json_response = params.get("json_response")
+            if json_response is None:
+                with track("budget", "openai"):
+                    prompt, _, _ = build_prompt(params["historial"])
+                    json_response = await generate_markdown(prompt)
+                await asyncio.to_thread(job_store.update, record["id"], stage="render", json_response=json_response)
+            await send_pdf(bot, record["chat_id"], json_response)
+        await asyncio.to_thread(historias.append, user_id, "assistant", json_response["content"])
+        budgets_total.inc(source="resume", result="ok")
+        await asyncio.to_thread(job_store.finish, record["id"])
     except Exception as e:
-        print(e)
-        await update.message.reply_text(f"No pude procesar tu solicitud. Por favor, intentá de nuevo.")
\ No newline at end of file
+        logger.error(f"Error al retomar el presupuesto: {e}", extra={"user_id": user_id, "job_id": record["id"]})
+        budgets_total.inc(source="resume", result="error")
+        await asyncio.to_thread(job_store.finish, record["id"], FAILED, str(e))
+        await bot.send_message(record["chat_id"], "No pude procesar tu solicitud. Por favor, intentá de nuevo.")
@@ -0,0 +1,111 @@
+"""Descarga directa por HTTP del archivo final de y2mate.
+
+Una vez resuelta la URL del medio, el navegador ya no hace falta: el archivo
+se baja por streaming con una sesión HTTP compartida (conexiones reutilizadas),
+en chunks, y si la conexión se corta se retoma con Range desde el último byte.
+"""
+import logging
+import os
+import re
+import threading
+from urllib.parse import unquote, urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from download_watch import FileTooLarge
+
+logger = logging.getLogger(__name__)
+
+# Tamaño de cada chunk leído de la red
+CHUNK_SIZE = 1024 * 1024
+# Reintentos (con reanudación) si la conexión se corta a mitad de la descarga
+MAX_RESUMES = 5
+# Timeouts (conexión, lectura entre chunks) en segundos
+TIMEOUT = (15, 60)
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """Sesión HTTP compartida entre descargas (pool de conexiones keep-alive)"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+def filename_from_response(response, fallback):
+    """Nombre de archivo a partir de Content-Disposition o de la URL"""
+    disposition = response.headers.get("Content-Disposition", "")
+    match = re.search(r"filename\*\s*=\s*[^']*''([^;]+)", disposition) or \
+        re.search(r'filename\s*=\s*"?([^";]+)"?', disposition)
+    nombre = unquote(match.group(1)) if match else os.path.basename(unquote(urlparse(response.url).path))
+    nombre = re.sub(r'[\\/:*?"<>|\x00-\x1f]+', ' ', nombre).strip(' .')
+    return nombre if nombre and "." in nombre else fallback
+
+def expected_size(response):
+    """Tamaño total del archivo según Content-Range o Content-Length (None si no se informa)"""
+    content_range = response.headers.get("Content-Range", "")
+    match = re.search(r'/(\d+)\s*$', content_range)
+    if match:
+        return int(match.group(1))
+    if response.status_code == 200 and response.headers.get("Content-Length", "").isdigit():
+        return int(response.headers["Content-Length"])
+    return None
+
+def stream_download(url, dest_dir, fallback_name, headers=None, proxies=None,
+                    cancel_event=None, on_progress=None, cancelled_exc=InterruptedError, max_bytes=None):
+    """Baja url a dest_dir y devuelve la ruta final.
+
+    Escribe en un archivo .tmp que se renombra al terminar; si la conexión se
+    corta, reanuda con Range (o empieza de nuevo si el servidor no lo soporta).
+    Si ya hay un .tmp de una corrida anterior (p. ej. antes de un reinicio),
+    la descarga sigue desde ahí.
+    Si el archivo supera max_bytes (por Content-Length o por lo ya recibido)
+    lanza FileTooLarge apenas se sabe.
+    """
+    session = get_session()
+    os.makedirs(dest_dir, exist_ok=True)
+    tmp_path = os.path.join(dest_dir, fallback_name + ".tmp")
+    recibidos = os.path.getsize(tmp_path) if os.path.exists(tmp_path) else 0
+    nombre = None
+    intentos = 0
+
+    with open(tmp_path, "ab") as archivo:
+        while True:
+            pedido = dict(headers or {})
+            if recibidos:
+                pedido["Range"] = f"bytes={recibidos}-"
+            try:
+                with session.get(url, headers=pedido, proxies=proxies, stream=True, timeout=TIMEOUT) as response:
+                    response.raise_for_status()
+                    if recibidos and response.status_code != 206:
+                        # El servidor ignoró el Range: empezar de cero
+                        archivo.truncate(0)
+                        recibidos = 0
+                    if nombre is None:
+                        nombre = filename_from_response(response, fallback_name)
+                    total = expected_size(response)
+                    if max_bytes is not None and total is not None and total > max_bytes:
+                        raise FileTooLarge(total)
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        if cancel_event is not None and cancel_event.is_set():
+                            raise cancelled_exc()
+                        archivo.write(chunk)
+                        recibidos += len(chunk)
+                        if max_bytes is not None and recibidos > max_bytes:
+                            raise FileTooLarge(recibidos)
+                        if on_progress:
+                            on_progress(recibidos)
+                break
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                intentos += 1
+                if intentos > MAX_RESUMES:
+                    raise
+                logger.warning(f"Descarga interrumpida en {recibidos} bytes, reanudando ({intentos}/{MAX_RESUMES}): {e}")
+
+    final_path = os.path.join(dest_dir, nombre or fallback_name)
+    os.replace(tmp_path, final_path)
+    return final_path
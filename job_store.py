@@ -0,0 +1,144 @@
+"""Cola de trabajos persistente en SQLite.
+
+Cada presupuesto o descarga en curso queda registrado con su chat, el
+mensaje de estado, sus parámetros y la etapa en la que va. Si el proceso se
+reinicia a mitad de un trabajo, al arrancar se retoma (o se le avisa al
+usuario que falló) en lugar de dejarlo mirando "Procesando..." para siempre.
+Los registros terminados se compactan después de JOBS_RETENTION segundos.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Ruta del SQLite de trabajos (":memory:" = sin persistencia)
+JOBS_DB = os.getenv("JOBS_DB") or "jobs.db"
+# Segundos que se conservan los trabajos terminados (default: 1 día)
+JOBS_RETENTION = int(os.getenv("JOBS_RETENTION") or 24 * 3600)
+# Reintentos al reiniciar antes de darlo por fallido
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS") or 2)
+# Trabajos más viejos que esto no se retoman al reiniciar (el usuario ya se fue)
+JOBS_RESUME_MAX_AGE = int(os.getenv("JOBS_RESUME_MAX_AGE") or 3600)
+# Cada cuánto se compactan los registros terminados
+COMPACT_INTERVAL = 3600
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+class JobStore:
+    def __init__(self, db_path=JOBS_DB, retention=JOBS_RETENTION):
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._ultima_compactacion = 0
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, chat_id INTEGER, message_id INTEGER, "
+            "user_id INTEGER, params TEXT NOT NULL, stage TEXT NOT NULL, status TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, updated_at)")
+        self._db.commit()
+
+    def _row(self, row):
+        if row is None:
+            return None
+        keys = ("id", "kind", "chat_id", "message_id", "user_id", "params", "stage", "status",
+                "attempts", "error", "created_at", "updated_at")
+        record = dict(zip(keys, row))
+        record["params"] = json.loads(record["params"])
+        return record
+
+    def start(self, job_id, kind, chat_id=None, message_id=None, user_id=None, params=None, stage="queued"):
+        """Registra el trabajo como pendiente. Si ya existe (se está retomando) conserva sus parámetros"""
+        ahora = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, kind, chat_id, message_id, user_id, params, stage, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET stage = excluded.stage, status = excluded.status, "
+                "updated_at = excluded.updated_at",
+                (job_id, kind, chat_id, message_id, user_id,
+                 json.dumps(params or {}, ensure_ascii=False), stage, PENDING, ahora, ahora)
+            )
+            self._db.commit()
+
+    def update(self, job_id, stage=None, **params):
+        """Avanza la etapa y/o agrega parámetros (p. ej. la URL del archivo para reanudar)"""
+        with self._lock:
+            row = self._db.execute("SELECT params, stage FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            datos = json.loads(row[0])
+            datos.update(params)
+            self._db.execute(
+                "UPDATE jobs SET params = ?, stage = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(datos, ensure_ascii=False), stage or row[1], time.time(), job_id)
+            )
+            self._db.commit()
+
+    def finish(self, job_id, status=DONE, error=None):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, error, time.time(), job_id)
+            )
+            self._db.commit()
+        self._maybe_compact()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._row(self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def pending(self):
+        """Trabajos que quedaron sin terminar (del más viejo al más nuevo)"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at", (PENDING,)
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def claim(self, job_id):
+        """Suma un intento antes de retomar; devuelve False si ya no conviene retomarlo"""
+        record = self.get(job_id)
+        if record is None or record["status"] != PENDING:
+            return False
+        if record["attempts"] >= JOBS_MAX_ATTEMPTS or time.time() - record["created_at"] > JOBS_RESUME_MAX_AGE:
+            return False
+        with self._lock:
+            self._db.execute("UPDATE jobs SET attempts = attempts + 1 WHERE id = ?", (job_id,))
+            self._db.commit()
+        return True
+
+    def compact(self):
+        """Borra los trabajos terminados más viejos que la retención"""
+        limite = time.time() - self.retention
+        with self._lock:
+            borrados = self._db.execute(
+                "DELETE FROM jobs WHERE status != ? AND updated_at < ?", (PENDING, limite)
+            ).rowcount
+            self._db.commit()
+        self._ultima_compactacion = time.monotonic()
+        if borrados:
+            logger.debug(f"Trabajos terminados compactados: {borrados}")
+        return borrados
+
+    def _maybe_compact(self):
+        if time.monotonic() - self._ultima_compactacion >= COMPACT_INTERVAL:
+            self.compact()
+
+    def stats(self):
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+job_store = JobStore()
@@ -0,0 +1,50 @@
+"""Configuración de logs estructurados.
+
+Cada línea es un JSON con la hora, el nivel, el módulo, el mensaje y los
+campos extra que se pasen con `extra={...}` (job_id, stage, seconds...),
+para poder filtrarlos y agregarlos sin parsear texto libre.
+"""
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+
+# Nivel mínimo de log: DEBUG, INFO, WARNING, ERROR (default INFO)
+LOG_LEVEL = (os.getenv("LOG_LEVEL") or "INFO").upper()
+# "json" (default) o "text" para leerlos en una terminal
+LOG_FORMAT = (os.getenv("LOG_FORMAT") or "json").lower()
+
+# Atributos propios de LogRecord: todo lo demás viene de `extra`
+_RESERVADOS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVADOS and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+def setup_logging():
+    """Configura el logger raíz (idempotente)"""
+    raiz = logging.getLogger()
+    if getattr(raiz, "_presugen", False):
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "text":
+        handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s"))
+    else:
+        handler.setFormatter(JsonFormatter())
+    raiz.handlers = [handler]
+    raiz.setLevel(LOG_LEVEL)
+    raiz._presugen = True
+    # httpx loguea cada request a OpenAI/Telegram en INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
@@ -1,30 +1,174 @@
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
-from handlers import start, handle_message
-from youtube_handler import handle_youtube_callback
+import asyncio
+import importlib
+import shutil
+import sys
+import pdf_service
+from update_processor import ChatOrderedUpdateProcessor, UPDATE_CONCURRENCY
 from dotenv import load_dotenv
+import logging
 import os
+import metrics
+from log_config import setup_logging
+from config import check_fonts
+from job_store import job_store, FAILED
 
+# handlers (OpenAI, pydantic) y youtube_handler (Selenium) se importan recién
+# con el primer update que los usa, o en segundo plano con el warm-up
 load_dotenv()
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# URL pública del bot (https); si está definida se usa webhook en vez de polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+# Dirección y puerto del servidor HTTP local que recibe el webhook
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN") or "0.0.0.0"
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT") or 8443)
+# Ruta del webhook y secreto que Telegram manda en cada request
+WEBHOOK_PATH = (os.getenv("WEBHOOK_PATH") or "telegram").strip("/")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+
+# Precargar en segundo plano, después de arrancar, los módulos pesados, los
+# workers de PDF y los drivers de Chrome (0 = todo se carga en el primer uso)
+WARM_UP = (os.getenv("WARM_UP") or "1") != "0"
+
+logger = logging.getLogger(__name__)
+
+async def _load(module):
+    """Importa un módulo pesado en un thread para no frenar el event loop"""
+    if module in sys.modules:
+        return sys.modules[module]
+    return await asyncio.to_thread(importlib.import_module, module)
+
+def lazy_callback(module, name):
+    """Callback que importa module.name recién la primera vez que llega un update"""
+    async def callback(update, context):
+        handler = getattr(await _load(module), name)
+        return await handler(update, context)
+    callback.__name__ = name
+    return callback
+
+async def warm_up():
+    """Precarga presupuestos y después YouTube, sin demorar el arranque"""
+    try:
+        await _load("handlers")
+        await pdf_service.warm_up()
+        youtube_handler = await _load("youtube_handler")
+        await asyncio.to_thread(youtube_handler.start_driver_pool)
+        logger.info("Warm-up terminado")
+    except Exception as e:
+        logger.warning(f"Falló el warm-up, se carga todo en el primer uso: {e}")
+
+# Función que retoma cada tipo de trabajo pendiente: (módulo, nombre)
+RESUMERS = {
+    "budget": ("handlers", "resume_budget"),
+    "download": ("youtube_handler", "resume_download"),
+}
+
+async def _discard_job(bot, record):
+    """Da por fallido un trabajo que no se puede retomar y le avisa al usuario"""
+    await asyncio.to_thread(job_store.finish, record["id"], FAILED, "Interrumpido por un reinicio")
+    if record["kind"] == "download":
+        from yt_jobs import DOWNLOADS_DIR
+        shutil.rmtree(os.path.join(DOWNLOADS_DIR, record["id"]), ignore_errors=True)
+    try:
+        await bot.send_message(
+            record["chat_id"],
+            "❌ Se interrumpió tu pedido por un reinicio. Enviámelo de nuevo, por favor.",
+            reply_to_message_id=record["message_id"],
+        )
+    except Exception as e:
+        logger.debug(f"No se pudo avisar del trabajo {record['id']}: {e}")
+
+async def resume_pending_jobs(app: Application, pendientes):
+    """Retoma los trabajos que quedaron a medias antes del reinicio (o avisa que se perdieron)"""
+    logger.info(f"Trabajos pendientes al arrancar: {len(pendientes)}")
+    for record in pendientes:
+        try:
+            if record["kind"] in RESUMERS and await asyncio.to_thread(job_store.claim, record["id"]):
+                module, name = RESUMERS[record["kind"]]
+                resume = getattr(await _load(module), name)
+                app.create_task(resume(app.bot, record))
+            else:
+                await _discard_job(app.bot, record)
+        except Exception as e:
+            logger.error(f"No se pudo retomar el trabajo {record['id']}: {e}")
+
+async def post_init(app: Application):
+    # Endpoint /metrics en formato Prometheus (si METRICS_PORT está definido)
+    if metrics.start_server():
+        logger.info(f"Métricas en http://{metrics.METRICS_HOST}:{metrics.METRICS_PORT}/metrics")
+    if WARM_UP:
+        app.create_task(warm_up())
+    # Se leen antes de empezar a recibir updates, para no confundirlos con trabajos nuevos
+    await asyncio.to_thread(job_store.compact)
+    pendientes = await asyncio.to_thread(job_store.pending)
+    if pendientes:
+        app.create_task(resume_pending_jobs(app, pendientes))
+
+async def post_shutdown(app: Application):
+    # Acá ya terminaron los updates en curso; se esperan los renders y descargas pendientes
+    pdf_service.shutdown()
+    # Solo se cierra lo que llegó a cargarse
+    if "yt_jobs" in sys.modules:
+        sys.modules["yt_jobs"].scheduler.shutdown()
+    if "youtube_handler" in sys.modules:
+        sys.modules["youtube_handler"].shutdown_driver_pool()
+    if "handlers" in sys.modules:
+        sys.modules["handlers"].historias.close()
+    job_store.close()
+    metrics.stop_server()
+
+def build_app():
+    """Crea la aplicación con sus handlers, lista para hacer polling o recibir el webhook"""
+    # Crear la aplicación
+    app = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        # Varios chats en paralelo, mensajes de un mismo chat en orden
+        .concurrent_updates(ChatOrderedUpdateProcessor())
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+    
+    # Añadir manejadores
+    app.add_handler(CommandHandler("start", lazy_callback("handlers", "start")))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, lazy_callback("handlers", "handle_message")))
+    # block=False: las descargas no frenan otros updates (por ejemplo, el botón Cancelar)
+    app.add_handler(CallbackQueryHandler(
+        lazy_callback("youtube_handler", "handle_youtube_callback"), pattern='^yt_', block=False
+    ))
+    return app
+
 def main():
+    setup_logging()
+
     if not TELEGRAM_TOKEN:
         raise ValueError("Falta el token de Telegram: TELEGRAM_TOKEN")
 
     if not OPENAI_API_KEY:
         raise ValueError("Falta la API key de OpenAI: OPENAI_API_KEY")
 
-    # Crear la aplicación
-    app = Application.builder().token(TELEGRAM_TOKEN).build()
-    
-    # Añadir manejadores
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-    app.add_handler(CallbackQueryHandler(handle_youtube_callback, pattern='^yt_'))
-    
-    # Iniciar el bot
-    app.run_polling()
+    check_fonts()
+
+    app = build_app()
+
+    # Iniciar el bot; al recibir SIGINT/SIGTERM se deja de aceptar updates
+    # y se terminan los que están en curso antes de cerrar
+    if WEBHOOK_URL:
+        logger.info(f"Webhook escuchando en {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}")
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            # Telegram admite hasta 100 conexiones simultáneas al webhook
+            max_connections=min(UPDATE_CONCURRENCY, 100),
+        )
+    else:
+        app.run_polling()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,139 @@
+"""Cache de archivos descargados de YouTube, direccionada por video y formato.
+
+Guarda el archivo en disco (LRU con tope de tamaño) y el file_id que Telegram
+devuelve al enviarlo la primera vez: los pedidos siguientes del mismo video se
+responden reenviando el file_id, sin descargar ni subir nada.
+"""
+import json
+import os
+import re
+import shutil
+import threading
+import time
+
+# Carpeta de la cache
+YT_CACHE_DIR = os.path.abspath(os.getenv("YT_CACHE_DIR") or "cache")
+# Tamaño máximo en disco (MB); 0 desactiva la cache de archivos (el file_id se sigue guardando)
+YT_CACHE_MAX_MB = int(os.getenv("YT_CACHE_MAX_MB") or 2048)
+
+# Formas de link de YouTube: watch?v=, youtu.be/, embed/, v/, shorts/, live/
+VIDEO_ID_RE = re.compile(
+    r'(?:https?://)?(?:www\.|m\.|music\.)?'
+    r'(?:youtube(?:-nocookie)?\.com/(?:watch\?(?:[^\s#]*?&)?v=|embed/|v/|shorts/|live/)|youtu\.be/)'
+    r'([A-Za-z0-9_-]{11})(?![A-Za-z0-9_-])'
+)
+
+def extract_video_id(url):
+    """Devuelve el ID canónico (11 caracteres) del video, o None"""
+    match = VIDEO_ID_RE.search(url or "")
+    return match.group(1) if match else None
+
+class MediaCache:
+    def __init__(self, root=YT_CACHE_DIR, max_bytes=YT_CACHE_MAX_MB * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._index_path = os.path.join(root, "index.json")
+        self._lock = threading.Lock()
+        self._index = None
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self):
+        if self._index is None:
+            try:
+                with open(self._index_path, encoding="utf-8") as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def _save(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self._index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._index, f)
+        os.replace(tmp, self._index_path)
+
+    @staticmethod
+    def _key(video_id, format_type):
+        return f"{video_id}:{format_type}"
+
+    def get(self, video_id, format_type):
+        """Devuelve {'file_id', 'path'} del video (cualquiera puede ser None) o None si no hay nada"""
+        with self._lock:
+            entry = self._load().get(self._key(video_id, format_type))
+            if not entry:
+                self.misses += 1
+                return None
+            path = entry.get("path")
+            if path and not os.path.exists(path):
+                entry["path"] = path = None
+                entry["size"] = 0
+            if not path and not entry.get("file_id"):
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry["last_used"] = time.time()
+            self._save()
+            return {"file_id": entry.get("file_id"), "path": path}
+
+    def put_file(self, video_id, format_type, src_path):
+        """Mueve el archivo descargado a la cache y devuelve su nueva ruta.
+
+        Si la cache de archivos está desactivada devuelve src_path sin tocarlo.
+        """
+        if self.max_bytes <= 0:
+            return src_path
+        key = self._key(video_id, format_type)
+        dest_dir = os.path.join(self.root, f"{video_id}-{format_type}")
+        os.makedirs(dest_dir, exist_ok=True)
+        dest = os.path.join(dest_dir, os.path.basename(src_path))
+        shutil.move(src_path, dest)
+        with self._lock:
+            entry = self._load().setdefault(key, {})
+            entry.update(path=dest, size=os.path.getsize(dest), last_used=time.time())
+            self._evict(keep=key)
+            self._save()
+        return dest
+
+    def set_file_id(self, video_id, format_type, file_id):
+        with self._lock:
+            entry = self._load().setdefault(self._key(video_id, format_type), {})
+            entry.update(file_id=file_id, last_used=time.time())
+            self._save()
+
+    def forget_file_id(self, video_id, format_type):
+        """Descarta un file_id que Telegram ya no acepta"""
+        with self._lock:
+            entry = self._load().get(self._key(video_id, format_type))
+            if entry:
+                entry["file_id"] = None
+                self._save()
+
+    def _evict(self, keep=None):
+        """Borra archivos menos usados hasta quedar bajo max_bytes (los file_id se conservan)"""
+        index = self._load()
+        total = sum(e.get("size") or 0 for e in index.values() if e.get("path"))
+        for key, entry in sorted(index.items(), key=lambda kv: kv[1].get("last_used", 0)):
+            if total <= self.max_bytes:
+                break
+            if key == keep or not entry.get("path"):
+                continue
+            shutil.rmtree(os.path.dirname(entry["path"]), ignore_errors=True)
+            total -= entry.get("size") or 0
+            entry["path"] = None
+            entry["size"] = 0
+
+    def stats(self):
+        with self._lock:
+            index = self._load()
+            return {
+                "entries": len(index),
+                "files": sum(1 for e in index.values() if e.get("path")),
+                "bytes": sum(e.get("size") or 0 for e in index.values() if e.get("path")),
+                "file_ids": sum(1 for e in index.values() if e.get("file_id")),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+media_cache = MediaCache()
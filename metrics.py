@@ -0,0 +1,221 @@
+"""Métricas del bot en formato Prometheus.
+
+Registro mínimo de contadores, histogramas y gauges (thread-safe, sin
+dependencias) y un servidor HTTP local que los expone en /metrics. Los gauges
+pueden ser funciones que se evalúan al momento del scrape (cola de descargas,
+drivers activos...).
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Puerto del endpoint /metrics (vacío o 0 = desactivado)
+METRICS_PORT = int(os.getenv("METRICS_PORT") or 0)
+# Dirección donde escucha (default solo local)
+METRICS_HOST = os.getenv("METRICS_HOST") or "127.0.0.1"
+
+# Buckets en segundos: de renders de PDF (décimas) a descargas largas (minutos)
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels_str(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_labels_str(self.labelnames, k)} {v}" for k, v in items]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [cuentas por bucket, suma, cantidad]
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entrada = self._values.get(key)
+            if entrada is None:
+                entrada = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if value <= limite:
+                    entrada[0][i] += 1
+            entrada[1] += value
+            entrada[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observa la duración del bloque (también si lanza una excepción)"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - inicio, **labels)
+
+    def render(self):
+        with self._lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._values.items()]
+        lineas = self.header()
+        nombres = self.labelnames + ("le",)
+        for key, (cuentas, suma, cantidad) in items:
+            for limite, cuenta in zip(self.buckets, cuentas):
+                lineas.append(f"{self.name}_bucket{_labels_str(nombres, key + (limite,))} {cuenta}")
+            lineas.append(f"{self.name}_bucket{_labels_str(nombres, key + ('+Inf',))} {cantidad}")
+            lineas.append(f"{self.name}_sum{_labels_str(self.labelnames, key)} {suma}")
+            lineas.append(f"{self.name}_count{_labels_str(self.labelnames, key)} {cantidad}")
+        return lineas
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help, fn=None):
+        super().__init__(name, help)
+        self.fn = fn
+        self._value = 0
+
+    def set(self, value):
+        self._value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def render(self):
+        try:
+            value = self.fn() if self.fn else self._value
+        except Exception:
+            return []
+        return self.header() + [f"{self.name} {value}"]
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            # Registrar dos veces el mismo nombre devuelve la métrica existente
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, fn=None):
+        """Gauge; si se pasa fn, el valor se calcula en cada scrape"""
+        gauge = self._register(Gauge(name, help, fn))
+        if fn is not None:
+            gauge.fn = fn
+        return gauge
+
+    def render(self):
+        with self._lock:
+            metricas = list(self._metrics.values())
+        lineas = []
+        for metrica in metricas:
+            lineas.extend(metrica.render())
+        return "\n".join(lineas) + "\n"
+
+registry = Registry()
+counter = registry.counter
+histogram = registry.histogram
+gauge = registry.gauge
+
+# Métricas compartidas por los pipelines de presupuestos y descargas
+stage_seconds = histogram(
+    "presugen_stage_seconds", "Duración de cada etapa de un pipeline", ("pipeline", "stage")
+)
+stage_errors = counter(
+    "presugen_stage_errors_total", "Etapas que terminaron con error", ("pipeline", "stage")
+)
+
+@contextmanager
+def track(pipeline, stage):
+    """Mide una etapa: duración en el histograma y, si falla, suma al contador de errores"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        stage_errors.inc(pipeline=pipeline, stage=stage)
+        raise
+    finally:
+        stage_seconds.observe(time.perf_counter() - inicio, pipeline=pipeline, stage=stage)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        data = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+_server = None
+
+def start_server(port=METRICS_PORT, host=METRICS_HOST):
+    """Levanta el endpoint /metrics en un thread (no hace nada si port es 0)"""
+    global _server
+    if not port or _server is not None:
+        return _server
+    _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+    return _server
+
+def stop_server():
+    global _server
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
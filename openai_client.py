@@ -1,49 +1,158 @@
-from openai import OpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+import asyncio
+import httpx
 import json
-from pydantic import BaseModel
+import logging
+from budget_model import Budget
 from dotenv import load_dotenv
 import os
+import time
+from prompt_compaction import compact_history
+from response_cache import make_key
+import metrics
+
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-client = OpenAI(
+# Máximo de completions simultáneas contra OpenAI
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY") or 10)
+# Timeout (segundos) por request a OpenAI
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT") or 60)
+
+# Cliente async compartido: reutiliza conexiones HTTP (keep-alive) entre usuarios
+client = AsyncOpenAI(
     api_key=os.getenv("OPENAI_API_KEY"),
-    base_url=os.getenv("OPENAI_BASE_URL") or "https://api.openai.com/v1"
+    base_url=os.getenv("OPENAI_BASE_URL") or "https://api.openai.com/v1",
+    timeout=OPENAI_TIMEOUT,
+    http_client=DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONCURRENCY,
+            max_keepalive_connections=OPENAI_MAX_CONCURRENCY,
+        )
+    ),
 )
 
-class Budget(BaseModel):
-    pdf_title: str
-    content: str
+# Limita cuántas completions corren a la vez; el resto espera su turno sin bloquear el event loop
+_semaforo = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
 
-def generate_markdown(historial):
-    try:
-        prompt = [
-            {"role": "system", "content": (
-                "Sos un asistente que genera presupuestos y devuelve un JSON estructurado. El formato del JSON debe ser:\n"
-                "{\n  \"pdf_title\": \"[título del PDF]\",\n  \"content\": \"[contenido en Markdown]\"\n}\n\n"
-                "El título del PDF (`pdf_title`) debe ser la dirección mencionada en el mensaje del usuario (si existe), "
-                "de lo contrario debe ser el nombre del/los propietario/s. En ultima instancia, debe ser \"Presupuesto\". El contenido (`content`) debe estar en Markdown con este formato de EJEMPLO:\n\n"
-                "**Fecha:** [fecha]\n\n**Propietaria:** [nombre]\n\n**Dirección:** [dirección]\n\n"
-                "**Contacto:** [contacto]\n\n---\n\n### **Presupuesto por Mano de Obra**\n\n"
-                "### **Trabajos a Realizar:**\n\n1. [trabajo 1]\n2. [trabajo 2]\n...\n\n---\n\n"
-                "### **Costo Total del Proyecto:** $[monto]\n\n---\n\n### **Materiales Aproximados:**\n\n- [material 1]\n- [material 2]\n...\n\n"
-                "Todo campo faltante, ya sea propietario, contacto, dirección, trabajos a realizar, materiales aproximados, etc... deben ser OMITIDOS."
-                "Si falta el contacto, no envies: Contacto: [Contacto]. Simplemente no envies el campo."
-                "Si hay información extra, debe ser agregada de manera ordenada y estructurada, de la manera mas conveniente para el usuario."
-                "No debes de seguir TODO al pie de la letra ya que habran distintas formas de presentar la información."
-                "Tenes libertad para agregar/quitar/modificar y reestructurar el contenido segun sientas que es necesario, lo importante es mantener el formato y la estructura."
-                "Tomá el mensaje del usuario y estructuralo en este formato JSON. Si es una modificación, ajustá el presupuesto anterior según las instrucciones."
-            )}
-        ] + historial
+MODEL = "gpt-4o-mini"
+
+openai_requests = metrics.counter(
+    "presugen_openai_requests_total", "Completions pedidas a OpenAI", ("mode", "result")
+)
+openai_tokens = metrics.counter("presugen_openai_tokens_total", "Tokens informados por OpenAI", ("kind",))
+# Espera por un lugar en el semáforo antes de llamar a OpenAI
+openai_wait = metrics.histogram("presugen_openai_semaphore_wait_seconds", "Espera por el semáforo de OpenAI")
+
+# Tokens estimados del historial antes y después de compactar (acumulados)
+compaction_stats = {"calls": 0, "tokens_before": 0, "tokens_after": 0}
+
+SYSTEM_PROMPT = (
+    "Sos un asistente que genera presupuestos y devuelve un JSON estructurado. El formato del JSON debe ser:\n"
+    "{\n  \"pdf_title\": \"[título del PDF]\",\n  \"content\": \"[contenido en Markdown]\"\n}\n\n"
+    "El título del PDF (`pdf_title`) debe ser la dirección mencionada en el mensaje del usuario (si existe), "
+    "de lo contrario debe ser el nombre del/los propietario/s. En ultima instancia, debe ser \"Presupuesto\". El contenido (`content`) debe estar en Markdown con este formato de EJEMPLO:\n\n"
+    "**Fecha:** [fecha]\n\n**Propietaria:** [nombre]\n\n**Dirección:** [dirección]\n\n"
+    "**Contacto:** [contacto]\n\n---\n\n### **Presupuesto por Mano de Obra**\n\n"
+    "### **Trabajos a Realizar:**\n\n1. [trabajo 1]\n2. [trabajo 2]\n...\n\n---\n\n"
+    "### **Costo Total del Proyecto:** $[monto]\n\n---\n\n### **Materiales Aproximados:**\n\n- [material 1]\n- [material 2]\n...\n\n"
+    "Todo campo faltante, ya sea propietario, contacto, dirección, trabajos a realizar, materiales aproximados, etc... deben ser OMITIDOS."
+    "Si falta el contacto, no envies: Contacto: [Contacto]. Simplemente no envies el campo."
+    "Si hay información extra, debe ser agregada de manera ordenada y estructurada, de la manera mas conveniente para el usuario."
+    "No debes de seguir TODO al pie de la letra ya que habran distintas formas de presentar la información."
+    "Tenes libertad para agregar/quitar/modificar y reestructurar el contenido segun sientas que es necesario, lo importante es mantener el formato y la estructura."
+    "Tomá el mensaje del usuario y estructuralo en este formato JSON. Si es una modificación, ajustá el presupuesto anterior según las instrucciones."
+)
+
+def build_prompt(historial):
+    """System prompt + historial compactado (lo que efectivamente se envía al modelo).
 
+    Se arma una sola vez por pedido y sirve tanto para la key de cache como para
+    la completion. Devuelve (prompt, tokens_antes, tokens_despues).
+    """
+    # Compactar: último presupuesto + instrucción nueva (+ resumen) dentro del presupuesto de tokens
+    historial, tokens_antes, tokens_despues = compact_history(historial)
+    compaction_stats["calls"] += 1
+    compaction_stats["tokens_before"] += tokens_antes
+    compaction_stats["tokens_after"] += tokens_despues
+    logger.debug(
+        f"Prompt: historial {tokens_antes} -> {tokens_despues} tokens (estimados)",
+        extra={"tokens_before": tokens_antes, "tokens_after": tokens_despues},
+    )
+    return [{"role": "system", "content": SYSTEM_PROMPT}] + historial, tokens_antes, tokens_despues
+
+def prompt_key(prompt):
+    """Key de cache del pedido: hash del prompt normalizado y el modelo"""
+    return make_key(MODEL, prompt)
+
+async def generate_markdown(prompt):
+    """Genera el presupuesto a partir del prompt armado con build_prompt"""
+    try:
         # Nueva sintaxis con response_format para forzar JSON
-        response = client.beta.chat.completions.parse(
-            model="gpt-4o-mini",
-            messages=prompt,
-            max_tokens=5000,
-            response_format=Budget  # Forzamos JSON estructurado
-        )
+        with openai_wait.time():
+            await _semaforo.acquire()
+        try:
+            with metrics.track("openai", "parse"):
+                response = await client.beta.chat.completions.parse(
+                    model=MODEL,
+                    messages=prompt,
+                    max_tokens=5000,
+                    response_format=Budget,  # Forzamos JSON estructurado
+                    timeout=OPENAI_TIMEOUT
+                )
+        finally:
+            _semaforo.release()
+        if response.usage:
+            logger.debug(f"prompt_tokens={response.usage.prompt_tokens}")
+            openai_tokens.inc(response.usage.prompt_tokens, kind="prompt")
+            openai_tokens.inc(response.usage.completion_tokens, kind="completion")
         json_response = json.loads(response.choices[0].message.content.strip())
+        openai_requests.inc(mode="parse", result="ok")
         return json_response
     except Exception as e:
-        raise Exception(f"Error al generar Markdown con OpenAI: {str(e)}")
\ No newline at end of file
+        openai_requests.inc(mode="parse", result="error")
+        raise Exception(f"Error al generar Markdown con OpenAI: {str(e)}")
+
+async def generate_markdown_stream(prompt, on_update=None):
+    """Igual que generate_markdown pero con streaming.
+
+    on_update(content_parcial) es una corrutina que recibe el Markdown generado
+    hasta el momento. Devuelve el JSON apenas el modelo termina el contenido
+    estructurado, sin esperar el cierre del stream.
+    """
+    try:
+        inicio = time.perf_counter()
+
+        with openai_wait.time():
+            await _semaforo.acquire()
+        try:
+            with metrics.track("openai", "stream"):
+                async with client.beta.chat.completions.stream(
+                    model=MODEL,
+                    messages=prompt,
+                    max_tokens=5000,
+                    response_format=Budget,
+                    timeout=OPENAI_TIMEOUT
+                ) as stream:
+                    primer_token = True
+                    async for event in stream:
+                        if event.type == "content.delta":
+                            if primer_token:
+                                # Tiempo hasta el primer token: latencia percibida por el usuario
+                                metrics.stage_seconds.observe(
+                                    time.perf_counter() - inicio, pipeline="openai", stage="first_token"
+                                )
+                                primer_token = False
+                            parcial = event.parsed.get("content") if isinstance(event.parsed, dict) else None
+                            if on_update and parcial:
+                                await on_update(parcial)
+                        elif event.type == "content.done":
+                            openai_requests.inc(mode="stream", result="ok")
+                            return json.loads(event.content.strip())
+        finally:
+            _semaforo.release()
+        raise Exception("El stream terminó sin contenido")
+    except Exception as e:
+        openai_requests.inc(mode="stream", result="error")
+        raise Exception(f"Error al generar Markdown con OpenAI: {str(e)}")
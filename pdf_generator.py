@@ -1,20 +1,70 @@
 from markdown import markdown
+import io
+import os
+import tempfile
 import weasyprint
+from weasyprint.text.fonts import FontConfiguration
 from config import CSS_ESTILO
+from pdf_service import TEMP_PREFIX, pdf_filename
 
-def generate_pdf(json_data, output_file="presupuesto.pdf"):
+# Stylesheet y configuración de fuentes: se construyen una vez por proceso y se reutilizan
+_font_config = None
+_stylesheet = None
+
+def _offline_url_fetcher(url, *args, **kwargs):
+    """Solo permite recursos locales: el render nunca sale a la red"""
+    if not url.startswith(("file:", "data:")):
+        raise ValueError(f"Recurso remoto bloqueado: {url}")
+    return weasyprint.default_url_fetcher(url, *args, **kwargs)
+
+def load_stylesheet():
+    """Parsea CSS_ESTILO y registra las fuentes locales (una sola vez)"""
+    global _font_config, _stylesheet
+    if _stylesheet is None:
+        _font_config = FontConfiguration()
+        _stylesheet = weasyprint.CSS(
+            string=CSS_ESTILO,
+            font_config=_font_config,
+            url_fetcher=_offline_url_fetcher
+        )
+    return _stylesheet, _font_config
+
+def build_html(json_data):
+    """Construye el HTML del presupuesto a partir del JSON"""
+    content = json_data["content"]
+    return "<h1>Presupuesto</h1>" + markdown(content)
+
+def _document(json_data):
+    stylesheet, font_config = load_stylesheet()
+    html = weasyprint.HTML(string=build_html(json_data), url_fetcher=_offline_url_fetcher)
+    return html, stylesheet, font_config
+
+def render_pdf(json_data):
+    """Renderiza el presupuesto y devuelve el PDF en bytes"""
+    try:
+        html, stylesheet, font_config = _document(json_data)
+        buffer = io.BytesIO()
+        html.write_pdf(buffer, stylesheets=[stylesheet], font_config=font_config)
+        return buffer.getvalue()
+    except Exception as e:
+        raise Exception(f"Error al generar el PDF: {str(e)}")
+
+def warm_up():
+    """Fuerza la carga de WeasyPrint, Pango y las fuentes con un render mínimo"""
+    render_pdf({"pdf_title": "warmup", "content": "**Warm up**"})
+
+def generate_pdf(json_data, output_dir=None):
+    """Renderiza el presupuesto a un archivo temporal único y devuelve su ruta.
+
+    El llamador es responsable de borrar el archivo (ver pdf_service.render_to_disk).
+    """
+    fd, pdf_file = tempfile.mkstemp(prefix=TEMP_PREFIX, suffix=".pdf", dir=output_dir)
     try:
-        # Extraemos pdf_title y content del JSON
-        pdf_title = json_data["pdf_title"]
-        content = json_data["content"]
-
-        # Si no existe pdf_title, lo seteamos como "Presupuesto"
-        if not pdf_title:
-            pdf_title = "Presupuesto"
-        
-        # Construimos el HTML con el título dinámico
-        html = CSS_ESTILO + "<h1>Presupuesto</h1>" + markdown(content)  # Cambié markdown_text por content
-        weasyprint.HTML(string=html).write_pdf(pdf_title+'.pdf')
-        return pdf_title+'.pdf'
+        html, stylesheet, font_config = _document(json_data)
+        with os.fdopen(fd, "wb") as file:
+            html.write_pdf(file, stylesheets=[stylesheet], font_config=font_config)
+        return pdf_file
     except Exception as e:
-        raise Exception(f"Error al generar el PDF: {str(e)}")
\ No newline at end of file
+        if os.path.exists(pdf_file):
+            os.remove(pdf_file)
+        raise Exception(f"Error al generar el PDF: {str(e)}")
@@ -0,0 +1,160 @@
+"""Servicio de renderizado de PDFs en un pool de procesos.
+
+WeasyPrint es CPU-bound: renderizar dentro del handler congela el event loop
+y usa un solo core. Acá los renders corren en procesos worker "calientes"
+(WeasyPrint, el stylesheet y las fuentes ya cargados) y el handler solo
+espera el resultado en bytes.
+"""
+import asyncio
+import glob
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Cantidad de procesos worker (default: un worker por core)
+PDF_WORKERS = int(os.getenv("PDF_WORKERS") or os.cpu_count() or 1)
+# Máximo de renders en cola + en curso; por encima se rechaza el trabajo
+PDF_QUEUE_SIZE = int(os.getenv("PDF_QUEUE_SIZE") or PDF_WORKERS * 4)
+
+# "memory" (default): el PDF viaja en bytes; "disk": se escribe a un archivo temporal único
+PDF_OUTPUT_MODE = (os.getenv("PDF_OUTPUT_MODE") or "memory").lower()
+# Carpeta de los PDFs temporales en modo disco (propia del bot, no la temporal compartida)
+PDF_OUTPUT_DIR = os.getenv("PDF_OUTPUT_DIR") or os.path.join(tempfile.gettempdir(), "presugen-pdfs")
+# Al arrancar solo se borran los temporales más viejos que esto: los recientes pueden ser de otra instancia
+TEMP_MAX_AGE = 3600
+
+_executor = None
+_cupos = None
+_en_curso = 0
+
+metrics.gauge("presugen_pdf_inflight", "Renders de PDF en cola o en curso", lambda: _en_curso)
+pdf_rejected = metrics.counter("presugen_pdf_rejected_total", "Renders rechazados por cola llena")
+
+# Prefijo de los PDFs temporales en modo disco (acá y no en pdf_generator para no cargar WeasyPrint en el proceso del bot)
+TEMP_PREFIX = "presupuesto-"
+
+def pdf_filename(json_data):
+    """Devuelve un nombre de archivo seguro para el PDF a partir del pdf_title"""
+    # Quitamos separadores de ruta y caracteres de control; el título es texto del usuario
+    titulo = re.sub(r'[\\/:*?"<>|\x00-\x1f]+', ' ', json_data.get("pdf_title") or "")
+    titulo = re.sub(r'\s+', ' ', titulo).strip(' .')[:100]
+    # Si no existe pdf_title, lo seteamos como "Presupuesto"
+    return (titulo or "Presupuesto") + ".pdf"
+
+class PdfQueueFull(Exception):
+    """La cola de renders está llena"""
+
+def _init_worker():
+    import pdf_generator
+    pdf_generator.warm_up()
+
+def _render(json_data):
+    import pdf_generator
+    inicio = time.perf_counter()
+    return pdf_generator.render_pdf(json_data), time.perf_counter() - inicio
+
+def _render_to_file(json_data, output_dir):
+    import pdf_generator
+    inicio = time.perf_counter()
+    return pdf_generator.generate_pdf(json_data, output_dir), time.perf_counter() - inicio
+
+def _ping():
+    return os.getpid()
+
+def start():
+    """Levanta el pool de workers (idempotente)"""
+    global _executor, _cupos
+    if _executor is None:
+        # spawn: los workers no heredan sockets ni estado del bot
+        _executor = ProcessPoolExecutor(
+            max_workers=PDF_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+    if _cupos is None:
+        _cupos = asyncio.Semaphore(PDF_QUEUE_SIZE)
+        if PDF_OUTPUT_MODE == "disk":
+            _limpiar_temporales()
+    return _executor
+
+def _descartar_pool(executor):
+    """Descarta un pool roto (un worker murió, p. ej. por OOM) para que start() arme otro"""
+    global _executor
+    if _executor is executor:
+        logger.warning("El pool de PDFs quedó roto; se levanta uno nuevo")
+        executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def _limpiar_temporales():
+    """Borra PDFs temporales que hayan quedado de una ejecución anterior"""
+    os.makedirs(PDF_OUTPUT_DIR, exist_ok=True)
+    limite = time.time() - TEMP_MAX_AGE
+    for path in glob.glob(os.path.join(PDF_OUTPUT_DIR, TEMP_PREFIX + "*.pdf")):
+        try:
+            if os.path.getmtime(path) < limite:
+                os.remove(path)
+        except OSError:
+            pass
+
+async def warm_up():
+    """Arranca todos los workers para que el primer render no pague el costo de inicio"""
+    executor = start()
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(executor, _ping) for _ in range(PDF_WORKERS)))
+
+async def _run(fn, *args):
+    """Corre fn en el pool registrando la espera en cola y el render por separado"""
+    global _en_curso
+    executor = start()
+    if _cupos.locked():
+        pdf_rejected.inc()
+        raise PdfQueueFull("Hay demasiados PDFs en cola")
+    async with _cupos:
+        _en_curso += 1
+        inicio = time.perf_counter()
+        try:
+            with metrics.track("pdf", "total"):
+                loop = asyncio.get_running_loop()
+                try:
+                    result, segundos = await loop.run_in_executor(executor, fn, *args)
+                except BrokenProcessPool:
+                    # Un solo reintento con un pool nuevo: si el render mata al worker otra vez, se informa el error
+                    _descartar_pool(executor)
+                    result, segundos = await loop.run_in_executor(start(), fn, *args)
+        finally:
+            _en_curso -= 1
+    # El worker informa cuánto tardó el render; el resto fue espera en la cola del pool
+    metrics.stage_seconds.observe(segundos, pipeline="pdf", stage="render")
+    metrics.stage_seconds.observe(max(0.0, time.perf_counter() - inicio - segundos), pipeline="pdf", stage="queue_wait")
+    return result
+
+async def render(json_data):
+    """Renderiza el presupuesto en el pool y devuelve el PDF en bytes"""
+    return await _run(_render, json_data)
+
+@asynccontextmanager
+async def render_to_disk(json_data, output_dir=None):
+    """Renderiza a un archivo temporal único y lo borra al salir del bloque"""
+    pdf_path = await _run(_render_to_file, json_data, output_dir or PDF_OUTPUT_DIR)
+    try:
+        yield pdf_path
+    finally:
+        if os.path.exists(pdf_path):
+            os.remove(pdf_path)
+
+def shutdown():
+    """Detiene el pool esperando los renders en curso"""
+    global _executor, _cupos
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+        _cupos = None
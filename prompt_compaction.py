@@ -0,0 +1,75 @@
+"""Compactación del historial antes de mandarlo a OpenAI.
+
+Después de varias rondas de "modificar el presupuesto anterior" el historial
+lleva varios presupuestos completos. Para generar el siguiente alcanza con el
+último presupuesto, la instrucción nueva y, si entra, un resumen corto de los
+pedidos anteriores; todo dentro de PROMPT_TOKEN_BUDGET tokens.
+"""
+import os
+
+# Tokens máximos del historial compactado (sin contar el system prompt)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET") or 6000)
+# Caracteres por pedido anterior dentro del resumen
+SUMMARY_ITEM_CHARS = 200
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")  # Encoding de gpt-4o / gpt-4o-mini
+except Exception:
+    _encoding = None
+
+def count_tokens(messages):
+    """Tokens aproximados de una lista de mensajes (tiktoken si está instalado, si no ~4 caracteres por token)"""
+    total = 0
+    for message in messages:
+        content = message["content"]
+        total += 4  # Overhead por mensaje (rol y separadores)
+        total += len(_encoding.encode(content)) if _encoding else len(content) // 4 + 1
+    return total
+
+def _summary(messages, max_tokens):
+    """Resumen de los pedidos anteriores del usuario que entra en max_tokens"""
+    pedidos = [m["content"] for m in messages if m["role"] == "user"]
+    lineas = []
+    for pedido in pedidos:
+        pedido = " ".join(pedido.split())
+        if len(pedido) > SUMMARY_ITEM_CHARS:
+            pedido = pedido[:SUMMARY_ITEM_CHARS] + "…"
+        lineas.append(f"- {pedido}")
+    # Si no entra, se descartan los pedidos más viejos primero
+    while lineas:
+        resumen = {"role": "user", "content": "Pedidos anteriores (resumen):\n" + "\n".join(lineas)}
+        if count_tokens([resumen]) <= max_tokens:
+            return resumen
+        lineas.pop(0)
+    return None
+
+def compact_history(historial, budget=PROMPT_TOKEN_BUDGET):
+    """Devuelve (historial_compactado, tokens_antes, tokens_despues)"""
+    antes = count_tokens(historial)
+    if antes <= budget or len(historial) <= 2:
+        return list(historial), antes, antes
+
+    # Último presupuesto generado y todo lo que vino después
+    ultimo_asistente = max(
+        (i for i, m in enumerate(historial) if m["role"] == "assistant"), default=None
+    )
+    if ultimo_asistente is None:
+        recientes = [historial[-1]]
+        anteriores = historial[:-1]
+    else:
+        recientes = [historial[ultimo_asistente]]
+        posteriores = historial[ultimo_asistente + 1:]
+        # Instrucción más nueva; las intermedias (sin respuesta) van al resumen
+        if posteriores:
+            recientes.append(posteriores[-1])
+        anteriores = historial[:ultimo_asistente] + posteriores[:-1]
+
+    compactado = recientes
+    restante = budget - count_tokens(recientes)
+    if anteriores and restante > 0:
+        resumen = _summary(anteriores, restante)
+        if resumen:
+            compactado = [resumen] + recientes
+
+    return compactado, antes, count_tokens(compactado)
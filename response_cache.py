@@ -0,0 +1,100 @@
+"""Cache de respuestas para pedidos de presupuesto idénticos.
+
+Cuando un usuario reenvía el mismo mensaje (después de un error o timeout) la
+respuesta se sirve desde acá: JSON del Budget y PDF ya renderizado, sin otra
+completion ni otro render. La key es un hash del prompt normalizado (system
+prompt, historial y modelo); LRU acotado por tamaño, con TTL y contadores.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Tamaño máximo de la cache (MB, sumando los PDFs); 0 la desactiva
+RESPONSE_CACHE_MAX_MB = float(os.getenv("RESPONSE_CACHE_MAX_MB") or 64)
+# Segundos que vive una respuesta en la cache
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL") or 3600)
+
+def _normalize(messages):
+    """Espacios colapsados y sin reenvíos.
+
+    Un reenvío tras un error deja el mismo mensaje de usuario dos veces seguidas
+    ([X, X]); uno tras una respuesta que no llegó deja [X, A, X]. Los dos
+    equivalen al pedido original [X].
+    """
+    normalizados = []
+    for message in messages:
+        content = " ".join(message["content"].split())
+        actual = {"role": message["role"], "content": content}
+        if normalizados and message["role"] == "user" and normalizados[-1] == actual:
+            continue
+        normalizados.append(actual)
+    if len(normalizados) >= 3 and normalizados[-1]["role"] == "user" \
+            and normalizados[-2]["role"] == "assistant" and normalizados[-3] == normalizados[-1]:
+        normalizados = normalizados[:-2]
+    return normalizados
+
+def make_key(model, messages):
+    payload = json.dumps({"model": model, "messages": _normalize(messages)}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    def __init__(self, max_bytes=RESPONSE_CACHE_MAX_MB * 1024 * 1024, ttl=RESPONSE_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def get(self, key):
+        """Devuelve (json_response, pdf_bytes | None) o None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry["created"] > self.ttl:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["json"], entry["pdf"]
+
+    def put(self, key, json_response, pdf_bytes=None):
+        if not self.enabled:
+            return
+        size = len(json.dumps(json_response)) + len(pdf_bytes or b"")
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {"json": json_response, "pdf": pdf_bytes, "size": size, "created": time.monotonic()}
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry["size"]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+response_cache = ResponseCache()
@@ -0,0 +1,53 @@
+"""Medición de la duración de cada paso de un trabajo.
+
+Genera un reporte estructurado por trabajo (qué paso tardó cuánto y si
+terminó bien) para saber qué paso domina la latencia en producción. Cada
+paso también se registra en las métricas del pipeline.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from metrics import stage_errors, stage_seconds
+
+logger = logging.getLogger(__name__)
+
+class StepTimer:
+    def __init__(self, job_id=None, pipeline="download", **labels):
+        self.job_id = job_id
+        self.pipeline = pipeline
+        self.labels = labels
+        self.steps = []
+        self._inicio = time.perf_counter()
+
+    @contextmanager
+    def step(self, name):
+        """Mide el bloque como el paso `name` (queda registrado aunque falle)"""
+        inicio = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            segundos = time.perf_counter() - inicio
+            self.steps.append({
+                'step': name,
+                'seconds': round(segundos, 3),
+                'ok': ok,
+            })
+            stage_seconds.observe(segundos, pipeline=self.pipeline, stage=name)
+            if not ok:
+                stage_errors.inc(pipeline=self.pipeline, stage=name)
+
+    def report(self):
+        total = round(time.perf_counter() - self._inicio, 3)
+        slowest = max(self.steps, key=lambda s: s['seconds'])['step'] if self.steps else None
+        return {
+            'job_id': self.job_id,
+            **self.labels,
+            'total_seconds': total,
+            'slowest_step': slowest,
+            'steps': list(self.steps),
+        }
+
+    def log(self):
+        logger.info("Tiempos por paso", extra=self.report())
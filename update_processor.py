@@ -0,0 +1,53 @@
+"""Procesamiento concurrente de updates respetando el orden dentro de cada chat.
+
+Con el procesador por defecto de python-telegram-bot los updates se atienden de
+a uno: un PDF lento o una descarga de YouTube demoran a todos los usuarios.
+Este procesador atiende hasta max_concurrent_updates a la vez, pero los updates
+de un mismo chat se encolan detrás del anterior para que los mensajes de un
+usuario se procesen en el orden en que los mandó.
+"""
+import asyncio
+import os
+import sys
+
+from telegram.ext import BaseUpdateProcessor
+
+# Updates atendidos en paralelo (entre chats distintos)
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY") or 32)
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Concurrencia entre chats, orden secuencial dentro de cada chat"""
+
+    def __init__(self, max_concurrent_updates=UPDATE_CONCURRENCY):
+        # process_update (final en BaseUpdateProcessor) toma su semáforo antes de llamar a
+        # do_process_update; ese queda sin límite y el cupo real se toma acá, después del
+        # lock del chat (así no se depende de internos de python-telegram-bot)
+        super().__init__(sys.maxsize)
+        self._cupos = asyncio.BoundedSemaphore(max_concurrent_updates)
+        # chat_id -> [lock, updates que lo usan]; se borra cuando nadie lo usa
+        self._locks = {}
+
+    async def do_process_update(self, update, coroutine):
+        chat = getattr(update, "effective_chat", None)
+        if chat is None:
+            async with self._cupos:
+                await coroutine
+            return
+
+        # El lock del chat se toma antes del cupo global: un usuario que manda
+        # muchos mensajes seguidos no ocupa cupos mientras espera su turno
+        entrada = self._locks.setdefault(chat.id, [asyncio.Lock(), 0])
+        entrada[1] += 1
+        try:
+            async with entrada[0], self._cupos:
+                await coroutine
+        finally:
+            entrada[1] -= 1
+            if not entrada[1]:
+                del self._locks[chat.id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
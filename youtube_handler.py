@@ -1,6 +1,12 @@
+import asyncio
+import json
+import logging
 import os
-import re
+import shutil
 import time
+import uuid
+from types import SimpleNamespace
+from functools import lru_cache
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from selenium import webdriver
@@ -10,35 +16,21 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
-from selenium.common.exceptions import TimeoutException
+from selenium.common.exceptions import TimeoutException, NoSuchElementException, StaleElementReferenceException
 from urllib.parse import urlparse
+import requests
+from driver_pool import DriverPool, set_download_dir
+from download_watch import wait_for_download, FileTooLarge
+from step_timing import StepTimer
+import metrics
+from media_cache import media_cache, extract_video_id
+from http_download import stream_download
+from yt_jobs import DownloadJob, JobCancelled, QueueFull, DOWNLOADS_DIR, scheduler
+from youtube_links import pending_links, video_url
+from admission import admission, AdmissionRejected, DOWNLOAD
+from job_store import job_store, DONE, FAILED
 
-def is_youtube_url(url: str) -> bool:
-    """Verifica si la URL es de YouTube"""
-    youtube_regex = r'(https?://)?(www\.)?(youtube|youtu|youtube-nocookie)\.(com|be)/(watch\?v=|embed/|v/|.+\?v=)?([^&=%\?]{11})'
-    return bool(re.match(youtube_regex, url))
-
-async def handle_youtube_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Maneja el link de YouTube mostrando botones interactivos"""
-    url = update.message.text.strip()
-    
-    # Guardar la URL en el contexto del usuario
-    context.user_data['youtube_url'] = url
-    
-    # Crear botones interactivos
-    keyboard = [
-        [
-            InlineKeyboardButton("🎵 Solo Audio (MP3)", callback_data='yt_audio'),
-            InlineKeyboardButton("🎬 Video (MP4)", callback_data='yt_video')
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await update.message.reply_text(
-        "🎯 Detecté un link de YouTube!\n\n"
-        "¿Qué querés descargar?",
-        reply_markup=reply_markup
-    )
+logger = logging.getLogger(__name__)
 
 async def handle_youtube_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Maneja la selección del usuario (audio o video)"""
@@ -47,24 +39,104 @@ async def handle_youtube_callback(update: Update, context: ContextTypes.DEFAULT_
     
     choice = query.data
     
+    # Cancelar una descarga (o un lote) en cola o en curso
+    if choice.startswith('yt_cancel:'):
+        job_id = choice.split(':', 1)[1]
+        espera = _admission_waits.get(job_id)
+        if espera:
+            # Todavía esperando lugar en el carril de descargas
+            if espera.user_id in (None, query.from_user.id):
+                espera.cancelled = True
+                espera.task.cancel()
+                await query.edit_message_text("❌ Descarga cancelada.")
+            return
+        batch = _batches.get(job_id)
+        if batch:
+            if batch.user_id in (None, query.from_user.id):
+                batch.cancel()
+            return
+        job = scheduler.get(job_id)
+        if job and job.user_id not in (None, query.from_user.id):
+            return
+        if job:
+            scheduler.cancel(job.id)
+        await query.edit_message_text("❌ Descarga cancelada.")
+        return
+
     # Manejar cancelación
     if choice == 'yt_cancel':
         await query.edit_message_text("❌ Descarga cancelada.")
         return
     
-    # Obtener la URL guardada
-    url = context.user_data.get('youtube_url')
-    if not url:
+    if choice not in ('yt_audio', 'yt_video'):
+        return
+    format_type = 'mp3' if choice == 'yt_audio' else 'mp4'
+
+    # Los videos quedaron asociados a este mensaje del menú
+    video_ids = pending_links(context, query.message)
+    if not video_ids:
         await query.edit_message_text("❌ Error: No se encontró la URL. Por favor, enviá el link de nuevo.")
         return
-    
-    # Actualizar el mensaje para mostrar progreso
-    if choice == 'yt_audio':
-        await query.edit_message_text("🎵 Procesando audio... Por favor esperá (puede tardar 30-60 seg).")
-        await download_audio(query, context, url)
-    elif choice == 'yt_video':
-        await query.edit_message_text("🎬 Procesando video... Por favor esperá (puede tardar 30-60 seg).")
-        await download_video(query, context, url)
+    urls = [video_url(video_id) for video_id in video_ids]
+
+    # Las descargas van por su carril: nunca le quitan lugar a los presupuestos
+    try:
+        if len(urls) > 1:
+            await download_batch(query, context, urls, format_type)
+        else:
+            await download_single(query, context, urls[0], format_type)
+    except AdmissionRejected as e:
+        await query.edit_message_text(f"⏳ {e}")
+
+# Descargas esperando lugar en el carril de admisión, por id de trabajo (para Cancelar)
+_admission_waits = {}
+
+async def download_single(query, context: ContextTypes.DEFAULT_TYPE, url: str, format_type: str):
+    """Espera lugar en el carril de descargas mostrando la cola y el botón Cancelar, y descarga"""
+    job_id = uuid.uuid4().hex[:12]
+    cancel_markup = InlineKeyboardMarkup([
+        [InlineKeyboardButton("❌ Cancelar", callback_data=f'yt_cancel:{job_id}')]
+    ])
+    # El menú se reemplaza enseguida: un segundo clic no repite el pedido
+    await query.edit_message_text("⏳ Preparando la descarga...", reply_markup=cancel_markup)
+
+    async def on_queued(posicion):
+        try:
+            await query.edit_message_text(
+                f"⏳ En cola (posición {posicion})...\n\nHay muchas descargas en curso, ya sigue la tuya.",
+                reply_markup=cancel_markup
+            )
+        except Exception:
+            pass
+
+    espera = SimpleNamespace(
+        task=asyncio.ensure_future(admission.acquire(DOWNLOAD, query.from_user.id, on_queued=on_queued)),
+        user_id=query.from_user.id,
+        cancelled=False,
+    )
+    _admission_waits[job_id] = espera
+    inicio = time.perf_counter()
+    try:
+        await espera.task
+    except asyncio.CancelledError:
+        if espera.cancelled:
+            return  # Cancelado por el usuario antes de empezar
+        raise
+    finally:
+        _admission_waits.pop(job_id, None)
+    metrics.stage_seconds.observe(time.perf_counter() - inicio, pipeline='admission', stage=DOWNLOAD)
+    if espera.cancelled:
+        # Se canceló justo cuando le tocaba el lugar
+        admission.release(DOWNLOAD)
+        return
+
+    try:
+        if format_type == 'mp3':
+            await download_audio(query, context, url, job_id=job_id)
+        else:
+            await download_video(query, context, url, job_id=job_id)
+    finally:
+        admission.release(DOWNLOAD)
 
 def _parse_proxy_from_env():
     """Lee PROXY_FULL del entorno y devuelve un dict con partes o None si no hay proxy.
@@ -97,6 +169,19 @@ def _parse_proxy_from_env():
     except Exception:
         return None
 
+# Límite de Telegram para archivos enviados por bots
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+
+# Bajar el archivo final por HTTP en lugar de usar el gestor de descargas de Chrome
+YT_DIRECT_DOWNLOAD = (os.getenv('YT_DIRECT_DOWNLOAD') or '1') != '0'
+
+@lru_cache(maxsize=1)
+def _chromedriver_path():
+    """Resuelve la ruta de chromedriver una sola vez (CHROMEDRIVER_PATH o webdriver-manager)"""
+    path = os.getenv('CHROMEDRIVER_PATH') or ChromeDriverManager().install()
+    logger.debug(f"chromedriver: {path}")
+    return path
+
 def create_driver(download_path=None):
     """Crea un driver de Chrome para scraping con descargas configuradas"""
     try:
@@ -105,7 +190,7 @@ def create_driver(download_path=None):
             os.makedirs(download_path, exist_ok=True)
             download_path = os.path.abspath(download_path)
         else:
-            download_path = os.path.abspath('downloads')
+            download_path = DOWNLOADS_DIR
             os.makedirs(download_path, exist_ok=True)
         
         chrome_options = Options()
@@ -126,6 +211,11 @@ def create_driver(download_path=None):
             "safebrowsing.enabled": True
         }
         chrome_options.add_experimental_option("prefs", prefs)
+
+        # Log de red de Chrome: permite capturar la URL final del medio (descarga directa)
+        if YT_DIRECT_DOWNLOAD:
+            chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+            chrome_options.add_experimental_option('perfLoggingPrefs', {'enableNetwork': True, 'enablePage': False})
         
         # Proxy (opcional)
         proxy_cfg = _parse_proxy_from_env()
@@ -144,219 +234,562 @@ def create_driver(download_path=None):
                     },
                 }
 
-                service = Service(ChromeDriverManager().install())
+                service = Service(_chromedriver_path())
                 driver = wire_webdriver.Chrome(service=service, options=chrome_options, seleniumwire_options=seleniumwire_options)
 
                 # Log sin contraseña
                 masked = f"{proxy_cfg['protocol']}://{proxy_cfg['username']}:****@{proxy_cfg['server']}:{proxy_cfg['port']}"
-                print(f"[DEBUG] Driver con proxy configurado: {masked}")
+                logger.debug(f"Driver con proxy configurado: {masked}")
             except Exception as e:
-                print(f"[WARN] No se pudo inicializar con proxy, usando sin proxy: {e}")
-                service = Service(ChromeDriverManager().install())
+                logger.warning(f"No se pudo inicializar con proxy, usando sin proxy: {e}")
+                service = Service(_chromedriver_path())
                 driver = webdriver.Chrome(service=service, options=chrome_options)
         else:
-            service = Service(ChromeDriverManager().install())
+            service = Service(_chromedriver_path())
             driver = webdriver.Chrome(service=service, options=chrome_options)
         
-        print(f"[DEBUG] Driver creado con carpeta de descargas: {download_path}")
+        logger.debug(f"Driver creado con carpeta de descargas: {download_path}")
         return driver
         
     except Exception as e:
-        print(f"[ERROR] No se pudo crear el driver: {e}")
+        logger.error(f"No se pudo crear el driver: {e}")
         return None
 
-def wait_for_download_complete(download_dir, timeout=360):
-    """Espera a que termine la descarga en el directorio"""
-    print(f"[DEBUG] Esperando descarga en: {download_dir}")
-    
-    for seconds in range(timeout):
-        files = os.listdir(download_dir)
-        
-        # Verificar si hay archivos descargándose (.crdownload o .tmp)
-        downloading = any(f.endswith(('.crdownload', '.tmp')) for f in files)
-        
-        if downloading:
-            if seconds % 5 == 0:
-                print(f"[DEBUG] Descarga en progreso... ({seconds}s/{timeout}s)")
-        elif files:
-            # No hay descargas en progreso y hay archivos
-            non_temp_files = [f for f in files if not f.endswith(('.crdownload', '.tmp'))]
-            if non_temp_files:
-                # Ordenar por tiempo de modificación (más reciente primero)
-                non_temp_files.sort(
-                    key=lambda x: os.path.getmtime(os.path.join(download_dir, x)),
-                    reverse=True
-                )
-                latest_file = os.path.join(download_dir, non_temp_files[0])
-                print(f"[DEBUG] Descarga completada: {non_temp_files[0]}")
-                return latest_file
-        
-        time.sleep(1)
-    
-    print("[ERROR] Timeout esperando descarga")
+# Drivers de Chrome reutilizados entre descargas
+driver_pool = DriverPool(create_driver)
+metrics.gauge("presugen_drivers_active", "Drivers de Chrome prestados a una descarga", lambda: driver_pool.active)
+
+downloads_total = metrics.counter(
+    "presugen_downloads_total", "Descargas de YouTube por formato y resultado", ("format", "result")
+)
+
+def start_driver_pool():
+    """Resuelve chromedriver y pre-lanza los drivers (bloqueante: llamar desde un thread)"""
+    try:
+        _chromedriver_path()
+        driver_pool.start()
+    except Exception as e:
+        logger.warning(f"No se pudo iniciar el pool de drivers: {e}")
+
+def shutdown_driver_pool():
+    driver_pool.shutdown()
+
+def wait_for_download_complete(download_dir, timeout=360, cancel_event=None, on_progress=None, max_bytes=None):
+    """Espera a que termine la descarga en el directorio (inotify en Linux, polling como respaldo)"""
+    logger.debug(f"Esperando descarga en: {download_dir}")
+    latest_file = wait_for_download(
+        download_dir,
+        timeout=timeout,
+        cancel_event=cancel_event,
+        on_progress=on_progress,
+        cancelled_exc=JobCancelled,
+        max_bytes=max_bytes,
+    )
+    if latest_file:
+        logger.debug(f"Descarga completada: {os.path.basename(latest_file)}")
+        return latest_file
+
+    logger.error("Timeout esperando descarga")
+    return None
+
+# Timeouts (segundos) de cada paso del flujo en y2mate
+MEDIA_URL_TIMEOUT = 20
+PAGE_TIMEOUT = 15
+FORMAT_TIMEOUT = 5
+CONVERT_TIMEOUT = 10
+DOWNLOAD_BUTTON_TIMEOUT = 60
+# Cada cuánto se re-evalúan las condiciones de espera
+WAIT_POLL = 0.25
+
+# Página del conversor (configurable para apuntar a una copia local en los benchmarks)
+Y2MATE_URL = os.getenv('Y2MATE_URL') or 'https://y2mate.nu/4Fiq/'
+ERROR_XPATH = "//*[contains(translate(text(), 'ERROR', 'error'), 'error')]"
+
+def _find_site_error(driver):
+    """Devuelve el texto del banner de error de y2mate, si hay uno visible"""
+    for error_elem in driver.find_elements(By.XPATH, ERROR_XPATH):
+        error_text = error_elem.text.strip()
+        if error_text and len(error_text) > 5:  # Evitar textos muy cortos
+            return error_text
+    return None
+
+MEDIA_TYPES = ('audio/', 'video/', 'application/octet-stream')
+
+def _media_response(log_entries):
+    """Busca en el log de red de Chrome la respuesta con el archivo final"""
+    for entry in log_entries:
+        try:
+            message = json.loads(entry['message'])['message']
+        except (KeyError, ValueError):
+            continue
+        if message.get('method') != 'Network.responseReceived':
+            continue
+        response = message['params']['response']
+        headers = {k.lower(): v for k, v in response.get('headers', {}).items()}
+        mime = (response.get('mimeType') or '').lower()
+        if mime.startswith(MEDIA_TYPES) or 'attachment' in headers.get('content-disposition', '').lower():
+            return response
+    return None
+
+def _media_cookies(driver, url):
+    """Header Cookie que Chrome mandaría al pedir la URL del archivo"""
+    try:
+        cookies = driver.execute_cdp_cmd('Network.getCookies', {'urls': [url]}).get('cookies', [])
+    except Exception:
+        cookies = driver.get_cookies()
+    return "; ".join(f"{c['name']}={c['value']}" for c in cookies)
+
+def _proxies():
+    proxy_cfg = _parse_proxy_from_env()
+    if proxy_cfg and proxy_cfg.get('server'):
+        return {'http': proxy_cfg['full'], 'https': proxy_cfg['full']}
     return None
 
-def download_with_selenium(video_url: str, format_type: str = 'mp3') -> dict:
+def _fallback_name(video_url, format_type):
+    return f"{extract_video_id(video_url) or 'descarga'}.{format_type}"
+
+def _too_large_result(size):
+    return {
+        'success': False,
+        'too_large': True,
+        'size': size,
+        'error': f'El archivo supera el límite de {MAX_UPLOAD_BYTES // (1024*1024)} MB de Telegram',
+    }
+
+def download_with_selenium(video_url: str, format_type: str = 'mp3', download_dir=None, cancel_event=None, on_progress=None, job_id=None, on_media=None) -> dict:
     """
     Descarga el archivo usando Selenium para scrapear y2mate.nu
     format_type: 'mp3' para audio, 'mp4' para video
-    Retorna el path del archivo descargado
+    download_dir: carpeta exclusiva del trabajo (se crea si no existe)
+    cancel_event: threading.Event que, si se activa, aborta la descarga
+    on_progress: callback(bytes) con los bytes descargados hasta el momento
+    on_media: callback(url, headers) con la URL del archivo final (modo directo), para poder retomarla
+    Retorna el path del archivo descargado y, en 'timings', la duración de cada paso
     """
+    timer = StepTimer(job_id, format=format_type)
+    result = _download_with_selenium(video_url, format_type, download_dir, cancel_event, on_progress, on_media, timer)
+    result['timings'] = timer.report()
+    timer.log()
+    metrics.stage_seconds.observe(result['timings']['total_seconds'], pipeline='download', stage='total')
+    if result['success']:
+        resultado = 'ok'
+    elif result.get('cancelled'):
+        resultado = 'cancelled'
+    elif result.get('too_large'):
+        resultado = 'too_large'
+    else:
+        resultado = 'error'
+    downloads_total.inc(format=format_type, result=resultado)
+    return result
+
+def _download_with_selenium(video_url, format_type, download_dir, cancel_event, on_progress, on_media, timer,
+                            direct=YT_DIRECT_DOWNLOAD) -> dict:
     driver = None
-    download_dir = os.path.abspath('downloads')
+    lease = None
+    download_dir = os.path.abspath(download_dir or os.path.join(DOWNLOADS_DIR, 'manual'))
+
+    def check_cancelled():
+        if cancel_event and cancel_event.is_set():
+            raise JobCancelled()
+
+    def wait_until(condition, timeout):
+        """Espera la condición revisando también la cancelación en cada vuelta"""
+        def check(d):
+            check_cancelled()
+            return condition(d)
+        return WebDriverWait(
+            driver, timeout, poll_frequency=WAIT_POLL,
+            ignored_exceptions=(NoSuchElementException, StaleElementReferenceException)
+        ).until(check)
     
     try:
-        print(f"[INFO] Iniciando descarga de {format_type.upper()} desde y2mate.nu...")
+        logger.info(f"Iniciando descarga de {format_type.upper()} desde y2mate.nu...")
+        os.makedirs(download_dir, exist_ok=True)
         
-        # Limpiar directorio de descargas
-        if os.path.exists(download_dir):
-            for file in os.listdir(download_dir):
-                try:
-                    os.remove(os.path.join(download_dir, file))
-                    print(f"[DEBUG] Archivo anterior eliminado: {file}")
-                except:
-                    pass
-        
-        driver = create_driver(download_dir)
-        if not driver:
+        with timer.step('acquire_driver'):
+            lease = driver_pool.acquire(download_dir, timeout=120)
+        if not lease:
             return {'success': False, 'error': 'No se pudo iniciar el navegador'}
+        driver = lease.driver
+        check_cancelled()
         
-        # Navegar a y2mate.nu
-        print("[DEBUG] Navegando a y2mate.nu...")
-        driver.get('https://y2mate.nu/4Fiq/')
-        time.sleep(3)
-        
-        # Paso 1: Encontrar el input y pegar la URL
-        print("[DEBUG] Buscando campo de input...")
+        # Paso 1: Navegar a y2mate.nu y esperar el campo de input
+        logger.debug("Navegando a y2mate.nu...")
         try:
-            url_input = WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.TAG_NAME, 'input'))
-            )
-            print("[DEBUG] Ingresando URL...")
+            with timer.step('open_page'):
+                driver.get(Y2MATE_URL)
+                url_input = wait_until(EC.presence_of_element_located((By.TAG_NAME, 'input')), PAGE_TIMEOUT)
+        except TimeoutException as e:
+            logger.error(f"No se encontró el input: {e}")
+            return {'success': False, 'error': 'No se encontró el campo de entrada'}
+
+        # Paso 2: Pegar la URL y confirmar que el input la tiene
+        logger.debug("Ingresando URL...")
+        with timer.step('enter_url'):
             url_input.clear()
             url_input.send_keys(video_url)
-            time.sleep(1)
-        except Exception as e:
-            print(f"[ERROR] No se encontró el input: {e}")
-            return {'success': False, 'error': 'No se encontró el campo de entrada'}
+            wait_until(lambda d: bool(url_input.get_attribute('value')), FORMAT_TIMEOUT)
         
-        # Paso 2: Si queremos MP4, hacer clic en botón id="f" (toggle mp3/mp4)
+        # Paso 3: Si queremos MP4, hacer clic en botón id="f" (toggle mp3/mp4)
         if format_type == 'mp4':
-            print("[DEBUG] Cambiando a modo MP4...")
+            logger.debug("Cambiando a modo MP4...")
             try:
-                format_button = driver.find_element(By.ID, 'f')
-                driver.execute_script("arguments[0].click();", format_button)
-                time.sleep(1)
-                print("[DEBUG] Modo cambiado a MP4")
+                with timer.step('toggle_format'):
+                    format_button = driver.find_element(By.ID, 'f')
+                    texto_anterior = format_button.text
+                    driver.execute_script("arguments[0].click();", format_button)
+                    # El toggle cambia su texto al pasar de MP3 a MP4
+                    wait_until(
+                        lambda d: 'mp4' in format_button.text.lower() or format_button.text != texto_anterior,
+                        FORMAT_TIMEOUT
+                    )
+                logger.debug("Modo cambiado a MP4")
+            except JobCancelled:
+                raise
             except Exception as e:
-                print(f"[DEBUG] Error cambiando a MP4: {e}")
+                logger.debug(f"Error cambiando a MP4: {e}")
         else:
-            print("[DEBUG] Usando modo MP3 (default)")
-        
-        # Paso 3: Hacer clic en el botón Convert (type="submit")
-        print("[DEBUG] Buscando botón Convert...")
+            logger.debug("Usando modo MP3 (default)")
+
+        # Paso 4: Hacer clic en el botón Convert (type="submit") cuando sea clickeable
+        logger.debug("Buscando botón Convert...")
         try:
-            convert_button = WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, 'button[type="submit"]'))
-            )
-            print("[DEBUG] Haciendo clic en Convert...")
-            driver.execute_script("arguments[0].click();", convert_button)
-            time.sleep(3)
-        except Exception as e:
-            print(f"[ERROR] No se encontró el botón Convert: {e}")
+            with timer.step('convert'):
+                convert_button = wait_until(
+                    EC.element_to_be_clickable((By.CSS_SELECTOR, 'button[type="submit"]')), CONVERT_TIMEOUT
+                )
+                logger.debug("Haciendo clic en Convert...")
+                driver.execute_script("arguments[0].click();", convert_button)
+        except TimeoutException as e:
+            logger.error(f"No se encontró el botón Convert: {e}")
             return {'success': False, 'error': 'No se encontró el botón Convert'}
         
-        # Paso 4: Esperar a que aparezca el botón Download o un error
-        print("[DEBUG] Esperando botón Download...")
-        download_button = None
-        
-        for attempt in range(60):
-            try:
-                # Buscar mensajes de error
-                try:
-                    error_elements = driver.find_elements(By.XPATH, "//*[contains(translate(text(), 'ERROR', 'error'), 'error')]")
-                    for error_elem in error_elements:
-                        error_text = error_elem.text.strip()
-                        if error_text and len(error_text) > 5:  # Evitar textos muy cortos
-                            print(f"[ERROR] Mensaje de error detectado: {error_text}")
-                            return {'success': False, 'error': f'Error del sitio: {error_text}'}
-                except:
-                    pass
-                
-                # Buscar botón Download
-                buttons = driver.find_elements(By.CSS_SELECTOR, 'button[type="button"]')
-                for button in buttons:
-                    if 'download' in button.text.lower():
-                        download_button = button
-                        print(f"[DEBUG] Botón Download encontrado! (intento {attempt + 1})")
-                        break
-                
-                if download_button:
-                    break
-                
-                if attempt % 5 == 0 and attempt > 0:
-                    print(f"[DEBUG] Esperando Download... ({attempt}s/60s)")
-                
-                time.sleep(1)
-            except:
-                time.sleep(1)
-        
-        if not download_button:
-            print("[ERROR] Timeout esperando botón Download")
-            # Intentar capturar cualquier mensaje de error antes de fallar
-            try:
-                error_elements = driver.find_elements(By.XPATH, "//*[contains(translate(text(), 'ERROR', 'error'), 'error')]")
-                if error_elements:
-                    error_text = error_elements[0].text.strip()
-                    return {'success': False, 'error': f'Error: {error_text}'}
-            except:
-                pass
+        # Paso 5: Esperar a que aparezca el botón Download o un banner de error
+        logger.debug("Esperando botón Download...")
+
+        def download_or_error(d):
+            error_text = _find_site_error(d)
+            if error_text:
+                return ('error', error_text)
+            for button in d.find_elements(By.CSS_SELECTOR, 'button[type="button"]'):
+                if 'download' in button.text.lower() and button.is_displayed():
+                    return ('download', button)
+            return False
+
+        try:
+            with timer.step('wait_conversion'):
+                kind, value = wait_until(download_or_error, DOWNLOAD_BUTTON_TIMEOUT)
+        except TimeoutException:
+            logger.error("Timeout esperando botón Download")
             return {'success': False, 'error': 'No apareció el botón Download'}
+
+        if kind == 'error':
+            logger.error(f"Mensaje de error detectado: {value}")
+            return {'success': False, 'error': f'Error del sitio: {value}'}
+        download_button = value
+        logger.debug("Botón Download encontrado!")
+
+        # Paso 6 (modo directo): capturar la URL del archivo, liberar el navegador y bajarlo por HTTP
+        if direct:
+            media = None
+            with timer.step('capture_media_url'):
+                try:
+                    # Chrome no descarga: solo nos interesa la respuesta con la URL final
+                    driver.execute_cdp_cmd("Browser.setDownloadBehavior", {"behavior": "deny"})
+                    driver.get_log('performance')  # Descartar eventos previos
+                    driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", download_button)
+                    driver.execute_script("arguments[0].click();", download_button)
+                    entries = []
+
+                    def media_captured(d):
+                        entries.extend(d.get_log('performance'))
+                        return _media_response(entries)
+
+                    media = wait_until(media_captured, MEDIA_URL_TIMEOUT)
+                    headers = {
+                        'User-Agent': driver.execute_script("return navigator.userAgent"),
+                        'Referer': driver.current_url,
+                    }
+                    # Con las cookies de la sesión el servidor ve el mismo cliente que hizo la conversión
+                    cookie = _media_cookies(driver, media['url'])
+                    if cookie:
+                        headers['Cookie'] = cookie
+                except TimeoutException:
+                    logger.warning("No se capturó la URL del archivo, se usa la descarga de Chrome")
+                    set_download_dir(driver, download_dir)
+
+            if media:
+                logger.debug(f"URL del archivo capturada ({media.get('mimeType')}), liberando navegador")
+                driver_pool.release(lease)
+                lease = driver = None
+
+                # Si el servidor ya informa el tamaño, se aborta antes de bajar nada
+                media_headers = {k.lower(): v for k, v in media.get('headers', {}).items()}
+                content_length = str(media_headers.get('content-length', ''))
+                if content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES:
+                    raise FileTooLarge(int(content_length))
+
+                if on_media:
+                    on_media(media['url'], headers)
+                try:
+                    with timer.step('download_file'):
+                        downloaded_file = stream_download(
+                            media['url'], download_dir, _fallback_name(video_url, format_type),
+                            headers=headers,
+                            proxies=_proxies(),
+                            cancel_event=cancel_event,
+                            on_progress=on_progress,
+                            cancelled_exc=JobCancelled,
+                            max_bytes=MAX_UPLOAD_BYTES,
+                        )
+                except requests.RequestException as e:
+                    # 403, URL vencida, conexión caída: se repite una vez con el gestor de descargas de Chrome
+                    logger.warning(f"Falló la descarga directa ({e}), se reintenta con Chrome")
+                    shutil.rmtree(download_dir, ignore_errors=True)
+                    return _download_with_selenium(
+                        video_url, format_type, download_dir, cancel_event, on_progress, None, timer, direct=False
+                    )
+                logger.debug(f"Descarga exitosa: {downloaded_file}")
+                return {'success': True, 'file_path': downloaded_file}
+
+        # Paso 6: Hacer clic en Download e iniciar descarga
+        logger.debug("Haciendo clic en Download...")
+        with timer.step('click_download'):
+            driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", download_button)
+            wait_until(EC.element_to_be_clickable(download_button), FORMAT_TIMEOUT)
+            driver.execute_script("arguments[0].click();", download_button)
         
-        # Paso 5: Hacer clic en Download e iniciar descarga
-        print("[DEBUG] Haciendo clic en Download...")
-        driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", download_button)
-        time.sleep(1)
-        driver.execute_script("arguments[0].click();", download_button)
-        
-        print("[DEBUG] Click ejecutado, esperando inicio de descarga...")
-        time.sleep(3)
-        
-        # Paso 6: Esperar a que termine la descarga
-        downloaded_file = wait_for_download_complete(download_dir, timeout=360)
+        # Paso 7: Esperar a que termine la descarga
+        with timer.step('download_file'):
+            downloaded_file = wait_for_download_complete(
+                download_dir, timeout=360, cancel_event=cancel_event, on_progress=on_progress,
+                max_bytes=MAX_UPLOAD_BYTES
+            )
         
         if not downloaded_file or not os.path.exists(downloaded_file):
             return {'success': False, 'error': 'La descarga no se completó'}
         
-        print(f"[DEBUG] Descarga exitosa: {downloaded_file}")
+        logger.debug(f"Descarga exitosa: {downloaded_file}")
         
         return {
             'success': True,
             'file_path': downloaded_file
         }
         
+    except JobCancelled:
+        logger.info("Descarga cancelada por el usuario")
+        return {'success': False, 'error': 'Descarga cancelada', 'cancelled': True}
+
+    except FileTooLarge as e:
+        logger.info(f"Descarga abortada: {e.size / (1024*1024):.1f} MB supera el límite de Telegram")
+        if lease:
+            # Chrome sigue bajando el archivo: se recicla el driver para cortarlo
+            lease.broken = True
+        return _too_large_result(e.size)
+
     except Exception as e:
-        print(f"[ERROR] Error en descarga: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"Error en descarga: {e}")
+        if lease:
+            lease.broken = True
         return {'success': False, 'error': f'Error inesperado: {str(e)}'}
     
     finally:
-        if driver:
-            try:
-                driver.quit()
-                print("[DEBUG] Driver cerrado")
-            except:
-                pass
+        # Devolver el driver al pool (se recicla si se rompió o llegó al máximo de usos)
+        driver_pool.release(lease)
+
+# Segundos mínimos entre ediciones del mensaje de progreso
+PROGRESS_EDIT_INTERVAL = 3
+
+def _resume_direct_download(job: DownloadJob, media_url: str, headers: dict):
+    """Sigue la descarga directa de un trabajo interrumpido desde lo que ya quedó en disco.
+
+    Devuelve None si la URL ya no sirve (expiró); en ese caso se descarta lo
+    bajado y hay que volver a pasar por y2mate.
+    """
+    logger.info(f"Retomando la descarga directa del trabajo {job.id}")
+    try:
+        path = stream_download(
+            media_url, job.download_dir, _fallback_name(job.url, job.format_type),
+            headers=headers,
+            proxies=_proxies(),
+            cancel_event=job.cancel_event,
+            on_progress=job.report_progress,
+            cancelled_exc=JobCancelled,
+            max_bytes=MAX_UPLOAD_BYTES,
+        )
+        return {'success': True, 'file_path': path}
+    except JobCancelled:
+        return {'success': False, 'error': 'Descarga cancelada', 'cancelled': True}
+    except FileTooLarge as e:
+        return _too_large_result(e.size)
+    except Exception as e:
+        logger.warning(f"No se pudo retomar la descarga {job.id}, se empieza de nuevo: {e}")
+        shutil.rmtree(job.download_dir, ignore_errors=True)
+        return None
+
+def _download_job(job: DownloadJob) -> dict:
+    """Corre en un thread del scheduler"""
+    result = None
+    record = job_store.get(job.id)
+    if record and record['params'].get('media_url'):
+        result = _resume_direct_download(job, record['params']['media_url'], record['params'].get('media_headers'))
 
-async def download_audio(query, context: ContextTypes.DEFAULT_TYPE, url: str):
+    def on_media(url, headers):
+        # Con la URL guardada, un reinicio no obliga a repetir la conversión en y2mate
+        job_store.update(job.id, stage='download_file', media_url=url, media_headers=headers)
+
+    if result is None:
+        result = download_with_selenium(
+            job.url, job.format_type, job.download_dir, job.cancel_event,
+            on_progress=job.report_progress, job_id=job.id, on_media=on_media
+        )
+    # Mover a la cache acá (fuera del event loop) para que todos los que esperan
+    # este resultado encuentren el archivo en una ruta estable
+    # Un archivo por encima del límite de Telegram no se cachea: fallaría en cada envío
+    video_id = extract_video_id(job.url)
+    if result['success'] and video_id and os.path.getsize(result['file_path']) <= MAX_UPLOAD_BYTES:
+        result['file_path'] = media_cache.put_file(video_id, job.format_type, result['file_path'])
+    return result
+
+async def run_download_job(query, job: DownloadJob, status_text: str) -> dict:
+    """Encola la descarga mostrando el progreso, la posición en cola y un botón para cancelar"""
+    cancel_markup = InlineKeyboardMarkup([
+        [InlineKeyboardButton("❌ Cancelar", callback_data=f'yt_cancel:{job.id}')]
+    ])
+    await query.edit_message_text(status_text, reply_markup=cancel_markup)
+
+    async def on_queue_update(posicion):
+        try:
+            if posicion:
+                await query.edit_message_text(f"⏳ En cola (posición {posicion})...\n\n{status_text}", reply_markup=cancel_markup)
+            else:
+                await query.edit_message_text(status_text, reply_markup=cancel_markup)
+        except Exception:
+            pass
+
+    loop = asyncio.get_running_loop()
+    ultimo_aviso = 0
+
+    async def show_progress(bytes_descargados):
+        try:
+            await query.edit_message_text(
+                f"{status_text}\n\n⬇️ Descargado: {bytes_descargados / (1024*1024):.1f} MB",
+                reply_markup=cancel_markup
+            )
+        except Exception:
+            pass
+
+    def on_progress(bytes_descargados):
+        # Se llama desde el thread de la descarga: limitamos las ediciones para no chocar con Telegram
+        nonlocal ultimo_aviso
+        ahora = time.monotonic()
+        if bytes_descargados and ahora - ultimo_aviso >= PROGRESS_EDIT_INTERVAL:
+            ultimo_aviso = ahora
+            asyncio.run_coroutine_threadsafe(show_progress(bytes_descargados), loop)
+
+    job.on_queue_update = on_queue_update
+    job.on_progress = on_progress
+    try:
+        # Pedidos del mismo video y formato en curso se resuelven con una sola descarga
+        video_id = extract_video_id(job.url)
+        key = (video_id, job.format_type) if video_id else None
+        return await scheduler.submit(job, _download_job, key=key)
+    except JobCancelled:
+        return {'success': False, 'error': 'Descarga cancelada', 'cancelled': True}
+    except QueueFull:
+        return {'success': False, 'error': 'Hay demasiadas descargas en cola. Probá de nuevo en unos minutos.'}
+
+async def _send_media(context: ContextTypes.DEFAULT_TYPE, chat_id, format_type: str, media):
+    """Envía el audio o video (archivo abierto o file_id) y devuelve el file_id asignado por Telegram"""
+    if format_type == 'mp3':
+        message = await context.bot.send_audio(
+            chat_id=chat_id,
+            audio=media,
+            read_timeout=60,
+            write_timeout=60,
+            connect_timeout=60
+        )
+        return message.audio.file_id if message.audio else None
+
+    message = await context.bot.send_video(
+        chat_id=chat_id,
+        video=media,
+        supports_streaming=True,
+        read_timeout=120,
+        write_timeout=120,
+        connect_timeout=60
+    )
+    # Telegram puede guardarlo como documento si no lo reconoce como video
+    adjunto = message.video or message.document
+    return adjunto.file_id if adjunto else None
+
+async def _send_from_cache(context: ContextTypes.DEFAULT_TYPE, chat_id, url: str, format_type: str, edit_status) -> bool:
+    """Responde desde la cache (file_id o archivo en disco). Devuelve True si pudo
+
+    edit_status(texto) es la corrutina que muestra el estado al usuario.
+    """
+    video_id = extract_video_id(url)
+    if not video_id:
+        return False
+    cached = await asyncio.to_thread(media_cache.get, video_id, format_type)
+    if not cached:
+        return False
+
+    label = "Audio" if format_type == 'mp3' else "Video"
+    if cached['file_id']:
+        try:
+            await _send_media(context, chat_id, format_type, cached['file_id'])
+            await edit_status(f"✅ {label} enviado correctamente!")
+            return True
+        except Exception as e:
+            logger.warning(f"file_id en cache rechazado, se vuelve a subir: {e}")
+            await asyncio.to_thread(media_cache.forget_file_id, video_id, format_type)
+
+    if cached['path']:
+        await edit_status(f"📤 Enviando {label.lower()}...")
+        with open(cached['path'], 'rb') as media:
+            file_id = await _send_media(context, chat_id, format_type, media)
+        if file_id:
+            await asyncio.to_thread(media_cache.set_file_id, video_id, format_type, file_id)
+        await edit_status(f"✅ {label} enviado correctamente!")
+        return True
+    return False
+
+async def download_audio(query, context: ContextTypes.DEFAULT_TYPE, url: str, job_id=None):
     """Descarga solo el audio del video de YouTube"""
+    job = DownloadJob(url, 'mp3', user_id=query.from_user.id,
+                      chat_id=query.message.chat_id, message_id=query.message.message_id, job_id=job_id)
+    # Queda registrado hasta terminar: si el proceso se reinicia, se retoma al arrancar
+    await asyncio.to_thread(
+        job_store.start, job.id, 'download', chat_id=job.chat_id, message_id=job.message_id,
+        user_id=job.user_id, params={'url': url, 'format': 'mp3'}
+    )
+    estado, error = FAILED, None
+    interrumpido = False
     try:
-        os.makedirs('downloads', exist_ok=True)
-        
-        # Descargar con Selenium
-        result = download_with_selenium(url, 'mp3')
+        # Si ya lo enviamos antes, se reenvía sin descargar ni subir
+        if await _send_from_cache(context, query.message.chat_id, url, 'mp3', query.edit_message_text):
+            estado = DONE
+            return
+
+        # Descargar con Selenium en el scheduler (fuera del event loop)
+        result = await run_download_job(
+            query, job, "🎵 Procesando audio... Por favor esperá (puede tardar 30-60 seg)."
+        )
         
+        if not result['success']:
+            error = result.get('error')
+
+        if result.get('cancelled'):
+            return
+
+        if result.get('too_large'):
+            await query.edit_message_text(
+                f"⚠️ El audio es demasiado grande ({result['size'] / (1024*1024):.1f} MB o más).\n"
+                f"Telegram tiene un límite de 50 MB para bots."
+            )
+            return
+
         if not result['success']:
             # Mostrar error con opciones de reintento
             keyboard = [
@@ -377,47 +810,84 @@ async def download_audio(query, context: ContextTypes.DEFAULT_TYPE, url: str):
         
         # Verificar archivo
         if not os.path.exists(audio_file) or os.path.getsize(audio_file) == 0:
+            error = "El archivo descargado está vacío"
             await query.edit_message_text("❌ El archivo descargado está vacío")
             return
         
-        # Enviar el archivo
+        # Enviar el archivo (ya guardado en la cache por _download_job)
+        video_id = extract_video_id(url)
+
         await query.edit_message_text("📤 Enviando audio...")
         
         with open(audio_file, 'rb') as audio:
-            await context.bot.send_audio(
-                chat_id=query.message.chat_id,
-                audio=audio,
-                read_timeout=60,
-                write_timeout=60,
-                connect_timeout=60
-            )
+            file_id = await _send_media(context, query.message.chat_id, 'mp3', audio)
+        if video_id and file_id:
+            await asyncio.to_thread(media_cache.set_file_id, video_id, 'mp3', file_id)
+        estado = DONE
         
         try:
             await query.edit_message_text("✅ Audio enviado correctamente!")
         except:
             pass
-        
-        # Limpiar archivo
-        if os.path.exists(audio_file):
-            os.remove(audio_file)
-            
+
+    except asyncio.CancelledError:
+        # Apagado a mitad del trabajo: queda pendiente, con lo ya bajado, para retomarlo
+        interrumpido = True
+        raise
+
     except Exception as e:
-        print(f"[ERROR] Error en download_audio: {e}")
-        import traceback
-        traceback.print_exc()
+        error = str(e)
+        logger.exception(f"Error en download_audio: {e}")
         try:
             await query.edit_message_text("❌ Error al procesar el audio.")
         except:
             pass
 
-async def download_video(query, context: ContextTypes.DEFAULT_TYPE, url: str):
+    finally:
+        if not interrumpido:
+            await asyncio.to_thread(job_store.finish, job.id, estado, error)
+            # Borrar la carpeta del trabajo con lo descargado
+            job.cleanup()
+
+async def download_video(query, context: ContextTypes.DEFAULT_TYPE, url: str, job_id=None):
     """Descarga el video con audio de YouTube"""
+    job = DownloadJob(url, 'mp4', user_id=query.from_user.id,
+                      chat_id=query.message.chat_id, message_id=query.message.message_id, job_id=job_id)
+    # Queda registrado hasta terminar: si el proceso se reinicia, se retoma al arrancar
+    await asyncio.to_thread(
+        job_store.start, job.id, 'download', chat_id=job.chat_id, message_id=job.message_id,
+        user_id=job.user_id, params={'url': url, 'format': 'mp4'}
+    )
+    estado, error = FAILED, None
+    interrumpido = False
     try:
-        os.makedirs('downloads', exist_ok=True)
-        
-        # Descargar con Selenium
-        result = download_with_selenium(url, 'mp4')
+        # Si ya lo enviamos antes, se reenvía sin descargar ni subir
+        if await _send_from_cache(context, query.message.chat_id, url, 'mp4', query.edit_message_text):
+            estado = DONE
+            return
+
+        # Descargar con Selenium en el scheduler (fuera del event loop)
+        result = await run_download_job(
+            query, job, "🎬 Procesando video... Por favor esperá (puede tardar 30-60 seg)."
+        )
         
+        if not result['success']:
+            error = result.get('error')
+
+        if result.get('cancelled'):
+            return
+
+        if result.get('too_large'):
+            # Se supo antes de bajarlo entero: ofrecer el audio directamente
+            keyboard = [[InlineKeyboardButton("🎵 Descargar solo audio", callback_data='yt_audio')]]
+            await query.edit_message_text(
+                f"⚠️ El video es demasiado grande ({result['size'] / (1024*1024):.1f} MB o más).\n"
+                f"Telegram tiene un límite de 50 MB para bots.\n"
+                f"¿Querés descargar solo el audio?",
+                reply_markup=InlineKeyboardMarkup(keyboard)
+            )
+            return
+
         if not result['success']:
             # Mostrar error con opciones de reintento
             keyboard = [
@@ -438,50 +908,294 @@ async def download_video(query, context: ContextTypes.DEFAULT_TYPE, url: str):
         
         # Verificar archivo
         if not os.path.exists(video_file) or os.path.getsize(video_file) == 0:
+            error = "El archivo descargado está vacío"
             await query.edit_message_text("❌ El archivo descargado está vacío")
             return
         
         # Verificar tamaño
         file_size = os.path.getsize(video_file)
-        max_size = 50 * 1024 * 1024  # 50 MB límite Telegram
+        max_size = MAX_UPLOAD_BYTES
         
         if file_size > max_size:
+            error = f"El video pesa {file_size} bytes"
             await query.edit_message_text(
                 f"⚠️ El video es demasiado grande ({file_size / (1024*1024):.1f} MB).\n"
                 f"Telegram tiene un límite de 50 MB para bots.\n"
                 f"Probá descargando solo el audio."
             )
-            if os.path.exists(video_file):
-                os.remove(video_file)
             return
         
-        # Enviar el archivo
+        # Enviar el archivo (ya guardado en la cache por _download_job)
+        video_id = extract_video_id(url)
+
         await query.edit_message_text("📤 Enviando video...")
         
         with open(video_file, 'rb') as video:
-            await context.bot.send_video(
-                chat_id=query.message.chat_id,
-                video=video,
-                supports_streaming=True,
-                read_timeout=120,
-                write_timeout=120,
-                connect_timeout=60
-            )
+            file_id = await _send_media(context, query.message.chat_id, 'mp4', video)
+        if video_id and file_id:
+            await asyncio.to_thread(media_cache.set_file_id, video_id, 'mp4', file_id)
+        estado = DONE
         
         try:
             await query.edit_message_text("✅ Video enviado correctamente!")
         except:
             pass
-        
-        # Limpiar archivo
-        if os.path.exists(video_file):
-            os.remove(video_file)
-            
+
+    except asyncio.CancelledError:
+        # Apagado a mitad del trabajo: queda pendiente, con lo ya bajado, para retomarlo
+        interrumpido = True
+        raise
+
     except Exception as e:
-        print(f"[ERROR] Error en download_video: {e}")
-        import traceback
-        traceback.print_exc()
+        error = str(e)
+        logger.exception(f"Error en download_video: {e}")
         try:
             await query.edit_message_text("❌ Error al procesar el video.")
         except:
             pass
+
+    finally:
+        if not interrumpido:
+            await asyncio.to_thread(job_store.finish, job.id, estado, error)
+            # Borrar la carpeta del trabajo con lo descargado
+            job.cleanup()
+
+# Icono de cada estado de un video dentro de un lote
+BATCH_ICONS = {
+    'queued': '⏳', 'running': '⬇️', 'sent': '✅', 'too_large': '⚠️', 'error': '❌', 'cancelled': '🚫',
+}
+
+# Lotes en curso por id (para el botón Cancelar)
+_batches = {}
+
+async def _quiet(texto):
+    """edit_status que no muestra nada: en un lote el avance va en el mensaje agregado"""
+
+class BatchProgress:
+    """Avance agregado de un lote de descargas, mostrado en un único mensaje"""
+
+    def __init__(self, query, format_type, urls):
+        self.id = uuid.uuid4().hex[:12]
+        self.query = query
+        self.user_id = query.from_user.id
+        self.label = 'audios' if format_type == 'mp3' else 'videos'
+        self.video_ids = [extract_video_id(url) for url in urls]
+        self.states = ['queued'] * len(urls)
+        self.bytes = [0] * len(urls)
+        # Índice -> DownloadJob descargando (para cancelar)
+        self.jobs = {}
+        self.cancelled = False
+        self.cancel_markup = InlineKeyboardMarkup([
+            [InlineKeyboardButton("❌ Cancelar todo", callback_data=f'yt_cancel:{self.id}')]
+        ])
+        self._loop = asyncio.get_running_loop()
+        self._ultima_edicion = 0
+        self._ultimo_texto = None
+        # Ediciones de avance en vuelo: se descartan antes de mostrar el resultado final
+        self._refreshes = set()
+        self._closed = False
+
+    def _schedule_refresh(self):
+        if self._closed:
+            return
+        task = asyncio.ensure_future(self.refresh())
+        self._refreshes.add(task)
+        task.add_done_callback(self._refreshes.discard)
+
+    def set(self, i, state):
+        self.states[i] = state
+        self._schedule_refresh()
+
+    def on_bytes(self, i, bytes_descargados):
+        # Se llama desde el thread de la descarga
+        self.bytes[i] = bytes_descargados
+        if time.monotonic() - self._ultima_edicion >= PROGRESS_EDIT_INTERVAL:
+            self._loop.call_soon_threadsafe(self._schedule_refresh)
+
+    def cancel(self):
+        self.cancelled = True
+        for job in list(self.jobs.values()):
+            scheduler.cancel(job.id)
+
+    def text(self, final=False):
+        total = len(self.states)
+        enviados = self.states.count('sent')
+        fallidos = self.states.count('error') + self.states.count('too_large')
+        if final:
+            encabezado = "🚫 Lote cancelado" if self.cancelled else "✅ Lote terminado"
+            encabezado += f": {enviados}/{total} {self.label} enviados"
+            if fallidos:
+                encabezado += f", {fallidos} con error"
+        else:
+            encabezado = (
+                f"📦 Descargando {total} {self.label}: {enviados}/{total} listos, "
+                f"{self.states.count('running')} en curso"
+            )
+            megas = sum(self.bytes) / (1024 * 1024)
+            if megas:
+                encabezado += f"\n⬇️ Descargado: {megas:.1f} MB"
+        lineas = [encabezado, ""]
+        for n, (video_id, state) in enumerate(zip(self.video_ids, self.states), start=1):
+            lineas.append(f"{n}. {BATCH_ICONS[state]} {video_id}")
+        return "\n".join(lineas)
+
+    async def finish(self):
+        """Muestra el resultado final sin que una edición de avance atrasada lo pise"""
+        self._closed = True
+        for task in list(self._refreshes):
+            task.cancel()
+        await asyncio.gather(*self._refreshes, return_exceptions=True)
+        await self.refresh(final=True)
+
+    async def refresh(self, final=False):
+        """Edita el mensaje del lote (como mucho cada PROGRESS_EDIT_INTERVAL, salvo el final)"""
+        if self._closed and not final:
+            return
+        ahora = time.monotonic()
+        if not final and ahora - self._ultima_edicion < PROGRESS_EDIT_INTERVAL:
+            return
+        texto = self.text(final)
+        if texto == self._ultimo_texto:
+            return
+        self._ultima_edicion = ahora
+        self._ultimo_texto = texto
+        try:
+            await self.query.edit_message_text(texto, reply_markup=None if final else self.cancel_markup)
+        except Exception:
+            pass
+
+async def _batch_item(batch: BatchProgress, context: ContextTypes.DEFAULT_TYPE, i: int, url: str, format_type: str) -> str:
+    """Descarga y envía un video del lote; devuelve su estado final"""
+    query = batch.query
+    chat_id = query.message.chat_id
+    if await _send_from_cache(context, chat_id, url, format_type, _quiet):
+        return 'sent'
+
+    # Cada elemento pide su lugar en el carril de descargas: el lote no pasa de DOWNLOAD_LANE_SLOTS
+    async with admission.slot(DOWNLOAD):
+        if batch.cancelled:
+            return 'cancelled'
+        job = DownloadJob(url, format_type, user_id=batch.user_id,
+                          chat_id=chat_id, message_id=query.message.message_id)
+        await asyncio.to_thread(
+            job_store.start, job.id, 'download', chat_id=job.chat_id, message_id=job.message_id,
+            user_id=job.user_id, params={'url': url, 'format': format_type, 'batch': True}
+        )
+        state, error = 'error', None
+        interrumpido = False
+        try:
+            state, error = await _batch_download(batch, context, i, job, format_type)
+            return state
+        except asyncio.CancelledError:
+            interrumpido = True
+            raise
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            if not interrumpido:
+                await asyncio.to_thread(job_store.finish, job.id, DONE if state == 'sent' else FAILED, error)
+                job.cleanup()
+
+async def _batch_download(batch: BatchProgress, context: ContextTypes.DEFAULT_TYPE, i: int, job: DownloadJob, format_type: str):
+    """Baja y envía un video del lote; devuelve (estado, error)"""
+    video_id = extract_video_id(job.url)
+    batch.jobs[i] = job
+    batch.set(i, 'running')
+    job.on_progress = lambda bytes_descargados: batch.on_bytes(i, bytes_descargados)
+    try:
+        result = await scheduler.submit(job, _download_job, key=(video_id, format_type))
+    except JobCancelled:
+        return 'cancelled', 'Descarga cancelada'
+    except QueueFull:
+        return 'error', 'Hay demasiadas descargas en cola'
+    finally:
+        batch.jobs.pop(i, None)
+
+    if result.get('cancelled'):
+        return 'cancelled', result.get('error')
+    if result.get('too_large'):
+        return 'too_large', result.get('error')
+    if not result['success'] or not os.path.getsize(result['file_path']):
+        logger.warning(f"Falló la descarga de {video_id} en el lote: {result.get('error')}")
+        return 'error', result.get('error') or 'El archivo descargado está vacío'
+    file_size = os.path.getsize(result['file_path'])
+    if file_size > MAX_UPLOAD_BYTES:
+        return 'too_large', f"El archivo pesa {file_size / (1024*1024):.1f} MB"
+
+    with open(result['file_path'], 'rb') as media:
+        file_id = await _send_media(context, job.chat_id, format_type, media)
+    if file_id:
+        await asyncio.to_thread(media_cache.set_file_id, video_id, format_type, file_id)
+    return 'sent', None
+
+async def download_batch(query, context: ContextTypes.DEFAULT_TYPE, urls: list, format_type: str):
+    """Descarga varios videos en paralelo (dentro del límite de workers) con un solo mensaje de avance"""
+    # Todo el lote cuenta como un solo pedido para el límite por usuario
+    admission.check_rate(DOWNLOAD, query.from_user.id)
+    batch = BatchProgress(query, format_type, urls)
+    _batches[batch.id] = batch
+
+    async def item(i, url):
+        try:
+            state = await _batch_item(batch, context, i, url, format_type)
+        except AdmissionRejected as e:
+            logger.info(f"Video del lote rechazado: {e}")
+            state = 'error'
+        except Exception as e:
+            logger.error(f"Error en un video del lote: {e}")
+            state = 'error'
+        batch.set(i, state)
+
+    try:
+        await batch.refresh(final=False)
+        await asyncio.gather(*(item(i, url) for i, url in enumerate(urls)))
+    finally:
+        _batches.pop(batch.id, None)
+    await batch.finish()
+
+class _StatusMessage:
+    """Hace las veces de CallbackQuery para un trabajo retomado: edita su mensaje de estado"""
+
+    def __init__(self, bot, chat_id, message_id, user_id):
+        self._bot = bot
+        self.message = SimpleNamespace(chat_id=chat_id, message_id=message_id)
+        self.from_user = SimpleNamespace(id=user_id)
+
+    async def edit_message_text(self, text, reply_markup=None):
+        return await self._bot.edit_message_text(
+            text, chat_id=self.message.chat_id, message_id=self.message.message_id, reply_markup=reply_markup
+        )
+
+async def resume_download(bot, record):
+    """Retoma una descarga que quedó a medias por un reinicio, en su mensaje de estado original"""
+    params = record['params']
+    chat_id, message_id = record['chat_id'], record['message_id']
+    context = SimpleNamespace(bot=bot, user_data={}, chat_data={})
+    download = download_audio if params['format'] == 'mp3' else download_video
+    texto = "♻️ Retomando la descarga después de un reinicio..."
+    try:
+        if params.get('batch'):
+            # El mensaje del lote ya no se actualiza: cada video retomado usa un mensaje propio
+            await bot.edit_message_text(
+                "♻️ El lote se interrumpió por un reinicio; los videos pendientes se envían por separado.",
+                chat_id=chat_id, message_id=message_id
+            )
+    except Exception:
+        pass  # Varios videos del lote editan el mismo mensaje
+    try:
+        if params.get('batch'):
+            message_id = (await bot.send_message(chat_id, texto, reply_to_message_id=message_id)).message_id
+        else:
+            await bot.edit_message_text(texto, chat_id=chat_id, message_id=message_id)
+    except Exception:
+        pass  # El mensaje pudo haberse borrado: la descarga se envía igual
+    query = _StatusMessage(bot, chat_id, message_id, record['user_id'])
+    try:
+        # Sin límite por usuario: el pedido ya se había admitido antes del reinicio
+        async with admission.slot(DOWNLOAD):
+            await download(query, context, params['url'], job_id=record['id'])
+    except AdmissionRejected as e:
+        await asyncio.to_thread(job_store.finish, record['id'], FAILED, str(e))
+        shutil.rmtree(os.path.join(DOWNLOADS_DIR, record['id']), ignore_errors=True)
+        await query.edit_message_text(f"⏳ {e}")
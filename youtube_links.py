@@ -0,0 +1,72 @@
+"""Detección de links de YouTube y el menú de formato.
+
+Separado de youtube_handler para que reconocer un link no cargue Selenium:
+el scraping se importa recién cuando el usuario elige audio o video.
+
+Un mensaje puede traer varios links: se extraen todos los IDs de video
+(canónicos, sin repetir) y quedan asociados al mensaje del menú, así cada
+menú recuerda sus propios videos aunque el usuario mande otro link antes de
+elegir.
+"""
+import os
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes
+from media_cache import VIDEO_ID_RE
+
+# Links que se procesan como máximo por mensaje
+YT_BATCH_MAX_LINKS = int(os.getenv("YT_BATCH_MAX_LINKS") or 10)
+# Menús sin responder que se recuerdan por chat (los más viejos se olvidan)
+PENDING_PER_CHAT = 50
+
+def extract_video_ids(text: str) -> list:
+    """IDs de video de todos los links de YouTube del texto, en orden y sin repetir"""
+    return list(dict.fromkeys(match.group(1) for match in VIDEO_ID_RE.finditer(text or "")))
+
+def is_youtube_url(text: str) -> bool:
+    """Verifica si el mensaje tiene algún link de YouTube"""
+    return VIDEO_ID_RE.search(text or "") is not None
+
+def video_url(video_id: str) -> str:
+    """URL canónica del video"""
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+def remember_links(context: ContextTypes.DEFAULT_TYPE, message_id: int, video_ids: list):
+    """Asocia los videos al mensaje del menú"""
+    pendientes = context.chat_data.setdefault('youtube_links', {})
+    pendientes[message_id] = video_ids
+    while len(pendientes) > PENDING_PER_CHAT:
+        del pendientes[next(iter(pendientes))]
+
+def pending_links(context: ContextTypes.DEFAULT_TYPE, message) -> list:
+    """Videos del menú; si se perdieron (p. ej. tras un reinicio) se leen del mensaje original"""
+    video_ids = context.chat_data.get('youtube_links', {}).get(message.message_id)
+    if video_ids:
+        return video_ids
+    original = getattr(message, 'reply_to_message', None)
+    return extract_video_ids(original.text)[:YT_BATCH_MAX_LINKS] if original and original.text else []
+
+async def handle_youtube_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Maneja los links de YouTube mostrando botones interactivos"""
+    video_ids = extract_video_ids(update.message.text)
+    sobrantes = len(video_ids) - YT_BATCH_MAX_LINKS
+    video_ids = video_ids[:YT_BATCH_MAX_LINKS]
+
+    # Crear botones interactivos
+    keyboard = [
+        [
+            InlineKeyboardButton("🎵 Solo Audio (MP3)", callback_data='yt_audio'),
+            InlineKeyboardButton("🎬 Video (MP4)", callback_data='yt_video')
+        ]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+
+    if len(video_ids) == 1:
+        texto = "🎯 Detecté un link de YouTube!\n\n¿Qué querés descargar?"
+    else:
+        texto = f"🎯 Detecté {len(video_ids)} links de YouTube!\n\n¿Qué querés descargar de todos?"
+    if sobrantes > 0:
+        texto += f"\n\n(Se procesan los primeros {YT_BATCH_MAX_LINKS}; los otros {sobrantes} mandalos aparte.)"
+
+    # Respondiendo al mensaje original: si se pierde el estado, los links se recuperan de ahí
+    menu = await update.message.reply_text(texto, reply_markup=reply_markup, do_quote=True)
+    remember_links(context, menu.message_id, video_ids)
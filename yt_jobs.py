@@ -0,0 +1,253 @@
+"""Scheduler de descargas de YouTube.
+
+Las descargas con Selenium son bloqueantes: acá corren en un pool acotado de
+threads fuera del event loop, cada una en su propia carpeta de descargas, con
+una cola que informa la posición al usuario y cancelación por trabajo.
+
+Pedidos idénticos en curso (mismo video y formato) se deduplican: el primero
+hace la descarga y los siguientes se suman a ese trabajo y reciben el mismo
+resultado, cada uno con los avisos de estado en su propio mensaje.
+"""
+import asyncio
+import logging
+import os
+import shutil
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from driver_pool import YT_DRIVER_POOL_SIZE
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Descargas simultáneas (por defecto, una por driver del pool)
+YT_MAX_WORKERS = int(os.getenv("YT_MAX_WORKERS") or YT_DRIVER_POOL_SIZE or 2)
+# Máximo de descargas esperando turno; por encima se rechazan
+YT_MAX_QUEUE = int(os.getenv("YT_MAX_QUEUE") or 20)
+# Carpeta base: cada trabajo descarga en DOWNLOADS_DIR/<job_id>
+DOWNLOADS_DIR = os.path.abspath("downloads")
+
+class JobCancelled(Exception):
+    """El usuario canceló la descarga"""
+
+class QueueFull(Exception):
+    """La cola de descargas está llena"""
+
+class DownloadJob:
+    def __init__(self, url, format_type, user_id=None, chat_id=None, message_id=None, job_id=None):
+        # Un trabajo retomado tras un reinicio conserva su id (y su carpeta con lo ya bajado)
+        self.id = job_id or uuid.uuid4().hex[:12]
+        self.url = url
+        self.format_type = format_type
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.download_dir = os.path.join(DOWNLOADS_DIR, self.id)
+        # Aborta la descarga real (solo se activa si nadie más espera el resultado)
+        self.cancel_event = threading.Event()
+        self.started = False
+        self.queued = False  # Se le avisó al usuario que está en cola
+        self.future = None
+        # Corrutina opcional on_queue_update(posicion) para avisar la posición en cola
+        self.on_queue_update = None
+        # Callback opcional on_progress(bytes), llamado desde el thread de la descarga
+        self.on_progress = None
+        self.progress_bytes = 0
+        # Deduplicación: el trabajo que descarga (leader) y los que esperan su resultado
+        self.leader = None
+        self.followers = []
+        self._refs = 1
+        self._abandoned = None
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    @property
+    def abandoned(self):
+        """El usuario de este trabajo canceló (aunque la descarga siga para otros)"""
+        return self._abandoned is not None and self._abandoned.is_set()
+
+    def subscribers(self):
+        """Este trabajo y los que se sumaron a él, sin los cancelados"""
+        return [job for job in [self] + list(self.followers) if not job.abandoned]
+
+    def check_cancelled(self):
+        """Lanza JobCancelled si el trabajo fue cancelado (llamar entre pasos)"""
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def report_progress(self, bytes_descargados):
+        self.progress_bytes = bytes_descargados
+        for job in self.subscribers():
+            if job.on_progress:
+                job.on_progress(bytes_descargados)
+
+    def cleanup(self):
+        """Libera la carpeta de descargas (se borra cuando nadie más la usa)"""
+        if self.leader is not None:
+            self.leader.cleanup()
+            return
+        self._refs -= 1
+        if self._refs <= 0:
+            shutil.rmtree(self.download_dir, ignore_errors=True)
+
+class DownloadScheduler:
+    def __init__(self, max_workers=YT_MAX_WORKERS, max_queue=YT_MAX_QUEUE):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="yt-job")
+        self._waiting = []
+        self._jobs = {}
+        self._inflight = {}
+        self._running = 0
+        self._loop = None
+
+    @property
+    def queue_depth(self):
+        """Trabajos esperando turno"""
+        return len(self._waiting)
+
+    @property
+    def running(self):
+        return self._running
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def position(self, job):
+        """Posición en la cola (1 = próximo); 0 si ya está corriendo o no está en cola"""
+        job = job.leader or job
+        try:
+            return self._waiting.index(job) + 1
+        except ValueError:
+            return 0
+
+    def _run(self, job, fn):
+        self._loop.call_soon_threadsafe(self._job_started, job)
+        try:
+            job.check_cancelled()
+            return fn(job)
+        finally:
+            self._loop.call_soon_threadsafe(self._job_finished)
+
+    def _job_started(self, job):
+        job.started = True
+        self._running += 1
+        if job in self._waiting:
+            self._waiting.remove(job)
+        for sub in job.subscribers():
+            if sub.queued and sub.on_queue_update:
+                asyncio.ensure_future(sub.on_queue_update(0))
+        self._notify_positions()
+
+    def _job_finished(self):
+        self._running -= 1
+
+    def _notify_positions(self):
+        for posicion, job in enumerate(self._waiting, start=1):
+            for sub in job.subscribers():
+                if sub.on_queue_update:
+                    sub.queued = True
+                    asyncio.ensure_future(sub.on_queue_update(posicion))
+
+    async def _execute(self, job, fn):
+        if self._running >= self.max_workers and len(self._waiting) >= self.max_queue:
+            raise QueueFull("Hay demasiadas descargas en cola")
+
+        self._waiting.append(job)
+        try:
+            job.future = self._executor.submit(self._run, job, fn)
+            try:
+                return await asyncio.wrap_future(job.future)
+            except asyncio.CancelledError:
+                # Cancelado antes de arrancar (ver cancel)
+                if job.future.cancelled():
+                    raise JobCancelled()
+                raise
+        finally:
+            if job in self._waiting:
+                self._waiting.remove(job)
+                self._notify_positions()
+
+    async def submit(self, job, fn, key=None):
+        """Encola fn(job) y espera su resultado sin bloquear el event loop.
+
+        Si key está dado y ya hay un trabajo en curso con la misma key, job se
+        suma a ese trabajo en lugar de repetir la descarga.
+        """
+        self._loop = asyncio.get_running_loop()
+        job._abandoned = asyncio.Event()
+
+        inflight = self._inflight.get(key) if key is not None else None
+        if inflight is not None:
+            leader, flight = inflight
+            job.leader = leader
+            leader.followers.append(job)
+            leader._refs += 1
+            logger.debug(f"Trabajo {job.id} se suma a la descarga en curso {leader.id}")
+        else:
+            leader = job
+            flight = asyncio.ensure_future(self._execute(job, fn))
+            # Marcar la excepción como leída aunque todos los interesados hayan cancelado
+            flight.add_done_callback(lambda f: f.cancelled() or f.exception())
+            if key is not None:
+                self._inflight[key] = (job, flight)
+                flight.add_done_callback(lambda f: self._forget(key, flight))
+
+        self._jobs[job.id] = job
+        abandoned = asyncio.ensure_future(job._abandoned.wait())
+        try:
+            if leader is not job and job.on_queue_update and self.position(job):
+                job.queued = True
+                await job.on_queue_update(self.position(job))
+            elif leader is job and self._running + len(self._waiting) > self.max_workers and job.on_queue_update:
+                job.queued = True
+                await job.on_queue_update(self.position(job))
+
+            await asyncio.wait({flight, abandoned}, return_when=asyncio.FIRST_COMPLETED)
+            if job.abandoned:
+                raise JobCancelled()
+            return flight.result()
+        finally:
+            abandoned.cancel()
+            self._jobs.pop(job.id, None)
+            if leader is not job and job in leader.followers:
+                leader.followers.remove(job)
+
+    def _forget(self, key, flight):
+        if self._inflight.get(key, (None, None))[1] is flight:
+            del self._inflight[key]
+
+    def cancel(self, job_id):
+        """Cancela un trabajo en cola o en curso. Devuelve False si no existe.
+
+        La descarga solo se aborta si ningún otro trabajo está esperando su resultado.
+        """
+        job = self._jobs.get(job_id)
+        if not job:
+            return False
+        job._abandoned.set()
+        leader = job.leader or job
+        if not leader.subscribers():
+            leader.cancel_event.set()
+            # Pedidos nuevos del mismo video no deben sumarse a una descarga abortada
+            for key, (inflight_leader, _) in list(self._inflight.items()):
+                if inflight_leader is leader:
+                    del self._inflight[key]
+            # Si todavía no arrancó, se saca directamente de la cola
+            if leader.future and leader.future.cancel():
+                if leader in self._waiting:
+                    self._waiting.remove(leader)
+                    self._notify_positions()
+        return True
+
+    def shutdown(self, wait=True):
+        for job in list(self._jobs.values()):
+            if not job.started:
+                job.cancel_event.set()
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+scheduler = DownloadScheduler()
+metrics.gauge("presugen_download_queue_depth", "Descargas esperando turno", lambda: scheduler.queue_depth)
+metrics.gauge("presugen_downloads_running", "Descargas en curso", lambda: scheduler.running)